@@ -1,5 +1,10 @@
 import requests
-import json
+import os
+from ABNtoDB import payload_to_records, transaction_records
+from RowPipeline import checkpoint_record
+from JsonStream import write_ndjson
+from HttpClient import get_session, add_query
+from FetchScheduler import stream_concurrently, TOKEN_WORKERS
 
 # --- Configuration ---
 # A list to hold multiple access tokens.
@@ -14,112 +19,143 @@ API_KEY = "YOUR_API_KEY"
 API_BASE_URL = "https://api-sandbox.abnamro.com"
 
 # Paths to your ABN AMRO-provided certificates
-ABN_CERT_FILE = '../PSD2TPPCertificate.crt'
-ABN_KEY_FILE = '../PSD2TPPprivateKey.key'
+# Kept in the Banking folder; resolved from this file, so any working directory will do
+ABN_DIR = os.path.dirname(os.path.abspath(__file__))
+ABN_CERT_FILE = os.path.join(ABN_DIR, '..', 'PSD2TPPCertificate.crt')
+ABN_KEY_FILE = os.path.join(ABN_DIR, '..', 'PSD2TPPprivateKey.key')
 
-# Output file for the collected data
-JSON_OUTPUT_FILE = 'abn_amro_data_output.json'
+# Output file for the collected data: newline-delimited JSON, appended per token as soon as it is fetched
+JSON_OUTPUT_FILE = 'abn_amro_data_output.ndjson'
 
 
-def fetch_data_for_token(access_token):
-    """
-    Uses a single access token to fetch account balance and transaction data,
-    then returns it as a dictionary.
-    """
-    headers = {
+def abn_session():
+    """The shared keep-alive session for all ABN AMRO calls, presenting the TLS client certificate."""
+    return get_session('ABN_AMRO', ABN_CERT_FILE, ABN_KEY_FILE)
+
+
+def request_headers(access_token):
+    """Headers for every ABN AMRO API call made with a customer access token."""
+    return {
         'API-Key': API_KEY,
         'Authorization': f'Bearer {access_token}'
     }
 
+
+def combine_account_data(balance_data, transaction_data):
+    """Merges the balance response and the transactions response into one object per account."""
+    combined_data = {
+        "account": balance_data,  # This now contains the balance info
+        "transactions": transaction_data.get("transactions", [])
+    }
+    # Add other top-level keys from the transaction response. accountNumber is already in the balance data,
+    # and nextPageKey only points to the next page, which is fetched as well
+    for key, value in transaction_data.items():
+        if key not in ["transactions", "accountNumber", "nextPageKey"]:
+            combined_data[key] = value
+    return combined_data
+
+
+def transactions_path(iban, date_from=None, page_key=None):
+    """
+    The transactions endpoint of an account: bookings from `date_from` (YYYY-MM-DD) on when given,
+    and the page after the one that returned `page_key` as its nextPageKey.
+    """
+    return add_query(f"/v1/accounts/{iban}/transactions", {'bookDateFrom': date_from, 'nextPageKey': page_key})
+
+
+def fetch_record_pages(access_token, since=None):
+    """
+    Uses a single access token to fetch the account's balance and all of its transactions, following
+    nextPageKey page by page, and yields every page as a list of streaming records (see ABNtoDB.payload_to_records)
+    as soon as it arrives. The first page also carries the account record, and a checkpoint record follows
+    the last page.
+
+    Args:
+        access_token (str): The account's access token.
+        since (dict, optional): IBAN -> date (YYYY-MM-DD) to fetch the account's transactions from.
+            Without an entry the full history is fetched.
+
+    A token that fails is reported and skipped, as before; pages yielded before the failure are kept.
+    """
+    headers = request_headers(access_token)
+
     try:
         # 1. Fetch consent info to get the authorized IBAN
         print("\nStep A: Fetching consent info to get the IBAN...")
         consent_info_url = f"{API_BASE_URL}/v1/consentinfo"
-        consent_response = requests.get(consent_info_url, headers=headers, cert=(ABN_CERT_FILE, ABN_KEY_FILE))
+        consent_response = abn_session().get(consent_info_url, headers=headers)
         consent_response.raise_for_status()
         iban = consent_response.json().get('iban')
 
         if not iban:
             print("Error: Could not retrieve IBAN for this token. Skipping.")
-            return None
+            return
 
         print(f"   -> Success! This token is for IBAN: {iban}")
 
-        # 2. NEW: Use the IBAN to get balance information from the correct endpoint
+        # 2. Use the IBAN to get balance information
         balance_data = {}
         try:
             print(f"Step B: Fetching balance for IBAN {iban}...")
-            # Using the correct endpoint as per the documentation
             balances_url = f"{API_BASE_URL}/v1/accounts/{iban}/balances"
-            balances_response = requests.get(balances_url, headers=headers, cert=(ABN_CERT_FILE, ABN_KEY_FILE))
+            balances_response = abn_session().get(balances_url, headers=headers)
             balances_response.raise_for_status()
             balance_data = balances_response.json()
             print("   -> Success! Balance data retrieved.")
-        except requests.exceptions.HTTPError as e:
+        except requests.exceptions.RequestException as e:
             print(f"   -> WARNING: Could not fetch balance. The API returned an error: {e}")
             print(f"   -> Continuing to fetch transactions...")
 
-        # 3. Use the IBAN to get the transaction data
-        print(f"Step C: Fetching transactions for IBAN {iban}...")
-        transactions_url = f"{API_BASE_URL}/v1/accounts/{iban}/transactions"
-        transactions_response = requests.get(transactions_url, headers=headers, cert=(ABN_CERT_FILE, ABN_KEY_FILE))
-        transactions_response.raise_for_status()
-        transaction_data = transactions_response.json()
-        print("   -> Success! Transaction data retrieved.")
-
-        # 4. Combine all the retrieved data into a single object
-        # We merge the balance data and the transaction data.
-        combined_data = {
-            "account": balance_data,  # This now contains the balance info
-            "transactions": transaction_data.get("transactions", [])
-        }
-        # Add other top-level keys from the transaction response, like nextPageKey
-        for key, value in transaction_data.items():
-            if key not in ["transactions", "accountNumber"]:  # accountNumber is already in the balance data
-                combined_data[key] = value
-
-        return iban, combined_data
-
-    except requests.exceptions.HTTPError as e:
+        # 3. Use the IBAN to get the transactions, one page at a time
+        date_from = (since or {}).get(iban)
+        print(f"Step C: Fetching transactions{f' booked since {date_from}' if date_from else ''} for IBAN {iban}...")
+        page_key, page_count = None, 0
+        while True:
+            transactions_url = f"{API_BASE_URL}{transactions_path(iban, date_from, page_key)}"
+            transactions_response = abn_session().get(transactions_url, headers=headers)
+            transactions_response.raise_for_status()
+            transaction_data = transactions_response.json()
+            if page_count == 0:
+                # 4. The first page is combined with the balance into the account's data
+                yield list(payload_to_records(iban, combine_account_data(balance_data, transaction_data)))
+            else:
+                yield list(transaction_records(iban, transaction_data.get("transactions", [])))
+            page_count += 1
+
+            next_page_key = transaction_data.get("nextPageKey")
+            if not next_page_key or next_page_key == page_key:
+                break
+            page_key = next_page_key
+        print(f"   -> Success! {page_count} page(s) of transactions retrieved.")
+        yield [checkpoint_record(iban, iban)]
+
+    except requests.exceptions.RequestException as e:
         print(f"\n--- An HTTP Error Occurred ---")
         print(f"Error: {e}")
         if e.response:
             print(f"Response Body: {e.response.text}")
         print("This might mean your access token has expired or consent is missing. Skipping token.")
-        return None
 
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-        return None
 
 
 # --- Run the Script ---
 if __name__ == "__main__":
     print("--- Processing All ABN AMRO Access Tokens ---")
 
-    # This dictionary will hold all the data from all tokens.
-    all_abn_amro_data = {}
-
-    for index, token in enumerate(ABN_ACCOUNT_ACCESS_TOKENS):
-        print("\n" + "=" * 50)
-        print(f"Processing Token #{index + 1}: ({token[:4]}...{token[-4:]})")
-        print("=" * 50)
-
-        # Fetch data for the current token
-        result = fetch_data_for_token(token)
-
-        # If data was fetched successfully, add it to our main dictionary
-        if result:
-            iban, data = result
-            all_abn_amro_data[iban] = data
-
-    # After processing all tokens, save the aggregated data to a JSON file
-    if all_abn_amro_data:
-        print(f"\n--- Saving all retrieved data to '{JSON_OUTPUT_FILE}' ---")
-        with open(JSON_OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(all_abn_amro_data, f, indent=2)
-        print("    -> Success!")
+    record_count = 0
+    with open(JSON_OUTPUT_FILE, 'w', encoding='utf-8') as output_file:
+        # Tokens are fetched concurrently; every page of records is written as soon as it is its turn,
+        # in the order of ABN_ACCOUNT_ACCESS_TOKENS
+        record_pages = stream_concurrently(fetch_record_pages, ABN_ACCOUNT_ACCESS_TOKENS, workers=TOKEN_WORKERS)
+        for page in record_pages:
+            record_count += write_ndjson(output_file, page)
+            output_file.flush()
+
+    if record_count:
+        print(f"\n--- Saved {record_count} record(s) to '{JSON_OUTPUT_FILE}' ---")
     else:
-        print("\n--- No data was retrieved. JSON file not created. ---")
+        print("\n--- No data was retrieved. The output file is empty. ---")
 
     print("\n--- All tokens processed. ---")
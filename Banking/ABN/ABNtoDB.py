@@ -1,9 +1,17 @@
 import json
 import sqlite3
 import os
+import sys
 from datetime import datetime, timezone
 
+# The shared row-pipeline helpers live one directory up, next to DBMerger.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from RowPipeline import write_rows, DynamicTableWriter, apply_bulk_write_pragmas
+from JsonStream import is_ndjson, iter_ndjson, iter_top_level_items
+
 # --- Configuration ---
+# The newline-delimited JSON written by ABNDataFetcher.py; the older single-object JSON is used if it is missing
+NDJSON_INPUT_FILE = 'abn_amro_data_output.ndjson'
 JSON_INPUT_FILE = 'abn_amro_data_output.json'
 DB_FILE = 'abn_amro_data.db'
 
@@ -47,6 +55,7 @@ def setup_database(db_file, account_columns, transaction_columns):
     """
     print(f"--- Setting up database at '{db_file}' ---")
     conn = sqlite3.connect(db_file)
+    apply_bulk_write_pragmas(conn)
     cursor = conn.cursor()
 
     # --- Dynamically create Accounts table (without balance info) ---
@@ -105,6 +114,14 @@ def save_data_to_db(conn, cursor, all_data, account_columns, transaction_columns
     print(f"--- Saving all collected data to the database ---")
     script_timestamp = datetime.now(timezone.utc).isoformat()
 
+    # The insert statements only depend on the column sets, so they are built once for all accounts
+    account_column_sql = ', '.join(f'"{c}"' for c in account_columns)
+    acc_insert_sql = (f"INSERT OR IGNORE INTO accounts ({account_column_sql}) "
+                      f"VALUES ({', '.join(['?'] * len(account_columns))})")
+    tx_cols_for_sql = ['account_iban'] + transaction_columns
+    tx_column_sql = ', '.join(f'"{c}"' for c in tx_cols_for_sql)
+    tx_insert_sql = f"INSERT OR IGNORE INTO transactions ({tx_column_sql}) VALUES ({', '.join(['?'] * len(tx_cols_for_sql))})"
+
     for iban, data in all_data.items():
         # --- 1. Insert into Accounts table ---
         if account_columns:
@@ -115,24 +132,21 @@ def save_data_to_db(conn, cursor, all_data, account_columns, transaction_columns
                 flat_account_data['accountNumber'] = data.get('account', {}).get('accountNumber', iban)
 
             acc_values = [flat_account_data.get(col) for col in account_columns]
-            acc_placeholders = ', '.join(['?'] * len(account_columns))
-            acc_insert_sql = f"INSERT OR IGNORE INTO accounts ({', '.join(f'\"{c}\"' for c in account_columns)}) VALUES ({acc_placeholders})"
             cursor.execute(acc_insert_sql, acc_values)
 
         # --- 2. Insert into Transactions table ---
         transactions = data.get("transactions", [])
         if transaction_columns and transactions:
-            tx_cols_for_sql = ['account_iban'] + transaction_columns
-            tx_placeholders = ', '.join(['?'] * len(tx_cols_for_sql))
-            tx_insert_sql = f"INSERT OR IGNORE INTO transactions ({', '.join(f'\"{c}\"' for c in tx_cols_for_sql)}) VALUES ({tx_placeholders})"
+            def transaction_rows():
+                for tx in transactions:
+                    flat_tx = tx.copy()
+                    if "descriptionLines" in flat_tx:
+                        flat_tx["description"] = "\n".join(flat_tx.pop("descriptionLines"))
 
-            for tx in transactions:
-                flat_tx = tx.copy()
-                if "descriptionLines" in flat_tx:
-                    flat_tx["description"] = "\n".join(flat_tx.pop("descriptionLines"))
+                    yield [iban] + [flat_tx.get(col) for col in transaction_columns]
 
-                tx_values = [iban] + [flat_tx.get(col) for col in transaction_columns]
-                cursor.execute(tx_insert_sql, tx_values)
+            # Rows are built lazily and inserted in executemany() batches
+            write_rows(cursor, tx_insert_sql, transaction_rows())
 
         # --- 3. Derive latest balance and insert into Balances table ---
         if transactions:
@@ -153,16 +167,109 @@ def save_data_to_db(conn, cursor, all_data, account_columns, transaction_columns
     print("    -> All data saved to database successfully.")
 
 
+# --- Streaming ingest ---
+# Newline-delimited records, one per line, all carrying the account's 'iban' key:
+#   {"type": "account", "data": {top-level fields of the fetched account data, incl. accountNumber}}
+#   {"type": "transaction", "data": {...}}
+#   {"type": "checkpoint", "account": iban}   (all of that account's pages are above it)
+
+def payload_to_records(iban, data):
+    """Splits one account's fetched data ({account, transactions, ...}) into streaming records."""
+    flat_account_data = {k: v for k, v in data.items() if k not in ['account', 'transactions']}
+    if 'accountNumber' not in flat_account_data:
+        # Use the nested 'accountNumber' or fall back to the top-level IBAN
+        flat_account_data['accountNumber'] = (data.get('account') or {}).get('accountNumber', iban)
+    yield {"iban": iban, "type": "account", "data": flat_account_data}
+    yield from transaction_records(iban, data.get("transactions", []))
+
+
+def transaction_records(iban, transactions):
+    """Streaming records for transactions of an account, e.g. one further page of its transactions."""
+    for tx in transactions:
+        yield {"iban": iban, "type": "transaction", "data": tx}
+
+
+def iter_records(input_file):
+    """Streams records from an NDJSON export, or converts a single-object JSON export account by account."""
+    if is_ndjson(input_file):
+        yield from iter_ndjson(input_file)
+    else:
+        for iban, data in iter_top_level_items(input_file):
+            yield from payload_to_records(iban, data)
+
+
+def save_latest_balances(cursor, latest_transactions, script_timestamp):
+    """Saves each account's balance after its latest transaction, as tracked by stream_data_to_db."""
+    for iban, latest_tx in latest_transactions.items():
+        if latest_tx.get('balanceAfterMutation') is not None:
+            cursor.execute('''
+            INSERT OR REPLACE INTO balances (accountNumber, balance, sourceTransactionTimestamp, lastUpdatedTimestamp)
+            VALUES (?, ?, ?, ?)
+            ''', (iban, latest_tx.get('balanceAfterMutation'), latest_tx.get('transactionTimestamp'), script_timestamp))
+
+
+def stream_data_to_db(conn, cursor, records, on_checkpoint=None):
+    """
+    Discovers columns and saves rows in a single pass over the records, holding only one batch in memory.
+    Fields not seen before are added to the accounts / transactions tables with ALTER TABLE ADD COLUMN.
+    The latest balance per account is tracked while streaming and saved at the end. At every checkpoint
+    record the rows and balances so far are committed, after `on_checkpoint(record)` has run in the
+    same transaction.
+    """
+    print(f"--- Streaming records into the database ---")
+    script_timestamp = datetime.now(timezone.utc).isoformat()
+    account_writer = DynamicTableWriter(cursor, 'accounts')
+    transaction_writer = DynamicTableWriter(cursor, 'transactions')
+    latest_transactions = {}
+
+    for record in records:
+        iban = record.get('iban')
+        data = record.get('data') or {}
+        if record.get('type') == 'account':
+            account_writer.write(data)
+        elif record.get('type') == 'transaction':
+            flat_tx = data.copy()
+            if "descriptionLines" in flat_tx:
+                flat_tx["description"] = "\n".join(flat_tx.pop("descriptionLines"))
+            transaction_writer.write({'account_iban': iban, **flat_tx})
+
+            # Same rule as save_data_to_db: the first transaction with the maximum timestamp wins
+            latest = latest_transactions.get(iban)
+            if latest is None or data.get('transactionTimestamp', '') > latest.get('transactionTimestamp', ''):
+                latest_transactions[iban] = data
+        elif record.get('type') == 'checkpoint':
+            account_writer.flush()
+            transaction_writer.flush()
+            save_latest_balances(cursor, latest_transactions, script_timestamp)
+            latest_transactions.clear()
+            if on_checkpoint: on_checkpoint(record)
+            conn.commit()
+
+    account_writer.flush()
+    transaction_writer.flush()
+    save_latest_balances(cursor, latest_transactions, script_timestamp)
+
+    conn.commit()
+    for writer in (account_writer, transaction_writer):
+        if writer.added_columns:
+            print(f"    -> Added {len(writer.added_columns)} new column(s) to '{writer.table}'.")
+    print(f"    -> Saved {account_writer.written} account(s) and {transaction_writer.written} transaction(s).")
+
+
 if __name__ == "__main__":
-    retrieved_data = load_json_data(JSON_INPUT_FILE)
+    # Usage: python ABNtoDB.py [input file (.ndjson or .json)]
+    input_file = sys.argv[1] if len(sys.argv) > 1 else (
+        NDJSON_INPUT_FILE if os.path.exists(NDJSON_INPUT_FILE) else JSON_INPUT_FILE)
 
-    if retrieved_data:
+    if not os.path.exists(input_file):
+        print(f"!!! ERROR: Input file not found at '{input_file}'. Please run the main script first. !!!")
+    else:
         db_conn = None
         try:
-            account_cols, transaction_cols = discover_schema(retrieved_data)
-            # We don't need balance_cols from discover_schema anymore
-            db_conn, db_cursor = setup_database(DB_FILE, account_cols, transaction_cols)
-            save_data_to_db(db_conn, db_cursor, retrieved_data, account_cols, transaction_cols)
+            # Tables start with their fixed columns; fields are added as they appear in the stream
+            print(f"--- Reading data from '{input_file}' ---")
+            db_conn, db_cursor = setup_database(DB_FILE, [], [])
+            stream_data_to_db(db_conn, db_cursor, iter_records(input_file))
             print("\nImport process finished successfully.")
         except Exception as e:
             print(f"\n!!! An unexpected error occurred during the database operation: {e} !!!")
@@ -17,10 +17,12 @@ TOKEN_URL = "https://auth-mtls-sandbox.abnamro.com/as/token.oauth2"
 API_BASE_URL = "https://api-sandbox.abnamro.com"
 
 # Paths to your ABN AMRO and local SSL certificates
-ABN_CERT_FILE = '../PSD2TPPCertificate.crt'
-ABN_KEY_FILE = '../PSD2TPPprivateKey.key'
-LOCAL_CERT_FILE = '../../cert.pem'
-LOCAL_KEY_FILE = '../../key.pem'
+# Kept in the Banking folder; resolved from this file, so any working directory will do
+ABN_DIR = os.path.dirname(os.path.abspath(__file__))
+ABN_CERT_FILE = os.path.join(ABN_DIR, '..', 'PSD2TPPCertificate.crt')
+ABN_KEY_FILE = os.path.join(ABN_DIR, '..', 'PSD2TPPprivateKey.key')
+LOCAL_CERT_FILE = os.path.join(ABN_DIR, '..', '..', 'cert.pem')
+LOCAL_KEY_FILE = os.path.join(ABN_DIR, '..', '..', 'key.pem')
 
 
 # --- 1. Start the Authorization Flow ---
@@ -1,4 +1,5 @@
 import requests
+import os
 import json
 
 # --- Configuration ---
@@ -15,8 +16,10 @@ API_KEY = "YOUR_API_KEY"
 API_BASE_URL = "https://api-sandbox.abnamro.com"
 
 # Paths to your ABN AMRO-provided certificates
-ABN_CERT_FILE = '../PSD2TPPCertificate.crt'
-ABN_KEY_FILE = '../PSD2TPPprivateKey.key'
+# Kept in the Banking folder; resolved from this file, so any working directory will do
+ABN_DIR = os.path.dirname(os.path.abspath(__file__))
+ABN_CERT_FILE = os.path.join(ABN_DIR, '..', 'PSD2TPPCertificate.crt')
+ABN_KEY_FILE = os.path.join(ABN_DIR, '..', 'PSD2TPPprivateKey.key')
 
 
 def fetch_data_for_token(access_token):
@@ -0,0 +1,398 @@
+import asyncio
+import os
+import ssl
+import sys
+import threading
+from collections import deque
+import requests
+
+# The bank folders hold standalone scripts; make them importable when run from this folder too
+BANKING_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BANKING_DIR, 'ING'), os.path.join(BANKING_DIR, 'ABN')]
+
+import INGDataFetcher
+import INGtoDB
+from INGTokenStore import refresh_due_tokens
+import ABNDataFetcher
+import ABNtoDB
+from FetchScheduler import ACCOUNT_WORKERS, BUFFERED_RESULTS, END_OF_STREAM
+from Resilience import RetryState, RETRY_STATUSES
+from RowPipeline import checkpoint_record
+from HttpClient import RATE_LIMITS, DEFAULT_RATE_LIMIT, CONNECT_TIMEOUT, READ_TIMEOUT, TokenBucket, get_session
+
+# httpx is optional: with it requests are sent from the event loop itself (over HTTP/2 when h2 is
+# installed too); without it they are handed to the bank's shared requests session in worker threads
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+# httpx failures without a response (those of requests are requests.exceptions.RequestException)
+TRANSPORT_ERRORS = (httpx.TransportError,) if httpx is not None else ()
+
+# --- Configuration ---
+# Requests one bank may have in flight at once. Over HTTP/2 they are multiplexed over a few connections;
+# the bank's sustained rate and burst still come from HttpClient.RATE_LIMITS.
+MAX_IN_FLIGHT = 1000
+# Connections per bank
+MAX_CONNECTIONS = 20
+# Tokens whose fetch may be started ahead of the consumer (see stream_in_order)
+MAX_PENDING_TOKENS = 500
+
+
+class BankAPIError(Exception):
+    """
+    An API call that returned an error status, or that failed without a response (status_code None,
+    the reason in `body`). Carries the status code, response headers and body.
+    """
+
+    def __init__(self, method, url, status_code, headers, body):
+        super().__init__(f"{status_code} error for {method} {url}" if status_code is not None
+                         else f"{method} {url} failed: {body}")
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+
+class AsyncLimiter:
+    """The asyncio counterpart of HttpClient.RequestLimiter: a token bucket plus a cap on requests in flight."""
+
+    def __init__(self, rate, burst, max_in_flight):
+        self.bucket = TokenBucket(rate, burst)
+        self.slots = asyncio.Semaphore(max_in_flight)
+
+    async def __aenter__(self):
+        await self.slots.acquire()
+        try:
+            wait = self.bucket.reserve()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self.bucket.reserve()
+        except BaseException:
+            self.slots.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.slots.release()
+
+
+class AsyncTransport:
+    """
+    Sends one bank's requests and returns the decoded JSON.
+
+    With httpx, one AsyncClient per bank holds the client certificate in a single SSLContext, keeps up to
+    MAX_CONNECTIONS connections alive and negotiates HTTP/2 where the server offers it. Requests are admitted
+    by an AsyncLimiter. Without httpx, requests go through the bank's shared requests session on worker
+    threads; that session applies the thread limits itself.
+    """
+
+    def __init__(self, name, base_url, cert_file, key_file):
+        self.name = name
+        self.base_url = base_url
+        if httpx is not None:
+            ssl_context = ssl.create_default_context()
+            ssl_context.load_cert_chain(cert_file, key_file)
+            rate, burst, _ = RATE_LIMITS.get(name, DEFAULT_RATE_LIMIT)
+            self.limiter = AsyncLimiter(rate, burst, MAX_IN_FLIGHT)
+            self._client = httpx.AsyncClient(
+                base_url=base_url, verify=ssl_context, http2=h2 is not None,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT))
+            self._session = None
+        else:
+            self.limiter = None
+            self._client = None
+            self._session = get_session(name, cert_file, key_file)
+
+    async def request(self, method, path, headers=None, data=None):
+        """
+        Sends a request and returns the decoded JSON body. Failed attempts are retried as in
+        HttpClient.ClientCertAdapter (which does so itself for the requests fallback).
+
+        Raises:
+            BankAPIError: If the server answers with an error status, or the request fails without a response.
+        """
+        url = f"{self.base_url}{path}"
+        try:
+            if self._client is not None:
+                response = await self._send(method, path, url, headers, data)
+            else:
+                response = await asyncio.to_thread(self._session.request, method, url, headers=headers, data=data)
+        except (requests.exceptions.RequestException, *TRANSPORT_ERRORS) as e:
+            raise BankAPIError(method, url, None, {}, str(e) or type(e).__name__) from e
+        if response.status_code >= 400:
+            raise BankAPIError(method, url, response.status_code, dict(response.headers), response.text)
+        return response.json()
+
+    async def _send(self, method, path, url, headers, data):
+        """Sends a request with httpx, retrying failed attempts within the request's deadline."""
+        retry = RetryState(method, url, body=data)
+        while True:
+            retry.before_attempt()
+            connect_timeout, read_timeout = retry.attempt_timeout((CONNECT_TIMEOUT, READ_TIMEOUT))
+            try:
+                try:
+                    async with self.limiter:
+                        response = await self._client.request(
+                            method, path, headers=headers, content=data,
+                            timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+                except httpx.TransportError as e:
+                    delay = retry.next_delay(error=e)
+                    if delay is None:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        retry.succeeded()
+                        return response
+                    delay = retry.next_delay(response.status_code, response.headers)
+                    if delay is None:
+                        return response
+            finally:
+                # A cancelled task (stream_in_order cancels the pending ones) must not keep the breaker's trial
+                retry.end_attempt()
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+class AsyncINGClient:
+    """
+    Async ING client: application token, customer token refresh, accounts, balances and transactions.
+    Requests are built and signed by the same functions as INGDataFetcher, so both stay in step.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport or AsyncTransport('ING', INGDataFetcher.SANDBOX_HOST,
+                                                     INGDataFetcher.ING_TLS_CERT, INGDataFetcher.ING_TLS_KEY)
+
+    async def application_token_data(self):
+        """Returns the token response for a new application token."""
+        endpoint, headers, payload = INGDataFetcher.application_token_request()
+        return await self.transport.request('POST', endpoint, headers, payload.encode('utf-8'))
+
+    async def application_token(self):
+        return (await self.application_token_data())['access_token']
+
+    async def refresh(self, app_token, refresh_token):
+        """Returns the token response (a dict with the new access_token)."""
+        endpoint, headers, body = INGDataFetcher.refresh_token_request(app_token, refresh_token)
+        return await self.transport.request('POST', endpoint, headers, body)
+
+    async def get(self, endpoint, customer_token):
+        return await self.transport.request('GET', endpoint,
+                                            INGDataFetcher.customer_request_headers(endpoint, customer_token))
+
+    async def accounts(self, customer_token):
+        return (await self.get("/v3/accounts", customer_token))['accounts']
+
+    async def refresh_all(self, app_token, refresh_tokens, return_exceptions=False):
+        """
+        Refreshes every customer token at once. Returns the token responses in the order given; with
+        `return_exceptions` a failed refresh gives its exception instead of failing the whole batch.
+        """
+        return await asyncio.gather(*(self.refresh(app_token, refresh_token) for refresh_token in refresh_tokens),
+                                    return_exceptions=return_exceptions)
+
+    async def account_pages(self, customer_token, iban, account, date_from=None):
+        """Same as INGDataFetcher.fetch_account_pages: the balances, then every transactions page as it arrives."""
+        account_identifier = account.get('iban') or account.get('maskedPan')
+        href = (account.get('_links', {}).get('balances') or {}).get('href')
+        if href:
+            try:
+                balances = await self.get(href, customer_token)
+                yield list(INGtoDB.payload_to_records(iban, {"balances": [balances]}))
+            except BankAPIError as e:
+                print(f"       -> WARNING: Could not fetch balances for {account_identifier}: {e}")
+
+        href = INGDataFetcher.transactions_href(account, date_from)
+        seen_pages = set()
+        try:
+            while href and href not in seen_pages:
+                seen_pages.add(href)
+                page, href = INGDataFetcher.split_transactions_page(await self.get(href, customer_token))
+                yield list(INGtoDB.payload_to_records(iban, {"transactions": [page]}))
+        except BankAPIError as e:
+            print(f"       -> WARNING: Could not fetch transactions for {account_identifier}: {e}")
+            return
+        if seen_pages:
+            yield [checkpoint_record(iban, account.get('resourceId'))]
+
+    async def record_pages(self, customer_token, iban, since=None):
+        """Same as INGDataFetcher.fetch_record_pages, with the accounts' calls in flight at once."""
+        since = since or {}
+        try:
+            accounts = await self.accounts(customer_token)
+        except BankAPIError as e:
+            print(f"    -> WARNING: Could not fetch the accounts for {iban}: {e}")
+            print(f"    -> Skipping this token and continuing.")
+            return
+        yield list(INGtoDB.payload_to_records(iban, {"accounts": accounts}))
+        account_pages = stream_in_order(
+            lambda account: self.account_pages(customer_token, iban, account, since.get(account.get('resourceId'))),
+            accounts, ACCOUNT_WORKERS)
+        async for page in account_pages:
+            yield page
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class AsyncABNClient:
+    """Async ABN AMRO client: consent info, balances and transactions per access token."""
+
+    def __init__(self, transport=None):
+        self.transport = transport or AsyncTransport('ABN_AMRO', ABNDataFetcher.API_BASE_URL,
+                                                     ABNDataFetcher.ABN_CERT_FILE, ABNDataFetcher.ABN_KEY_FILE)
+
+    async def get(self, path, access_token):
+        return await self.transport.request('GET', path, ABNDataFetcher.request_headers(access_token))
+
+    async def consent_info(self, access_token):
+        return await self.get("/v1/consentinfo", access_token)
+
+    async def balances(self, access_token, iban):
+        return await self.get(f"/v1/accounts/{iban}/balances", access_token)
+
+    async def transactions(self, access_token, iban, date_from=None, page_key=None):
+        return await self.get(ABNDataFetcher.transactions_path(iban, date_from, page_key), access_token)
+
+    async def record_pages(self, access_token, since=None):
+        """
+        Same as ABNDataFetcher.fetch_record_pages: the account's transactions page by page, as lists of records.
+        The balance is requested together with the first page; a failed balance call is tolerated.
+        """
+        try:
+            iban = (await self.consent_info(access_token)).get('iban')
+            if not iban:
+                print("Error: Could not retrieve IBAN for this token. Skipping.")
+                return
+            date_from = (since or {}).get(iban)
+            balance_data, transaction_data = await asyncio.gather(
+                self.balances(access_token, iban), self.transactions(access_token, iban, date_from),
+                return_exceptions=True)
+            if isinstance(transaction_data, BaseException):
+                raise transaction_data
+            if isinstance(balance_data, BankAPIError):
+                print(f"   -> WARNING: Could not fetch balance for {iban}. The API returned an error: {balance_data}")
+                balance_data = {}
+            elif isinstance(balance_data, BaseException):
+                raise balance_data
+            yield list(ABNtoDB.payload_to_records(iban, ABNDataFetcher.combine_account_data(balance_data,
+                                                                                            transaction_data)))
+
+            page_key = None
+            while transaction_data.get("nextPageKey") and transaction_data["nextPageKey"] != page_key:
+                page_key = transaction_data["nextPageKey"]
+                transaction_data = await self.transactions(access_token, iban, date_from, page_key)
+                yield list(ABNtoDB.transaction_records(iban, transaction_data.get("transactions", [])))
+            yield [checkpoint_record(iban, iban)]
+        except BankAPIError as e:
+            print(f"\n--- An HTTP Error Occurred: {e} ---")
+            print("This might mean your access token has expired or consent is missing. Skipping token.")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def refresh_expiring_ing_tokens(store, client, background):
+    """
+    INGDataFetcher.refresh_expiring_tokens with the async client running on a BackgroundLoop:
+    the tokens of each batch are all refreshed at once.
+    """
+    return refresh_due_tokens(
+        store, INGDataFetcher.CLIENT_ID, lambda: background.run(client.application_token_data()),
+        lambda app_token, refresh_tokens: background.run(client.refresh_all(app_token, refresh_tokens,
+                                                                            return_exceptions=True)))
+
+
+async def _produce(agen_func, item, buffer):
+    """Runs the async generator `agen_func(item)` into `buffer`, followed by END_OF_STREAM or its exception."""
+    try:
+        async for result in agen_func(item):
+            await buffer.put(result)
+        await buffer.put(END_OF_STREAM)
+    except Exception as e:
+        await buffer.put(e)
+
+
+async def _drain(buffer):
+    """Yields one generator's results from its buffer; re-raises the exception it ended with."""
+    while True:
+        entry = await buffer.get()
+        if entry is END_OF_STREAM:
+            return
+        if isinstance(entry, Exception):
+            raise entry
+        yield entry
+
+
+async def stream_in_order(agen_func, items, max_pending, buffered=BUFFERED_RESULTS):
+    """
+    The asyncio counterpart of FetchScheduler.stream_concurrently: runs the async generators `agen_func(item)`
+    of up to `max_pending` items at once and yields their results flattened, in the order of `items`.
+    Items ahead of the one being consumed buffer up to `buffered` results each.
+    """
+    pending = deque()
+    try:
+        for item in items:
+            buffer = asyncio.Queue(buffered)
+            pending.append((asyncio.create_task(_produce(agen_func, item, buffer)), buffer))
+            if len(pending) >= max_pending:
+                async for result in _drain(pending[0][1]):
+                    yield result
+                pending.popleft()
+        while pending:
+            async for result in _drain(pending[0][1]):
+                yield result
+            pending.popleft()
+    finally:
+        for task, _ in pending:
+            task.cancel()
+
+
+async def _next(async_iterator):
+    return await async_iterator.__anext__()
+
+
+class BackgroundLoop:
+    """
+    Runs an asyncio event loop on a background thread, so synchronous code such as the streaming database
+    loaders can consume the results of async fetches while they are still being fetched.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def run(self, coroutine):
+        """Runs one coroutine on the loop and returns its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def iterate(self, async_iterator):
+        """Yields the items of an async generator (e.g. stream_in_order) running on the loop, one at a time."""
+        try:
+            while True:
+                try:
+                    yield self.run(_next(async_iterator))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(async_iterator.aclose())
@@ -0,0 +1,129 @@
+import sqlite3
+
+# --- Configuration ---
+MERGED_DB = 'merged_data1.db'
+
+# Balance snapshots newer than this are all kept
+FULL_RESOLUTION_DAYS = 30
+# Between FULL_RESOLUTION_DAYS and this age only the closing balance of each day is kept;
+# anything older is reduced to the closing balance of each month
+DAILY_RESOLUTION_DAYS = 365
+
+# strftime() patterns for the balance_over_time granularities
+GRANULARITIES = {'day': '%Y-%m-%d', 'week': '%Y-%W', 'month': '%Y-%m', 'year': '%Y'}
+
+
+def create_balance_views(cursor):
+    """
+    Creates views over unified_balances for balance questions and charts:
+    the latest balance per account, and the closing balance per account per day.
+    Both read through the (account_id_fk, timestamp) index.
+    """
+    cursor.execute('''
+    CREATE VIEW IF NOT EXISTS unified_current_balances AS
+    SELECT b.account_id_fk, b.source_bank, b.amount, b.currency, b.timestamp
+    FROM unified_balances b
+    WHERE b.balance_pk = (SELECT latest.balance_pk FROM unified_balances latest
+                          WHERE latest.account_id_fk = b.account_id_fk
+                          ORDER BY latest.timestamp DESC, latest.balance_pk DESC LIMIT 1)''')
+    cursor.execute(f'''
+    CREATE VIEW IF NOT EXISTS unified_daily_balances AS
+    {_closing_balance_sql('%Y-%m-%d', '1')}''')
+
+
+def _closing_balance_sql(period_format, condition):
+    """The last snapshot per account and period, as (account_id_fk, period, amount, currency, timestamp)."""
+    return f'''
+    SELECT account_id_fk, period, amount, currency, timestamp FROM (
+        SELECT account_id_fk, strftime('{period_format}', timestamp) AS period, amount, currency, timestamp,
+               ROW_NUMBER() OVER (PARTITION BY account_id_fk, strftime('{period_format}', timestamp)
+                                  ORDER BY timestamp DESC, balance_pk DESC) AS position
+        FROM unified_balances
+        WHERE timestamp IS NOT NULL AND {condition}
+    ) WHERE position = 1'''
+
+
+def balance_over_time(conn, account_id=None, date_from=None, date_to=None, granularity='day'):
+    """
+    Returns the closing balance per account per period ('day', 'week', 'month' or 'year'),
+    oldest first, as a list of dicts ready to be charted.
+
+    Raises:
+        ValueError: If the granularity is not supported.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'. Available: {', '.join(GRANULARITIES)}")
+    conditions, params = [], []
+    if account_id:
+        conditions.append("account_id_fk = ?")
+        params.append(account_id)
+    if date_from:
+        conditions.append("timestamp >= ?")
+        params.append(date_from[:10])
+    if date_to:
+        conditions.append("timestamp < date(?, '+1 day')")
+        params.append(date_to[:10])
+
+    sql = _closing_balance_sql(GRANULARITIES[granularity], ' AND '.join(conditions) or '1')
+    rows = conn.execute(f"{sql} ORDER BY period, account_id_fk", params).fetchall()
+    return [{"account_id": account, "period": period, "balance": amount, "currency": currency,
+             "timestamp": timestamp} for account, period, amount, currency, timestamp in rows]
+
+
+def total_balance_per_period(balances):
+    """
+    Adds up the balance_over_time rows of all accounts into one total per period. An account without a
+    snapshot in a period counts with its last earlier balance, so a quiet account does not drop out.
+
+    Returns:
+        tuple: The periods, oldest first, and the total balance of each.
+    """
+    periods = sorted({row["period"] for row in balances})
+    by_period = {}
+    for row in balances:
+        by_period.setdefault(row["period"], {})[row["account_id"]] = row["balance"] or 0
+    latest, totals = {}, []
+    for period in periods:
+        latest.update(by_period[period])
+        totals.append(round(sum(latest.values()), 2))
+    return periods, totals
+
+
+def compact_balances(merged_cursor, full_days=FULL_RESOLUTION_DAYS, daily_days=DAILY_RESOLUTION_DAYS):
+    """
+    Thins out old balance snapshots: everything from the last `full_days` days is kept, older snapshots
+    are reduced to the closing balance per account per day, and snapshots older than `daily_days` days
+    to the closing balance per account per month. Snapshots without a timestamp are left alone.
+    Returns the number of deleted rows.
+    """
+    print("\n--- Compacting balance history ---")
+    merged_cursor.execute('''
+    DELETE FROM unified_balances WHERE balance_pk IN (
+        SELECT balance_pk FROM (
+            SELECT balance_pk,
+                   ROW_NUMBER() OVER (PARTITION BY account_id_fk, bucket
+                                      ORDER BY timestamp DESC, balance_pk DESC) AS position
+            FROM (
+                SELECT balance_pk, account_id_fk, timestamp,
+                       CASE WHEN timestamp >= datetime('now', ?) THEN strftime('%Y-%m-%d', timestamp)
+                            ELSE strftime('%Y-%m', timestamp) END AS bucket
+                FROM unified_balances
+                WHERE timestamp < datetime('now', ?)
+            )
+        ) WHERE position > 1
+    )''', (f'-{int(daily_days)} days', f'-{int(full_days)} days'))
+    deleted = merged_cursor.rowcount
+    print(f"    -> Removed {deleted} superseded balance snapshot(s).")
+    return deleted
+
+
+if __name__ == "__main__":
+    merged_conn = None
+    try:
+        merged_conn = sqlite3.connect(MERGED_DB)
+        compact_balances(merged_conn.cursor())
+        merged_conn.commit()
+    except sqlite3.Error as e:
+        print(f"\n!!! A database error occurred: {e} !!!")
+    finally:
+        if merged_conn: merged_conn.close()
@@ -0,0 +1,229 @@
+import os
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta, timezone
+
+# The bank folders hold standalone scripts; make them importable when run from this folder too
+BANKING_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BANKING_DIR, 'ING'), os.path.join(BANKING_DIR, 'ABN')]
+
+import INGDataFetcher
+import INGtoDB
+import ABNDataFetcher
+import ABNtoDB
+from HttpClient import close_sessions
+from FetchScheduler import stream_concurrently
+from AsyncBankClient import (AsyncINGClient, AsyncABNClient, BackgroundLoop, stream_in_order, refresh_expiring_ing_tokens,
+                             MAX_PENDING_TOKENS, httpx)
+from INGTokenStore import TokenStore
+from DBMerger import ING_DB, ABN_DB, MERGED_DB, incremental_sync
+from PayloadArchive import PayloadArchive
+
+# --- Configuration ---
+# Keep every fetched record in the compressed payload archive as well (also enabled with --archive)
+ARCHIVE_RECORDS = False
+
+# Merge the new raw rows into the unified database after each sync (disable with --raw-only)
+MERGE_INTO_UNIFIED = True
+
+# 'async' fetches with AsyncBankClient, every token and account in flight at once up to the bank limits;
+# 'threads' runs the blocking fetchers on a thread pool (also selected with --threads).
+# Without httpx the async clients would only hand each request to a worker thread, so the thread pool is the default then.
+FETCH_BACKEND = 'async' if httpx is not None else 'threads'
+
+# Fetch only the transactions booked since each account's last successful sync (disable with --full).
+# The window starts FETCH_OVERLAP_DAYS earlier, to pick up bookings that show up late with an earlier date;
+# transactions that were already loaded are skipped by the raw databases.
+INCREMENTAL_FETCH = True
+FETCH_OVERLAP_DAYS = 7
+
+# Per raw database: the date of each account's last successful sync (ING: resourceId, ABN AMRO: IBAN)
+FETCH_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS fetch_state (
+    account_id TEXT PRIMARY KEY,
+    last_synced_date TEXT NOT NULL,
+    updated_at TEXT
+)"""
+
+
+def ing_records(backend=FETCH_BACKEND, since=None):
+    """
+    Refreshes the ING customer tokens that are about to expire and yields the records of each account
+    with a valid token, page by page as they are fetched. Tokens are fetched concurrently, but records
+    come out in the order of the token store. `since` is passed on to INGDataFetcher.fetch_record_pages.
+    """
+    store = TokenStore()
+    if not store.count():
+        print(f"    -> WARNING: No ING accounts in the token store '{store.db_file}'. Run ING/INGtokenobtainer.py first.")
+    try:
+        if backend == 'async':
+            with BackgroundLoop() as background:
+                client = AsyncINGClient()
+                try:
+                    refresh_expiring_ing_tokens(store, client, background)
+                    token_rows = store.valid_tokens()
+                    for page in background.iterate(stream_in_order(
+                            lambda row: client.record_pages(row['customer_access_token'], row['iban'], since),
+                            token_rows, MAX_PENDING_TOKENS)):
+                        yield from page
+                finally:
+                    background.run(client.aclose())
+        else:
+            INGDataFetcher.refresh_expiring_tokens(store)
+            token_rows = store.valid_tokens()
+            for page in stream_concurrently(
+                    lambda row: INGDataFetcher.fetch_record_pages(row['customer_access_token'], row['iban'], since),
+                    token_rows):
+                yield from page
+    finally:
+        store.close()
+
+
+def abn_records(backend=FETCH_BACKEND, since=None):
+    """
+    Yields the records of every ABN AMRO access token page by page, fetching the tokens concurrently.
+    `since` is passed on to ABNDataFetcher.fetch_record_pages.
+    """
+    tokens = ABNDataFetcher.ABN_ACCOUNT_ACCESS_TOKENS
+    if backend == 'async':
+        with BackgroundLoop() as background:
+            client = AsyncABNClient()
+            try:
+                for page in background.iterate(stream_in_order(
+                        lambda token: client.record_pages(token, since), tokens, MAX_PENDING_TOKENS)):
+                    yield from page
+            finally:
+                background.run(client.aclose())
+    else:
+        for page in stream_concurrently(lambda token: ABNDataFetcher.fetch_record_pages(token, since), tokens):
+            yield from page
+
+
+def load_fetch_windows(db_file):
+    """
+    Returns {account id: first booking date to fetch} from the fetch_state table of a raw database:
+    the date of each account's last successful sync, minus FETCH_OVERLAP_DAYS.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute(FETCH_STATE_SQL)
+        rows = conn.execute("SELECT account_id, last_synced_date FROM fetch_state").fetchall()
+    finally:
+        conn.close()
+    return {account: (date.fromisoformat(synced) - timedelta(days=FETCH_OVERLAP_DAYS)).isoformat()
+            for account, synced in rows}
+
+
+def store_fetch_window(conn, account_id, synced_date):
+    """
+    Records `synced_date` as the last successful sync of an account. Not committed here: it is called at the
+    account's checkpoint, and committed together with the account's rows.
+    """
+    if account_id:
+        conn.execute('''
+        INSERT INTO fetch_state (account_id, last_synced_date, updated_at) VALUES (?, ?, datetime('now'))
+        ON CONFLICT (account_id) DO UPDATE SET
+            last_synced_date = excluded.last_synced_date, updated_at = excluded.updated_at
+        ''', (account_id, synced_date))
+
+
+# Per bank: record source, raw loader module and raw database file
+SYNC_SOURCES = {
+    'ING': (ing_records, INGtoDB, ING_DB),
+    'ABN_AMRO': (abn_records, ABNtoDB, ABN_DB),
+}
+SOURCE_DB_FILES = {bank: db_file for bank, (_, _, db_file) in SYNC_SOURCES.items()}
+
+
+def sync_bank(bank, records=None, archive=None, backend=FETCH_BACKEND, incremental=INCREMENTAL_FETCH):
+    """
+    Streams one bank's records straight into its raw database: the API responses are never written to
+    an intermediate file first, and only one page of records or write batch is held in memory. With `incremental`
+    each account's transactions are fetched from its last successful sync on. Every account is committed at
+    its checkpoint record, together with its new sync date, so a sync that fails halfway keeps the accounts
+    it completed, and the next run only refetches the rest (and the overlap window).
+    Pass `records` to load records from another source (e.g. an archive replay) through the same path,
+    and a PayloadArchive as `archive` to archive the records while they are loaded.
+    """
+    record_source, loader, db_file = SYNC_SOURCES[bank]
+    print(f"\n=== Syncing {bank} into '{db_file}' ===")
+    sync_date = datetime.now(timezone.utc).date().isoformat()
+    if records is None:
+        since = load_fetch_windows(db_file) if incremental else {}
+        if since:
+            print(f"    -> Fetching only new transactions for {len(since)} previously synced account(s).")
+        records = record_source(backend, since)
+    if archive is not None:
+        records = archive.archive_records(bank, records)
+
+    db_conn = None
+    try:
+        db_conn, db_cursor = loader.setup_database(db_file, [], [])
+        db_conn.execute(FETCH_STATE_SQL)
+        loader.stream_data_to_db(db_conn, db_cursor, records,
+                                 on_checkpoint=lambda record: store_fetch_window(db_conn, record.get('account'),
+                                                                                 sync_date))
+    finally:
+        if db_conn: db_conn.close()
+
+
+def replay_bank(bank, date_from=None, date_to=None, account=None):
+    """Loads a window of archived records into the bank's raw database, without calling the bank API."""
+    archive = PayloadArchive()
+    try:
+        sync_bank(bank, records=archive.iter_records(bank, account, date_from, date_to))
+    finally:
+        archive.close()
+
+
+def sync(banks=tuple(SYNC_SOURCES), archive=ARCHIVE_RECORDS, merge=MERGE_INTO_UNIFIED, merged_db=MERGED_DB,
+         backend=FETCH_BACKEND, incremental=INCREMENTAL_FETCH):
+    """
+    Syncs the given banks and, unless `merge` is off, brings the unified database up to date. A bank that
+    fails does not stop the others: what was committed is still merged, and the failure is raised afterwards.
+    """
+    payload_archive = PayloadArchive() if archive else None
+    failed = []
+    try:
+        for bank in banks:
+            try:
+                sync_bank(bank, archive=payload_archive, backend=backend, incremental=incremental)
+            except Exception as e:
+                print(f"!!! Syncing {bank} failed: {e} !!!")
+                failed.append(bank)
+    finally:
+        if payload_archive: payload_archive.close()
+        close_sessions()
+    if merge:
+        incremental_sync(merged_db, SOURCE_DB_FILES)
+    if failed:
+        raise RuntimeError(f"Could not sync {', '.join(failed)}; its completed accounts were kept and "
+                           f"the next sync resumes from them")
+
+
+if __name__ == "__main__":
+    # Usage: python BankSync.py [ING] [ABN_AMRO] [--archive] [--raw-only] [--threads] [--full]
+    #        python BankSync.py [ING] [ABN_AMRO] --replay [--from=YYYY-MM-DD] [--to=YYYY-MM-DD] [--raw-only]
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    banks = [arg.upper() for arg in sys.argv[1:] if not arg.startswith('--')] or list(SYNC_SOURCES)
+
+    unknown = [bank for bank in banks if bank not in SYNC_SOURCES]
+    if unknown:
+        print(f"!!! ERROR: Unknown bank(s) {', '.join(unknown)}. Available: {', '.join(SYNC_SOURCES)} !!!")
+        sys.exit(1)
+
+    merge = MERGE_INTO_UNIFIED and 'raw-only' not in options
+    try:
+        if 'replay' in options:
+            for bank in banks:
+                replay_bank(bank, options.get('from'), options.get('to'))
+            if merge:
+                incremental_sync(MERGED_DB, SOURCE_DB_FILES)
+        else:
+            sync(banks, archive=ARCHIVE_RECORDS or 'archive' in options, merge=merge,
+                 backend='threads' if 'threads' in options else FETCH_BACKEND,
+                 incremental=INCREMENTAL_FETCH and 'full' not in options)
+        print("\n--- Sync complete! ---")
+    except Exception as e:
+        print(f"\n!!! The sync stopped with an error: {e} !!!")
+        sys.exit(1)
@@ -1,6 +1,13 @@
 import sqlite3
 import os
-from datetime import datetime
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from DateNormalizer import normalize_datetime
+from TransactionCategorizer import categorize, ensure_category_column, recategorize, store_rule_versions
+from TransferMatcher import ensure_transfer_columns, match_internal_transfers
+from BalanceCompactor import create_balance_views, compact_balances
+from RowPipeline import iter_rows, iter_table, transform, map_stage, filter_stage, write_rows
 
 # --- Configuration ---
 # Source database files
@@ -10,6 +17,16 @@ ABN_DB = 'abn_amro_data.db'
 # The new, merged database file that will be created
 MERGED_DB = 'merged_data1.db'
 
+# 'row' maps every source row in Python; 'bulk' moves each table with one INSERT ... SELECT
+# over ATTACHed source databases; 'parallel' maps chunks of rows in a process pool and writes
+# them from a single connection; 'incremental' keeps the existing merged database and only adds
+# source rows past the per-account watermarks of the previous run. Can be overridden on the command line: python DBMerger.py bulk
+MERGE_MODE = 'row'
+
+# Parallel mode: worker processes, and how many source rows each worker maps per task
+PARALLEL_WORKERS = os.cpu_count() or 2
+PARALLEL_CHUNK_ROWS = 50000
+
 
 def to_float(value):
     """
@@ -24,76 +41,31 @@ def to_float(value):
         return None
 
 
-def to_datetime_iso(date_string):
+def to_datetime_iso(date_string, source_column=None):
     """
     Helper function to safely convert a date string from various formats
     to a standardized ISO 8601 format (YYYY-MM-DD HH:MM:SS).
     Returns None if the string is empty or cannot be parsed.
-    """
-    if not date_string:
-        return None
-
-    parsable_string = str(date_string)
-
-    # Pre-process for the specific 'YYYY-MM-DD-HH:MM:SS:ms' format.
-    if parsable_string.count(':') == 3 and parsable_string.count('-') == 3:
-        try:
-            # This is a more robust way to handle 'YYYY-MM-DD-HH:MM:SS:ms'
-            parts = parsable_string.split('-')
-            if len(parts) == 4:
-                date_part = '-'.join(parts[:3])
-                time_part = parts[3]
-
-                # Replace the last colon in the time part with a period
-                time_part_fixed = '.'.join(time_part.rsplit(':', 1))
-
-                # Reassemble the string in a standard format
-                parsable_string = f"{date_part} {time_part_fixed}"
-        except Exception:
-            # If transformation fails, proceed with the original string and let it be handled below
-            pass
-
-    # List of common date/time formats to try parsing
-    formats_to_try = [
-        '%Y-%m-%dT%H:%M:%S.%f%z',  # ISO 8601 with microseconds and timezone
-        '%Y-%m-%dT%H:%M:%S%z',  # ISO 8601 with timezone
-        '%Y-%m-%dT%H:%M:%S.%f',  # ISO 8601 with microseconds, no timezone
-        '%Y-%m-%dT%H:%M:%S',  # ISO 8601, no microseconds or timezone
-        '%Y-%m-%d %H:%M:%S.%f',  # Space separator with microseconds
-        '%Y-%m-%d %H:%M:%S',  # Space separator
-        '%Y-%m-%d',  # Date only
-    ]
-
-    # Clean the string for parsing: handle 'Z' for UTC
-    if isinstance(parsable_string, str) and parsable_string.endswith('Z'):
-        parsable_string = parsable_string[:-1] + '+0000'
-
-    for fmt in formats_to_try:
-        try:
-            # Parse the string into a datetime object
-            dt_obj = datetime.strptime(parsable_string, fmt)
-            # Return it in a standard format recognized by SQLite's DATETIME type
-            return dt_obj.strftime('%Y-%m-%d %H:%M:%S')
-        except (ValueError, TypeError):
-            continue
 
-    # If no format matched after trying all of them
-    print(f"Warning: Could not parse the date '{date_string}'. It will be stored as NULL.")
-    return None
+    Parsing is done by DateNormalizer: common ISO shapes take a hand-written fast path,
+    and passing `source_column` lets it remember which format that column uses.
+    """
+    return normalize_datetime(date_string, source_column)
 
 
-def create_unified_database(db_file):
+def create_unified_database(db_file, recreate=True):
     """
     Creates the new merged database with a unified schema designed
     to hold data from both the current ING and ABN AMRO databases.
+    With recreate=False an existing database is kept and only missing tables are added.
     """
-    if os.path.exists(db_file):
+    if recreate and os.path.exists(db_file):
         os.remove(db_file)
         print(f"--- Removed existing merged database: '{db_file}' ---")
 
     conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
-    print(f"--- Creating new unified database: '{db_file}' ---")
+    print(f"--- {'Creating new' if recreate else 'Opening'} unified database: '{db_file}' ---")
 
     # 1. Create unified_accounts table with updated schema
     cursor.execute('''
@@ -133,143 +105,692 @@ def create_unified_database(db_file):
         counterparty_name TEXT,
         counterparty_iban TEXT,
         type_code TEXT,
+        category TEXT,
+        is_internal_transfer INTEGER NOT NULL DEFAULT 0,
+        transfer_match_pk INTEGER,
         UNIQUE (transaction_id, account_id_fk)
     )''')
+    # Older merged databases get the category and transfer columns added here
+    ensure_category_column(cursor)
+    ensure_transfer_columns(cursor)
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_balances_account_timestamp ON unified_balances (account_id_fk, timestamp)")
+    create_balance_views(cursor)
+
+    # Per source table and account: how far the merge has read, for incremental merges
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS merge_watermarks (
+        source_bank TEXT NOT NULL,
+        source_table TEXT NOT NULL,
+        account_id TEXT NOT NULL,
+        last_rowid INTEGER NOT NULL,
+        last_booking_date DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (source_bank, source_table, account_id)
+    )''')
+
+    create_rollup_tables(cursor)
+    create_search_index(cursor)
 
     conn.commit()
     print("    -> Unified schema created successfully.")
     return conn, cursor
 
 
+def create_rollup_tables(cursor):
+    """
+    Creates the monthly rollup tables that pre-aggregate unified_transactions,
+    so period summaries read a few hundred rows instead of the full history.
+    """
+    # Per account, per month totals
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS unified_monthly_totals (
+        account_id_fk TEXT NOT NULL,
+        month TEXT NOT NULL,
+        total_spent REAL NOT NULL DEFAULT 0,
+        total_received REAL NOT NULL DEFAULT 0,
+        transaction_count INTEGER NOT NULL DEFAULT 0,
+        min_amount REAL,
+        max_amount REAL,
+        PRIMARY KEY (account_id_fk, month)
+    )''')
+
+    # Per account, per month, per counterparty (falls back to type_code when there is no name)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS unified_monthly_counterparty_totals (
+        account_id_fk TEXT NOT NULL,
+        month TEXT NOT NULL,
+        counterparty TEXT NOT NULL,
+        total_spent REAL NOT NULL DEFAULT 0,
+        total_received REAL NOT NULL DEFAULT 0,
+        transaction_count INTEGER NOT NULL DEFAULT 0,
+        min_amount REAL,
+        max_amount REAL,
+        PRIMARY KEY (account_id_fk, month, counterparty)
+    )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_monthly_totals_month ON unified_monthly_totals (month)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_monthly_cp_totals_month ON unified_monthly_counterparty_totals (month)")
+
+    # Remembers the last transaction already folded into the rollups
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        rollup_name TEXT PRIMARY KEY,
+        last_transaction_pk INTEGER NOT NULL DEFAULT 0
+    )''')
+
+
+def create_search_index(cursor):
+    """
+    Creates an FTS5 full-text index over the searchable text of unified_transactions.
+    The index is external-content (it stores no copy of the text) and kept in sync by triggers,
+    so merchant searches use MATCH instead of a LIKE '%...%' scan over the whole table.
+    """
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS unified_transactions_fts USING fts5(
+        description, counterparty_name, counterparty_iban,
+        content='unified_transactions', content_rowid='transaction_pk',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS unified_transactions_fts_insert AFTER INSERT ON unified_transactions BEGIN
+        INSERT INTO unified_transactions_fts (rowid, description, counterparty_name, counterparty_iban)
+        VALUES (new.transaction_pk, new.description, new.counterparty_name, new.counterparty_iban);
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS unified_transactions_fts_delete AFTER DELETE ON unified_transactions BEGIN
+        INSERT INTO unified_transactions_fts (unified_transactions_fts, rowid, description, counterparty_name,
+                                              counterparty_iban)
+        VALUES ('delete', old.transaction_pk, old.description, old.counterparty_name, old.counterparty_iban);
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS unified_transactions_fts_update
+    AFTER UPDATE OF description, counterparty_name, counterparty_iban ON unified_transactions BEGIN
+        INSERT INTO unified_transactions_fts (unified_transactions_fts, rowid, description, counterparty_name,
+                                              counterparty_iban)
+        VALUES ('delete', old.transaction_pk, old.description, old.counterparty_name, old.counterparty_iban);
+        INSERT INTO unified_transactions_fts (rowid, description, counterparty_name, counterparty_iban)
+        VALUES (new.transaction_pk, new.description, new.counterparty_name, new.counterparty_iban);
+    END''')
+
+
+def rebuild_search_index(merged_cursor):
+    """Rebuilds the full-text index from unified_transactions, e.g. after rows were loaded with triggers off."""
+    merged_cursor.execute("INSERT INTO unified_transactions_fts (unified_transactions_fts) VALUES ('rebuild')")
+
+
+def update_spending_rollups(merged_cursor):
+    """
+    Folds only the transactions merged since the last run into the monthly rollup tables.
+    Existing rollup rows are updated in place (sum, count, min, max), new months are inserted.
+    """
+    print("\n--- Updating monthly spending rollups ---")
+    merged_cursor.execute("SELECT last_transaction_pk FROM rollup_state WHERE rollup_name = 'monthly'")
+    row = merged_cursor.fetchone()
+    last_pk = row[0] if row else 0
+
+    merged_cursor.execute("SELECT MAX(transaction_pk) FROM unified_transactions")
+    max_pk = merged_cursor.fetchone()[0]
+    if max_pk is None or max_pk <= last_pk:
+        print("    -> No new transactions to roll up.")
+        return
+
+    merged_cursor.execute('''
+    INSERT INTO unified_monthly_totals
+    (account_id_fk, month, total_spent, total_received, transaction_count, min_amount, max_amount)
+    SELECT account_id_fk, strftime('%Y-%m', booking_date),
+           SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END),
+           SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+           COUNT(*), MIN(amount), MAX(amount)
+    FROM unified_transactions
+    WHERE transaction_pk > ? AND transaction_pk <= ? AND booking_date IS NOT NULL
+    GROUP BY account_id_fk, strftime('%Y-%m', booking_date)
+    ON CONFLICT (account_id_fk, month) DO UPDATE SET
+        total_spent = total_spent + excluded.total_spent,
+        total_received = total_received + excluded.total_received,
+        transaction_count = transaction_count + excluded.transaction_count,
+        min_amount = MIN(COALESCE(min_amount, excluded.min_amount), excluded.min_amount),
+        max_amount = MAX(COALESCE(max_amount, excluded.max_amount), excluded.max_amount)
+    ''', (last_pk, max_pk))
+
+    merged_cursor.execute('''
+    INSERT INTO unified_monthly_counterparty_totals
+    (account_id_fk, month, counterparty, total_spent, total_received, transaction_count, min_amount, max_amount)
+    SELECT account_id_fk, strftime('%Y-%m', booking_date), COALESCE(counterparty_name, type_code, 'Unknown'),
+           SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END),
+           SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+           COUNT(*), MIN(amount), MAX(amount)
+    FROM unified_transactions
+    WHERE transaction_pk > ? AND transaction_pk <= ? AND booking_date IS NOT NULL
+    GROUP BY account_id_fk, strftime('%Y-%m', booking_date), COALESCE(counterparty_name, type_code, 'Unknown')
+    ON CONFLICT (account_id_fk, month, counterparty) DO UPDATE SET
+        total_spent = total_spent + excluded.total_spent,
+        total_received = total_received + excluded.total_received,
+        transaction_count = transaction_count + excluded.transaction_count,
+        min_amount = MIN(COALESCE(min_amount, excluded.min_amount), excluded.min_amount),
+        max_amount = MAX(COALESCE(max_amount, excluded.max_amount), excluded.max_amount)
+    ''', (last_pk, max_pk))
+
+    merged_cursor.execute('''
+    INSERT INTO rollup_state (rollup_name, last_transaction_pk) VALUES ('monthly', ?)
+    ON CONFLICT (rollup_name) DO UPDATE SET last_transaction_pk = excluded.last_transaction_pk
+    ''', (max_pk,))
+    print(f"    -> Rolled up {max_pk - last_pk} new transaction row(s).")
+
+
+# --- Row mapping ---
+# Each mapper turns one source row (as a dict) into the parameter tuple for the matching insert below.
+# They are shared by the row-by-row merge and the parallel merge workers.
+
+ING_ACCOUNT_INSERT = '''
+INSERT INTO unified_accounts (account_id, source_bank, iban, account_holder_name, currency, product_name)
+VALUES (?, 'ING', ?, ?, ?, ?)'''
+ING_BALANCE_INSERT = '''
+INSERT INTO unified_balances (account_id_fk, source_bank, amount, currency, timestamp)
+VALUES (?, 'ING', ?, ?, ?)'''
+ING_TRANSACTION_INSERT = '''
+INSERT OR IGNORE INTO unified_transactions
+(account_id_fk, transaction_id, source_bank, amount, currency, booking_date, execution_timestamp,
+ description, counterparty_name, counterparty_iban, type_code, category)
+VALUES (?, ?, 'ING', ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+ABN_ACCOUNT_INSERT = '''
+INSERT OR IGNORE INTO unified_accounts (account_id, source_bank, iban)
+VALUES (?, 'ABN_AMRO', ?)'''
+ABN_BALANCE_INSERT = '''
+INSERT INTO unified_balances (account_id_fk, source_bank, amount, timestamp)
+VALUES (?, 'ABN_AMRO', ?, ?)'''
+ABN_TRANSACTION_INSERT = '''
+INSERT OR IGNORE INTO unified_transactions
+(account_id_fk, transaction_id, source_bank, amount, currency, booking_date, execution_timestamp,
+ description, counterparty_name, counterparty_iban, type_code, category)
+VALUES (?, ?, 'ABN_AMRO', ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def map_ing_account(data):
+    """Maps an ING accounts row to the unified_accounts columns."""
+    # If iban is missing, use the maskedPan value instead.
+    iban_value = data.get('iban') or data.get('maskedPan')
+    return data.get('resourceId'), iban_value, data.get('name'), data.get('currency'), data.get('product')
+
+
+def map_ing_balance(data):
+    """Maps an ING balances row to the unified_balances columns."""
+    return (data.get('account_resourceId'), to_float(data.get('amount')), data.get('currency') or 'EUR',
+            to_datetime_iso(data.get('lastChangeDateTime'), 'ing.balances.lastChangeDateTime'))
+
+
+def map_ing_transaction(data):
+    """
+    Maps an ING transactions row to the unified_transactions columns. The counterparty is the creditor
+    of a debit and the debtor of a credit.
+    """
+    description = data.get('remittanceInformationUnstructured') or data.get('transactionDetails')
+    amount = to_float(data.get('amount'))
+    party = 'creditor' if amount is not None and amount < 0 else 'debtor'
+    counterparty_name = data.get(f'{party}Name')
+    return (data.get('account_resourceId'), data.get('transactionId'), amount,
+            data.get('currency') or 'EUR',
+            to_datetime_iso(data.get('bookingDate') or data.get('transactionDate'), 'ing.transactions.bookingDate'),
+            to_datetime_iso(data.get('executionDateTime'), 'ing.transactions.executionDateTime'),
+            description, counterparty_name, data.get(f'{party}Account_iban'), data.get('transactionType'),
+            categorize(description, counterparty_name))
+
+
+def map_abn_account(data):
+    """Maps an ABN AMRO accounts row to the unified_accounts columns."""
+    return data.get('accountNumber'), data.get('accountNumber')
+
+
+def map_abn_balance(data):
+    """Maps an ABN AMRO balances row to the unified_balances columns."""
+    return (data.get('accountNumber'), to_float(data.get('balance')),
+            to_datetime_iso(data.get('sourceTransactionTimestamp'), 'abn.balances.sourceTransactionTimestamp'))
+
+
+def map_abn_transaction(data):
+    """Maps an ABN AMRO transactions row to the unified_transactions columns."""
+    return (data.get('account_iban'), data.get('transactionId'), to_float(data.get('amount')),
+            data.get('currency') or 'EUR',
+            to_datetime_iso(data.get('bookDate'), 'abn.transactions.bookDate'),
+            to_datetime_iso(data.get('transactionTimestamp'), 'abn.transactions.transactionTimestamp'),
+            data.get('description'), data.get('counterPartyName'), data.get('counterPartyAccountNumber'),
+            data.get('mutationCode'), categorize(data.get('description'), data.get('counterPartyName')))
+
+
+# (bank, source table) -> (row mapper, insert statement), in merge order
+MERGE_STEPS = {
+    ('ING', 'accounts'): (map_ing_account, ING_ACCOUNT_INSERT),
+    ('ING', 'balances'): (map_ing_balance, ING_BALANCE_INSERT),
+    ('ING', 'transactions'): (map_ing_transaction, ING_TRANSACTION_INSERT),
+    ('ABN_AMRO', 'accounts'): (map_abn_account, ABN_ACCOUNT_INSERT),
+    ('ABN_AMRO', 'balances'): (map_abn_balance, ABN_BALANCE_INSERT),
+    ('ABN_AMRO', 'transactions'): (map_abn_transaction, ABN_TRANSACTION_INSERT),
+}
+
+
+def _merge_source(source_conn, merged_cursor, bank):
+    """
+    Maps and inserts every table of one bank's database. Rows are streamed from the source
+    and written in executemany() batches, so memory use does not grow with the history size.
+    """
+    for (step_bank, table), (mapper, insert_sql) in MERGE_STEPS.items():
+        if step_bank != bank:
+            continue
+        rows = transform(iter_table(source_conn, table), map_stage(mapper))
+        write_rows(merged_cursor, insert_sql, rows)
+
+
 def merge_ing_data(ing_conn, merged_cursor):
     """Reads data from the ING database, maps it, and inserts it into the merged database."""
     print("\n--- Merging data from ING ---")
-    ing_conn.row_factory = sqlite3.Row  # Allows accessing columns by name
-    ing_cursor = ing_conn.cursor()
-
-    # 1. Merge accounts with new logic
-    ing_cursor.execute("SELECT * FROM accounts")
-    for row in ing_cursor.fetchall():
-        data = dict(row)
-        # If iban is missing, use the maskedPan value instead.
-        iban_value = data.get('iban') or data.get('maskedPan')
-
-        merged_cursor.execute('''
-        INSERT INTO unified_accounts 
-        (account_id, source_bank, iban, account_holder_name, currency, product_name) 
-        VALUES (:resourceId, 'ING', :iban, :name, :currency, :product)
-        ''', {**data, 'iban': iban_value})
-
-    # 2. Merge balances
-    ing_cursor.execute("SELECT * FROM balances")
-    for row in ing_cursor.fetchall():
-        data = dict(row)
-        data['amount'] = to_float(data.get('amount'))
-        data['currency'] = data.get('currency') or 'EUR'
-        # Parse and standardize the timestamp
-        data['timestamp'] = to_datetime_iso(data.get('lastChangeDateTime'))
-
-        merged_cursor.execute('''
-        INSERT INTO unified_balances 
-        (account_id_fk, source_bank, amount, currency, timestamp) 
-        VALUES (:account_resourceId, 'ING', :amount, :currency, :timestamp)
-        ''', data)
-
-    # 3. Merge transactions with updated fields
-    ing_cursor.execute("SELECT * FROM transactions")
-    for row in ing_cursor.fetchall():
-        data = dict(row)
-        data['amount'] = to_float(data.get('amount'))
-        data['description'] = data.get('remittanceInformationUnstructured') or data.get('transactionDetails')
-        data['currency'] = data.get('currency') or 'EUR'
-        # Parse and standardize date fields
-        data['booking_date'] = to_datetime_iso(data.get('bookingDate') or data.get('transactionDate'))
-        data['execution_timestamp'] = to_datetime_iso(data.get('executionDateTime'))
-
-        merged_cursor.execute('''
-        INSERT OR IGNORE INTO unified_transactions 
-        (account_id_fk, transaction_id, source_bank, amount, currency, booking_date, execution_timestamp, 
-         description, type_code) 
-        VALUES (:account_resourceId, :transactionId, 'ING', :amount, :currency, :booking_date, :execution_timestamp, 
-         :description, :transactionType)
-        ''', data)
-
+    _merge_source(ing_conn, merged_cursor, 'ING')
     print("    -> ING data merged successfully.")
 
 
 def merge_abn_data(abn_conn, merged_cursor):
     """Reads data from the new ABN AMRO database schema, maps it, and inserts it."""
     print("\n--- Merging data from ABN AMRO ---")
-    abn_conn.row_factory = sqlite3.Row
-    abn_cursor = abn_conn.cursor()
-
-    # 1. Merge accounts into the new simplified table
-    abn_cursor.execute("SELECT * FROM accounts")
-    for row in abn_cursor.fetchall():
-        merged_cursor.execute('''
-        INSERT OR IGNORE INTO unified_accounts (account_id, source_bank, iban) 
-        VALUES (:accountNumber, 'ABN_AMRO', :accountNumber)
-        ''', dict(row))
-
-    # 2. Merge balances
-    abn_cursor.execute("SELECT * FROM balances")
-    for row in abn_cursor.fetchall():
-        data = dict(row)
-        data['balance'] = to_float(data.get('balance'))
-        # Parse and standardize the timestamp
-        data['timestamp'] = to_datetime_iso(data.get('sourceTransactionTimestamp'))
-
-        merged_cursor.execute('''
-        INSERT INTO unified_balances 
-        (account_id_fk, source_bank, amount, timestamp) 
-        VALUES (:accountNumber, 'ABN_AMRO', :balance, :timestamp)
-        ''', data)
-
-    # 3. Merge transactions with updated fields
-    abn_cursor.execute("SELECT * FROM transactions")
-    for row in abn_cursor.fetchall():
-        data = dict(row)
-        data['amount'] = to_float(data.get('amount'))
-        data['currency'] = data.get('currency') or 'EUR'
-        # Parse and standardize date fields
-        data['booking_date'] = to_datetime_iso(data.get('bookDate'))
-        data['execution_timestamp'] = to_datetime_iso(data.get('transactionTimestamp'))
-
-        merged_cursor.execute('''
-        INSERT OR IGNORE INTO unified_transactions 
-        (account_id_fk, transaction_id, source_bank, amount, currency, booking_date, execution_timestamp, 
-         description, counterparty_name, counterparty_iban, type_code) 
-        VALUES (:account_iban, :transactionId, 'ABN_AMRO', :amount, :currency, :booking_date, :execution_timestamp, 
-         :description, :counterPartyName, :counterPartyAccountNumber, :mutationCode)
-        ''', data)
+    _merge_source(abn_conn, merged_cursor, 'ABN_AMRO')
+    print("    -> ABN AMRO data merged successfully.")
+
 
+def plan_parallel_tasks(source_db_files, chunk_rows=PARALLEL_CHUNK_ROWS):
+    """
+    Splits every source table into rowid ranges of about `chunk_rows` rows.
+    Tasks are returned in merge order, so results can be written deterministically.
+    """
+    tasks = []
+    for bank, table in MERGE_STEPS:
+        db_file = source_db_files[bank]
+        with sqlite3.connect(db_file) as conn:
+            first_rowid, last_rowid = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+        if first_rowid is None:
+            continue
+        for start in range(first_rowid, last_rowid + 1, chunk_rows):
+            tasks.append((bank, table, db_file, start, min(start + chunk_rows - 1, last_rowid)))
+    return tasks
+
+
+def transform_chunk(task):
+    """
+    Worker process: reads one rowid range of a source table and maps it to unified rows.
+    Returns the batch of parameter tuples; the writer inserts it.
+    """
+    bank, table, db_file, first_rowid, last_rowid = task
+    mapper, _ = MERGE_STEPS[(bank, table)]
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(f"SELECT * FROM {table} WHERE rowid BETWEEN ? AND ? ORDER BY rowid",
+                            (first_rowid, last_rowid))
+        return bank, table, [mapper(dict(row)) for row in rows]
+    finally:
+        conn.close()
+
+
+def transform_chunks(tasks, workers=PARALLEL_WORKERS, max_pending=None):
+    """
+    Runs transform_chunk on every task in a process pool and yields the results in task order.
+    At most `max_pending` chunks (default: twice the workers) are submitted ahead of the consumer,
+    so finished batches do not pile up in memory when the writer is slower than the workers.
+    """
+    max_pending = max_pending or workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for task in tasks:
+                pending.append(pool.submit(transform_chunk, task))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def parallel_merge(merged_conn, source_db_files, workers=PARALLEL_WORKERS):
+    """
+    Maps all source tables in a process pool and bulk-inserts the batches from this
+    (single) writer connection. Batches are consumed in task order while later chunks
+    are still being transformed, so the result is identical to the row-by-row merge.
+    """
+    tasks = plan_parallel_tasks(source_db_files)
+    print(f"\n--- Parallel merge: {len(tasks)} chunk(s) across {workers} worker(s) ---")
+    for bank, table, batch in transform_chunks(tasks, workers):
+        merged_conn.executemany(MERGE_STEPS[(bank, table)][1], batch)
+        print(f"    -> {bank} {table}: wrote {len(batch)} row(s)")
+    print("    -> Parallel merge finished.")
+
+
+# --- Incremental merge ---
+
+# (bank, source table) -> (account column in the source table, insert used by the incremental merge,
+#                          unified table and date column used for the booking-date watermark)
+INCREMENTAL_STEPS = {
+    ('ING', 'accounts'): ('resourceId', ING_ACCOUNT_INSERT + '''
+        ON CONFLICT (account_id) DO UPDATE SET iban = excluded.iban,
+            account_holder_name = excluded.account_holder_name, currency = excluded.currency,
+            product_name = excluded.product_name''', None),
+    # Balance snapshots are only added when that exact snapshot is not stored yet, because the
+    # loaders re-insert (ING) or replace (ABN AMRO) unchanged balances on every import.
+    ('ING', 'balances'): ('account_resourceId', '''
+        WITH snapshot (account_id, amount, currency, timestamp) AS (VALUES (?, ?, ?, ?))
+        INSERT INTO unified_balances (account_id_fk, source_bank, amount, currency, timestamp)
+        SELECT account_id, 'ING', amount, currency, timestamp FROM snapshot
+        WHERE NOT EXISTS (SELECT 1 FROM unified_balances b WHERE b.account_id_fk = snapshot.account_id
+                          AND b.timestamp IS snapshot.timestamp AND b.amount IS snapshot.amount)''',
+                          ('unified_balances', 'timestamp')),
+    ('ING', 'transactions'): ('account_resourceId', ING_TRANSACTION_INSERT,
+                              ('unified_transactions', 'booking_date')),
+    ('ABN_AMRO', 'accounts'): ('accountNumber', ABN_ACCOUNT_INSERT, None),
+    ('ABN_AMRO', 'balances'): ('accountNumber', '''
+        WITH snapshot (account_id, amount, timestamp) AS (VALUES (?, ?, ?))
+        INSERT INTO unified_balances (account_id_fk, source_bank, amount, timestamp)
+        SELECT account_id, 'ABN_AMRO', amount, timestamp FROM snapshot
+        WHERE NOT EXISTS (SELECT 1 FROM unified_balances b WHERE b.account_id_fk = snapshot.account_id
+                          AND b.timestamp IS snapshot.timestamp AND b.amount IS snapshot.amount)''',
+                               ('unified_balances', 'timestamp')),
+    ('ABN_AMRO', 'transactions'): ('account_iban', ABN_TRANSACTION_INSERT,
+                                   ('unified_transactions', 'booking_date')),
+}
+
+
+def read_source_bounds(source_db_files):
+    """
+    Returns {(bank, table): {account_id: max rowid}} for every source table.
+    Taken before merging, these bound what a merge run reads and become the new watermarks.
+    """
+    bounds = {}
+    for (bank, table), (account_column, _, _) in INCREMENTAL_STEPS.items():
+        with sqlite3.connect(source_db_files[bank]) as conn:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                  (table,)).fetchone()
+            rows = conn.execute(
+                f'SELECT "{account_column}", MAX(rowid) FROM {table} GROUP BY "{account_column}"'
+            ).fetchall() if exists else []
+        bounds[(bank, table)] = {account: max_rowid for account, max_rowid in rows if account is not None}
+    return bounds
+
+
+def load_watermarks(merged_cursor):
+    """Returns {(bank, table): {account_id: last merged rowid}}."""
+    merged_cursor.execute("SELECT source_bank, source_table, account_id, last_rowid FROM merge_watermarks")
+    watermarks = {}
+    for bank, table, account, last_rowid in merged_cursor.fetchall():
+        watermarks.setdefault((bank, table), {})[account] = last_rowid
+    return watermarks
+
+
+def store_watermarks(merged_cursor, bounds):
+    """Saves the source bounds of this run as the new per-source, per-account watermarks."""
+    for (bank, table), accounts in bounds.items():
+        date_source = INCREMENTAL_STEPS[(bank, table)][2]
+        for account, last_rowid in accounts.items():
+            last_date = None
+            if date_source:
+                unified_table, date_column = date_source
+                merged_cursor.execute(f"SELECT MAX({date_column}) FROM {unified_table} "
+                                      f"WHERE account_id_fk = ? AND source_bank = ?", (account, bank))
+                last_date = merged_cursor.fetchone()[0]
+            merged_cursor.execute('''
+            INSERT INTO merge_watermarks
+            (source_bank, source_table, account_id, last_rowid, last_booking_date, updated_at)
+            VALUES (?, ?, ?, ?, ?, datetime('now'))
+            ON CONFLICT (source_bank, source_table, account_id) DO UPDATE SET
+                last_rowid = excluded.last_rowid, last_booking_date = excluded.last_booking_date,
+                updated_at = excluded.updated_at
+            ''', (bank, table, account, last_rowid, last_date))
+
+
+def incremental_merge(merged_conn, source_db_files, bounds):
+    """
+    Merges only the source rows added since the last run: for each source table and account,
+    rows with a rowid past that account's watermark and up to this run's bound.
+    Transactions keep the UNIQUE (transaction_id, account_id_fk) dedupe.
+    """
+    merged_cursor = merged_conn.cursor()
+    watermarks = load_watermarks(merged_cursor)
+
+    for (bank, table), (account_column, insert_sql, _) in INCREMENTAL_STEPS.items():
+        mapper = MERGE_STEPS[(bank, table)][0]
+        table_bounds = bounds[(bank, table)]
+        table_marks = watermarks.get((bank, table), {})
+        if not table_bounds:
+            continue
+        lowest_mark = min(table_marks.get(account, 0) for account in table_bounds)
+        highest_bound = max(table_bounds.values())
+
+        source_conn = sqlite3.connect(source_db_files[bank])
+        source_conn.row_factory = sqlite3.Row
+        try:
+            rows = iter_rows(source_conn.cursor(), f"SELECT rowid AS source_rowid, * FROM {table} "
+                                                   f"WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+                             (lowest_mark, highest_bound))
+            rows = transform(
+                rows,
+                filter_stage(lambda row: table_marks.get(row[account_column], 0) < row['source_rowid']
+                             <= table_bounds.get(row[account_column], 0)),
+                map_stage(lambda row: mapper(dict(row))))
+            merged = write_rows(merged_cursor, insert_sql, rows)
+        finally:
+            source_conn.close()
+        print(f"    -> {bank} {table}: {merged} new row(s) past the watermark")
+
+
+def incremental_sync(merged_db, source_db_files):
+    """
+    Brings an existing (or new) unified database up to date with the rows added to the source databases
+    since the last run, including the rollups, transfer flags, balance compaction and categories,
+    all in one transaction.
+    """
+    merged_conn = None
+    try:
+        merged_conn, merged_curs = create_unified_database(merged_db, recreate=False)
+        bounds = read_source_bounds(source_db_files)
+        print("\n--- Incremental merge since the last watermarks ---")
+        incremental_merge(merged_conn, source_db_files, bounds)
+        update_spending_rollups(merged_curs)
+        match_internal_transfers(merged_curs)
+        compact_balances(merged_curs)
+        store_watermarks(merged_curs, bounds)
+        # Older rows may have been categorized with older rules; bring only the affected ones up to date
+        recategorize(merged_conn)
+        merged_conn.commit()
+    finally:
+        if merged_conn: merged_conn.close()
+
+
+def apply_bulk_load_pragmas(conn):
+    """
+    Tunes the connection for a one-off bulk load into a freshly created database.
+    Durability is relaxed because a failed merge is simply re-run from the source databases.
+    """
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -200000")  # ~200 MB page cache
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+
+
+def register_conversion_functions(conn):
+    """Registers the Python conversion helpers as SQLite functions for use inside INSERT ... SELECT."""
+    conn.create_function('to_float', 1, to_float, deterministic=True)
+    conn.create_function('to_datetime_iso', 1, to_datetime_iso, deterministic=True)
+    # Two-argument form: to_datetime_iso(value, 'schema.table.column') enables per-column format caching
+    conn.create_function('to_datetime_iso', 2, to_datetime_iso, deterministic=True)
+    conn.create_function('categorize', 2, categorize, deterministic=True)
+
+
+def _source_column(conn, schema, table, column, fallback='NULL'):
+    """
+    Returns a quoted reference to a column of an attached source table, or `fallback`
+    when the dynamically discovered source schema does not have that column.
+    """
+    columns = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info('{table}')")}
+    return f'"{column}"' if column in columns else fallback
+
+
+def attach_source_databases(merged_conn, ing_db_file, abn_db_file):
+    """Attaches both bank databases to the merged connection as the schemas 'ing' and 'abn'."""
+    merged_conn.execute("ATTACH DATABASE ? AS ing", (ing_db_file,))
+    merged_conn.execute("ATTACH DATABASE ? AS abn", (abn_db_file,))
+
+
+def bulk_merge_ing_data(merged_conn):
+    """
+    Set-based version of merge_ing_data: each table is moved with a single INSERT ... SELECT
+    from the attached 'ing' schema, so no source rows pass through Python.
+    """
+    print("\n--- Bulk merging data from ING ---")
+    col = lambda table, column: _source_column(merged_conn, 'ing', table, column)
+
+    merged_conn.execute(f'''
+    INSERT INTO unified_accounts
+    (account_id, source_bank, iban, account_holder_name, currency, product_name)
+    SELECT resourceId, 'ING', COALESCE(NULLIF({col('accounts', 'iban')}, ''), {col('accounts', 'maskedPan')}),
+           {col('accounts', 'name')}, {col('accounts', 'currency')}, {col('accounts', 'product')}
+    FROM ing.accounts
+    ''')
+
+    merged_conn.execute(f'''
+    INSERT INTO unified_balances
+    (account_id_fk, source_bank, amount, currency, timestamp)
+    SELECT account_resourceId, 'ING', to_float({col('balances', 'amount')}),
+           COALESCE(NULLIF({col('balances', 'currency')}, ''), 'EUR'),
+           to_datetime_iso({col('balances', 'lastChangeDateTime')}, 'ing.balances.lastChangeDateTime')
+    FROM ing.balances
+    ''')
+
+    merged_conn.execute(f'''
+    INSERT OR IGNORE INTO unified_transactions
+    (account_id_fk, transaction_id, source_bank, amount, currency, booking_date, execution_timestamp,
+     description, counterparty_name, counterparty_iban, type_code, category)
+    SELECT account_resourceId, transactionId, 'ING', amount, currency, booking_date, execution_timestamp,
+           description,
+           CASE WHEN amount < 0 THEN creditor_name ELSE debtor_name END,
+           CASE WHEN amount < 0 THEN creditor_iban ELSE debtor_iban END,
+           type_code, categorize(description, CASE WHEN amount < 0 THEN creditor_name ELSE debtor_name END)
+    FROM (
+        SELECT account_resourceId, {col('transactions', 'transactionId')} AS transactionId,
+               to_float({col('transactions', 'amount')}) AS amount,
+               COALESCE(NULLIF({col('transactions', 'currency')}, ''), 'EUR') AS currency,
+               to_datetime_iso(COALESCE(NULLIF({col('transactions', 'bookingDate')}, ''),
+                                        {col('transactions', 'transactionDate')}),
+                               'ing.transactions.bookingDate') AS booking_date,
+               to_datetime_iso({col('transactions', 'executionDateTime')},
+                               'ing.transactions.executionDateTime') AS execution_timestamp,
+               COALESCE(NULLIF({col('transactions', 'remittanceInformationUnstructured')}, ''),
+                        {col('transactions', 'transactionDetails')}) AS description,
+               {col('transactions', 'creditorName')} AS creditor_name,
+               {col('transactions', 'creditorAccount_iban')} AS creditor_iban,
+               {col('transactions', 'debtorName')} AS debtor_name,
+               {col('transactions', 'debtorAccount_iban')} AS debtor_iban,
+               {col('transactions', 'transactionType')} AS type_code
+        FROM ing.transactions
+        ORDER BY rowid
+    )
+    ''')
+    print("    -> ING data merged successfully.")
+
+
+def bulk_merge_abn_data(merged_conn):
+    """Set-based version of merge_abn_data, reading from the attached 'abn' schema."""
+    print("\n--- Bulk merging data from ABN AMRO ---")
+    col = lambda table, column: _source_column(merged_conn, 'abn', table, column)
+
+    merged_conn.execute('''
+    INSERT OR IGNORE INTO unified_accounts (account_id, source_bank, iban)
+    SELECT accountNumber, 'ABN_AMRO', accountNumber FROM abn.accounts
+    ''')
+
+    merged_conn.execute(f'''
+    INSERT INTO unified_balances
+    (account_id_fk, source_bank, amount, timestamp)
+    SELECT accountNumber, 'ABN_AMRO', to_float({col('balances', 'balance')}),
+           to_datetime_iso({col('balances', 'sourceTransactionTimestamp')}, 'abn.balances.sourceTransactionTimestamp')
+    FROM abn.balances
+    ''')
+
+    merged_conn.execute(f'''
+    INSERT OR IGNORE INTO unified_transactions
+    (account_id_fk, transaction_id, source_bank, amount, currency, booking_date, execution_timestamp,
+     description, counterparty_name, counterparty_iban, type_code, category)
+    SELECT account_iban, {col('transactions', 'transactionId')}, 'ABN_AMRO', to_float({col('transactions', 'amount')}),
+           COALESCE(NULLIF({col('transactions', 'currency')}, ''), 'EUR'),
+           to_datetime_iso({col('transactions', 'bookDate')}, 'abn.transactions.bookDate'),
+           to_datetime_iso({col('transactions', 'transactionTimestamp')}, 'abn.transactions.transactionTimestamp'),
+           {col('transactions', 'description')}, {col('transactions', 'counterPartyName')},
+           {col('transactions', 'counterPartyAccountNumber')}, {col('transactions', 'mutationCode')},
+           categorize({col('transactions', 'description')}, {col('transactions', 'counterPartyName')})
+    FROM abn.transactions
+    ORDER BY rowid
+    ''')
     print("    -> ABN AMRO data merged successfully.")
 
 
+def merge_databases(merged_db, source_db_files, merge_mode=MERGE_MODE):
+    """
+    Builds the unified database from the source databases with the given merge mode
+    ('row', 'bulk', 'parallel' or 'incremental'), including the rollups, transfer flags,
+    balance compaction, watermarks and rule versions.
+    """
+    if merge_mode == 'incremental':
+        incremental_sync(merged_db, source_db_files)
+        return
+
+    merged_conn, ing_connection, abn_connection = None, None, None
+    try:
+        merged_conn, merged_curs = create_unified_database(merged_db)
+        source_bounds = read_source_bounds(source_db_files)
+
+        if merge_mode == 'bulk':
+            apply_bulk_load_pragmas(merged_conn)
+            register_conversion_functions(merged_conn)
+            attach_source_databases(merged_conn, source_db_files['ING'], source_db_files['ABN_AMRO'])
+            # Both sources, the rollups and the rule versions are written in one transaction
+            bulk_merge_ing_data(merged_conn)
+            bulk_merge_abn_data(merged_conn)
+        elif merge_mode == 'parallel':
+            apply_bulk_load_pragmas(merged_conn)
+            parallel_merge(merged_conn, source_db_files)
+        else:
+            ing_connection = sqlite3.connect(source_db_files['ING'])
+            abn_connection = sqlite3.connect(source_db_files['ABN_AMRO'])
+            merge_ing_data(ing_connection, merged_curs)
+            merge_abn_data(abn_connection, merged_curs)
+
+        update_spending_rollups(merged_curs)
+        match_internal_transfers(merged_curs)
+        compact_balances(merged_curs)
+        # Later incremental runs continue from here
+        store_watermarks(merged_curs, source_bounds)
+        # Remember which rule versions produced the categories, so rule edits only touch affected rows
+        store_rule_versions(merged_curs)
+
+        merged_conn.commit()
+    finally:
+        if ing_connection: ing_connection.close()
+        if abn_connection: abn_connection.close()
+        if merged_conn: merged_conn.close()
+
+
 if __name__ == "__main__":
+    # Usage: python DBMerger.py [row|bulk|parallel|incremental]
+    merge_mode = sys.argv[1] if len(sys.argv) > 1 else MERGE_MODE
+
     if not os.path.exists(ING_DB) or not os.path.exists(ABN_DB):
         # Create dummy files for testing if they don't exist
         print(f"--- NOTE: Creating dummy source databases for demonstration. ---")
         sqlite3.connect(ING_DB).close()
         sqlite3.connect(ABN_DB).close()
 
-    merged_conn, ing_connection, abn_connection = None, None, None
     try:
-        merged_conn, merged_curs = create_unified_database(MERGED_DB)
-        ing_connection = sqlite3.connect(ING_DB)
-        abn_connection = sqlite3.connect(ABN_DB)
-
-        merge_ing_data(ing_connection, merged_curs)
-        merge_abn_data(abn_connection, merged_curs)
-
-        merged_conn.commit()
-
+        merge_databases(MERGED_DB, {'ING': ING_DB, 'ABN_AMRO': ABN_DB}, merge_mode)
         print("\n--- Database merge complete! ---")
         print(f"All data has been merged into '{MERGED_DB}'")
 
     except sqlite3.Error as e:
         print(f"\n!!! A database error occurred: {e} !!!")
-    finally:
-        if ing_connection: ing_connection.close()
-        if abn_connection: abn_connection.close()
-        if merged_conn: merged_conn.close()
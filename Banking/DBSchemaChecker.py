@@ -1,5 +1,6 @@
 import sqlite3
 import os
+from RowPipeline import iter_rows
 
 # --- Configuration ---
 # Point the inspector to our final merged database file.
@@ -23,16 +24,13 @@ def print_db_schema(db_file):
         print(f"Schema for: {db_file}")
         print("=" * 50)
 
-        # Get a list of all tables in the database
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-
-        if not tables:
-            print(" -> No tables found in this database.")
-            return
+        # Stream the list of tables; a second cursor is used for the per-table PRAGMA
+        tables = iter_rows(conn.cursor(), "SELECT name FROM sqlite_master WHERE type='table';")
+        found_tables = False
 
         # For each table, get and print its column information
         for table_name_tuple in tables:
+            found_tables = True
             table_name = table_name_tuple[0]
             # Skip the internal sqlite_sequence table for a cleaner output
             if table_name == 'sqlite_sequence':
@@ -41,8 +39,7 @@ def print_db_schema(db_file):
             print(f"\n--- Table: {table_name} ---")
 
             # Use PRAGMA to get table info (column details)
-            cursor.execute(f"PRAGMA table_info('{table_name}');")
-            columns = cursor.fetchall()
+            columns = iter_rows(cursor, f"PRAGMA table_info('{table_name}');")
 
             # Print each column's name and data type
             for column in columns:
@@ -51,6 +48,9 @@ def print_db_schema(db_file):
                 col_type = column[2]
                 print(f"    - {col_name} ({col_type})")
 
+        if not found_tables:
+            print(" -> No tables found in this database.")
+
     except sqlite3.Error as e:
         print(f"!!! A database error occurred for '{db_file}': {e} !!!")
     finally:
@@ -0,0 +1,152 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+
+# --- Configuration ---
+# How many distinct date-only strings ('YYYY-MM-DD') are memoized.
+DATE_ONLY_CACHE_SIZE = 8192
+
+# List of common date/time formats to try parsing, in order
+FORMATS_TO_TRY = [
+    '%Y-%m-%dT%H:%M:%S.%f%z',  # ISO 8601 with microseconds and timezone
+    '%Y-%m-%dT%H:%M:%S%z',  # ISO 8601 with timezone
+    '%Y-%m-%dT%H:%M:%S.%f',  # ISO 8601 with microseconds, no timezone
+    '%Y-%m-%dT%H:%M:%S',  # ISO 8601, no microseconds or timezone
+    '%Y-%m-%d %H:%M:%S.%f',  # Space separator with microseconds
+    '%Y-%m-%d %H:%M:%S',  # Space separator
+    '%Y-%m-%d',  # Date only
+]
+
+# The shapes that strptime would accept with one of the formats above, plus the ABN AMRO
+# 'YYYY-MM-DD-HH:MM:SS:ms' timestamp. Anything else goes through the full format list.
+# (Years before 1000 are left to strftime, which does not zero-pad them on every platform.)
+_FAST_PATH_RE = re.compile(
+    r"([1-9]\d{3})-(\d{2})-(\d{2})"
+    r"(?:"
+    r"T(\d{2}):(\d{2}):(\d{2})(?:\.\d{1,6})?(?:Z|[+-](\d{2}):?(\d{2}))?"  # ISO 'T', optional timezone
+    r"| (\d{2}):(\d{2}):(\d{2})(?:\.\d{1,6})?"  # space separator, no timezone
+    r"|-(\d{2}):(\d{2}):(\d{2}):\d{1,6}"  # ABN AMRO 'YYYY-MM-DD-HH:MM:SS:ms'
+    r")?"
+)
+
+
+def _preprocess(parsable_string):
+    """Rewrites the 'YYYY-MM-DD-HH:MM:SS:ms' format and a trailing 'Z' into strptime-friendly forms."""
+    # Pre-process for the specific 'YYYY-MM-DD-HH:MM:SS:ms' format.
+    if parsable_string.count(':') == 3 and parsable_string.count('-') == 3:
+        parts = parsable_string.split('-')
+        if len(parts) == 4:
+            date_part = '-'.join(parts[:3])
+            # Replace the last colon in the time part with a period
+            time_part_fixed = '.'.join(parts[3].rsplit(':', 1))
+            parsable_string = f"{date_part} {time_part_fixed}"
+
+    # Clean the string for parsing: handle 'Z' for UTC
+    if parsable_string.endswith('Z'):
+        parsable_string = parsable_string[:-1] + '+0000'
+    return parsable_string
+
+
+def parse_with_formats(date_string, preferred_format=None):
+    """
+    The general (slow) path: tries every format in FORMATS_TO_TRY with strptime,
+    starting with `preferred_format` when one is known for the column.
+
+    Returns:
+        tuple: (normalized string or None, the format that matched or None)
+    """
+    if not date_string:
+        return None, None
+    parsable_string = _preprocess(str(date_string))
+    formats = FORMATS_TO_TRY
+    if preferred_format:
+        formats = [preferred_format] + [f for f in FORMATS_TO_TRY if f != preferred_format]
+
+    for fmt in formats:
+        try:
+            dt_obj = datetime.strptime(parsable_string, fmt)
+            return dt_obj.strftime('%Y-%m-%d %H:%M:%S'), fmt
+        except (ValueError, TypeError):
+            continue
+    return None, None
+
+
+@lru_cache(maxsize=DATE_ONLY_CACHE_SIZE)
+def _normalize_date_only(date_string):
+    """Memoized conversion of 'YYYY-MM-DD'. Bank feeds repeat the same booking dates many times."""
+    year, month, day = int(date_string[:4]), int(date_string[5:7]), int(date_string[8:10])
+    datetime(year, month, day)  # Validates the calendar date, raises ValueError like strptime would
+    return f"{date_string} 00:00:00"
+
+
+def fast_parse(date_string):
+    """
+    Hand-written parser for the ISO and ABN AMRO shapes the bank feeds actually use.
+    Produces exactly what parse_with_formats would, or returns None when the string
+    is not one of those shapes (or not a valid date), so the caller can fall back.
+    One deliberate difference: negative '-HH:MM' offsets are parsed, where the ABN AMRO
+    pre-processing in parse_with_formats mistakes them for a millisecond suffix.
+    """
+    if len(date_string) == 10:
+        try:
+            return _normalize_date_only(date_string) if _FAST_PATH_RE.fullmatch(date_string) else None
+        except ValueError:
+            return None
+
+    match = _FAST_PATH_RE.fullmatch(date_string)
+    if not match:
+        return None
+    g = match.groups()
+    hour, minute, second = next((g[i], g[i + 1], g[i + 2]) for i in (3, 8, 11) if g[i] is not None)
+    # strptime rejects UTC offsets of 24 hours or more
+    if g[6] is not None and (int(g[6]) > 23 or int(g[7]) > 59):
+        return None
+    try:
+        datetime(int(g[0]), int(g[1]), int(g[2]), int(hour), int(minute), int(second))
+    except ValueError:
+        return None
+    return f"{g[0]}-{g[1]}-{g[2]} {hour}:{minute}:{second}"
+
+
+class DateNormalizer:
+    """
+    Converts bank date strings to 'YYYY-MM-DD HH:MM:SS'.
+
+    Common ISO shapes take a hand-written fast path; anything else falls back to strptime,
+    trying first the format that last worked for the same source column.
+    """
+
+    def __init__(self):
+        self._column_formats = {}
+
+    def normalize(self, date_string, column=None):
+        """Normalizes one value. Returns None (with a warning) if it cannot be parsed."""
+        if not date_string:
+            return None
+        if isinstance(date_string, str):
+            result = fast_parse(date_string)
+            if result is not None:
+                return result
+
+        result, fmt = parse_with_formats(date_string, self._column_formats.get(column))
+        if result is None:
+            print(f"Warning: Could not parse the date '{date_string}'. It will be stored as NULL.")
+        elif column is not None:
+            self._column_formats[column] = fmt
+        return result
+
+    def normalize_column(self, values, column=None):
+        """
+        Normalizes a whole column at once. Each distinct value is parsed only once,
+        which pays off for booking dates that repeat across many transactions.
+        """
+        converted = {value: self.normalize(value, column) for value in dict.fromkeys(values)}
+        return [converted[value] for value in values]
+
+
+_default_normalizer = DateNormalizer()
+
+
+def normalize_datetime(date_string, column=None):
+    """Module-level shortcut using a shared DateNormalizer (and its per-column format cache)."""
+    return _default_normalizer.normalize(date_string, column)
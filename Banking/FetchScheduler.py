@@ -0,0 +1,98 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration ---
+# Tokens (customers) fetched at the same time, per bank
+TOKEN_WORKERS = 8
+# Accounts of one token fetched at the same time
+ACCOUNT_WORKERS = 4
+# Results (e.g. pages of records) one streaming call may produce ahead of the consumer
+BUFFERED_RESULTS = 8
+
+# Put after a streaming call's last result
+END_OF_STREAM = object()
+
+
+def fetch_concurrently(func, items, workers=TOKEN_WORKERS, max_pending=None):
+    """
+    Calls `func` on every item from a thread pool and yields the results in the order of `items`,
+    whatever order the calls finish in, so every run produces the same output for the same responses.
+    At most `max_pending` calls (default: twice the workers) are submitted ahead of the consumer,
+    so a slow consumer (e.g. the database writer) does not make finished results pile up in memory.
+    How many requests actually run at once and how fast is enforced per bank by HttpClient.
+    An exception raised by a call is re-raised when its result is reached; calls not yet started are cancelled.
+    """
+    max_pending = max_pending or workers * 2
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _put(buffer, entry, stop):
+    """Puts an entry into a bounded buffer, giving up once `stop` is set. Returns whether it was put."""
+    while not stop.is_set():
+        try:
+            buffer.put(entry, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce(func, item, buffer, stop):
+    """Runs the generator `func(item)` into `buffer`, followed by END_OF_STREAM or the exception it raised."""
+    try:
+        for result in func(item):
+            if not _put(buffer, result, stop):
+                return
+        _put(buffer, END_OF_STREAM, stop)
+    except Exception as e:
+        _put(buffer, e, stop)
+
+
+def _drain(buffer):
+    """Yields one call's results from its buffer; re-raises the exception the call ended with."""
+    while True:
+        entry = buffer.get()
+        if entry is END_OF_STREAM:
+            return
+        if isinstance(entry, Exception):
+            raise entry
+        yield entry
+
+
+def stream_concurrently(func, items, workers=TOKEN_WORKERS, max_pending=None, buffered=BUFFERED_RESULTS):
+    """
+    The streaming form of fetch_concurrently, for calls that yield their results piece by piece (e.g. page by page).
+    `func(item)` must return a generator; the generators of several items run at once, and their results are
+    yielded flattened in the order of `items` and, per item, in the order produced. Results of the item being
+    consumed are passed on as soon as they arrive; items further ahead may buffer up to `buffered` results
+    each before they wait for the consumer. When the consumer stops early, the running calls are stopped too.
+    """
+    max_pending = max_pending or workers * 2
+    stop = threading.Event()
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for item in items:
+                buffer = queue.Queue(buffered)
+                pending.append((executor.submit(_produce, func, item, buffer, stop), buffer))
+                if len(pending) >= max_pending:
+                    yield from _drain(pending.popleft()[1])
+            while pending:
+                yield from _drain(pending.popleft()[1])
+        finally:
+            stop.set()
+            for future, _ in pending:
+                future.cancel()
@@ -0,0 +1,186 @@
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from Resilience import RetryState, RETRY_STATUSES, REQUEST_DEADLINE
+
+# --- Configuration ---
+# Keep-alive connections kept open per host; with POOL_BLOCK a request waits for a free connection
+# instead of opening (and handshaking) an extra one that is thrown away afterwards
+POOL_MAXSIZE = 10
+POOL_BLOCK = True
+
+# Per bank: sustained requests per second, burst size, and the most requests in flight at once.
+# The limits hold for all threads sharing the bank's session.
+RATE_LIMITS = {
+    'ING': (10, 20, POOL_MAXSIZE),
+    'ABN_AMRO': (10, 20, POOL_MAXSIZE),
+}
+DEFAULT_RATE_LIMIT = (5, 10, POOL_MAXSIZE)
+
+# Seconds to wait for the connection (including the TLS handshake), and for each read of the response
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: `rate` tokens are added per second up to `capacity`, and every request takes one.
+    Short bursts up to `capacity` go through at once; sustained traffic is held to `rate` requests per second.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token if one is available and returns 0, otherwise returns the seconds until one will be."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        wait = self.reserve()
+        while wait:
+            time.sleep(wait)
+            wait = self.reserve()
+
+
+class RequestLimiter:
+    """Context manager that admits a request once both a concurrency slot and a rate-limit token are free."""
+
+    def __init__(self, rate, burst, max_concurrent):
+        self.bucket = TokenBucket(rate, burst)
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+
+    def __enter__(self):
+        self.slots.acquire()
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self.slots.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self.slots.release()
+
+
+def create_limiter(name):
+    """The request limiter for one bank, from RATE_LIMITS."""
+    return RequestLimiter(*RATE_LIMITS.get(name, DEFAULT_RATE_LIMIT))
+
+
+def add_query(url, params):
+    """
+    Returns the URL (or path) with the given query parameters added, replacing parameters of the same name
+    it already has. Parameters whose value is None are left out.
+    """
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update({name: value for name, value in params.items() if value is not None})
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class ClientCertAdapter(HTTPAdapter):
+    """
+    Transport adapter for mutual TLS. The client certificate and key are loaded into one SSLContext
+    when the adapter is created; passing cert=(...) to requests instead makes urllib3 read and parse
+    both files again for every new connection. Requests without an explicit timeout get the default one,
+    and with a `limiter` every request first waits for its RequestLimiter.
+    Failed attempts (429, 5xx, dropped connections) are retried as decided by Resilience: with jittered
+    backoff, honouring Retry-After, within `deadline` seconds per request, and not while the host's
+    circuit breaker is open. The response of the last attempt is returned as usual.
+    """
+
+    def __init__(self, cert_file, key_file, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), limiter=None,
+                 deadline=REQUEST_DEADLINE, **kwargs):
+        self.ssl_context = ssl.create_default_context()
+        self.ssl_context.load_cert_chain(cert_file, key_file)
+        self.timeout = timeout
+        self.limiter = limiter
+        self.deadline = deadline
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
+
+    def _send_once(self, request, **kwargs):
+        if self.limiter is None:
+            return super().send(request, **kwargs)
+        with self.limiter:
+            return super().send(request, **kwargs)
+
+    def send(self, request, **kwargs):
+        timeout = kwargs.get('timeout') or self.timeout
+        retry = RetryState(request.method, request.url, self.deadline, body=request.body)
+        while True:
+            retry.before_attempt()
+            kwargs['timeout'] = retry.attempt_timeout(timeout)
+            try:
+                try:
+                    response = self._send_once(request, **kwargs)
+                except requests.exceptions.RequestException as e:
+                    delay = retry.next_delay(error=e)
+                    if delay is None:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        retry.succeeded()
+                        return response
+                    delay = retry.next_delay(response.status_code, response.headers)
+                    if delay is None:
+                        return response
+                    response.close()
+            finally:
+                retry.end_attempt()
+            # The wait happens outside the limiter, so it does not hold one of the bank's request slots
+            time.sleep(delay)
+
+
+def create_session(cert_file, key_file, pool_maxsize=POOL_MAXSIZE, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                   limiter=None):
+    """A requests.Session whose HTTPS connections present the given client certificate and are kept alive."""
+    session = requests.Session()
+    session.mount('https://', ClientCertAdapter(cert_file, key_file, timeout=timeout, limiter=limiter,
+                                                pool_connections=1, pool_maxsize=pool_maxsize, pool_block=POOL_BLOCK))
+    return session
+
+
+def get_session(name, cert_file, key_file):
+    """
+    Returns the shared session for one bank, creating it on first use. Every API call of that bank goes
+    through it, so connections (and their TLS handshakes) are reused across requests and accounts.
+    The session is safe to share between threads; requests are held to the bank's RATE_LIMITS.
+    """
+    with _sessions_lock:
+        if name not in _sessions:
+            _sessions[name] = create_session(cert_file, key_file, limiter=create_limiter(name))
+        return _sessions[name]
+
+
+def close_sessions():
+    """Closes every shared session and its pooled connections."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
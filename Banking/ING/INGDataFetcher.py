@@ -1,14 +1,19 @@
 import requests
-import json
-import csv
 import os
 import uuid
 import base64
 import hashlib
+import threading
 from datetime import datetime, timezone
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from INGtoDB import payload_to_records
+from RowPipeline import checkpoint_record
+from JsonStream import write_ndjson
+from HttpClient import get_session, add_query
+from FetchScheduler import fetch_concurrently, stream_concurrently, TOKEN_WORKERS, ACCOUNT_WORKERS
+from INGTokenStore import TokenStore, refresh_due_tokens
 
 # --- ING Sandbox Configuration ---
 # These are placeholder values. Replace them with your actual credentials.
@@ -16,19 +21,78 @@ CLIENT_ID = "YOUR_CLIENT_ID"
 CERTIFICATE_SERIAL_NUMBER = "YOUR_SN"
 REDIRECT_URI = "https://www.example.com/"
 SANDBOX_HOST = "https://api.sandbox.ing.com"
-TOKEN_CSV_FILE = 'ing_tokens.csv'
-DATA_OUTPUT_FILE = 'ing_data_output.json'
+# Newline-delimited JSON: records are appended per token as soon as its data is fetched
+DATA_OUTPUT_FILE = 'ing_data_output.ndjson'
 
 # --- Certificate Paths ---
 # Make sure these paths are correct for your local setup.
 # You will need to generate these certificate files to run the script.
-CERT_PATH = "certs/"
+# Resolved from this folder, so the scripts find them whatever directory they are run from
+ING_DIR = os.path.dirname(os.path.abspath(__file__))
+CERT_PATH = os.path.join(ING_DIR, "certs") + os.sep
 ING_SIGNING_CERT_FILE = CERT_PATH + 'example_client_signing.cer'
 ING_SIGNING_KEY_FILE = CERT_PATH + 'example_client_signing.key'
 ING_TLS_CERT = CERT_PATH + 'example_client_tls.cer'
 ING_TLS_KEY = CERT_PATH + 'example_client_tls.key'
 
 
+def ing_session():
+    """The shared keep-alive session for all ING calls, presenting the TLS client certificate."""
+    return get_session('ING', ING_TLS_CERT, ING_TLS_KEY)
+
+
+class RequestSigner:
+    """
+    Signs ING request signing strings with the client signing key. The key is read and PEM-parsed,
+    and the TPP-Signature-Certificate header value built, once on first use instead of for every request.
+    One signer can be shared by all threads: loading is guarded by a lock, and signing with a loaded
+    key needs no locking.
+    """
+
+    def __init__(self, key_file, cert_file):
+        self.key_file = key_file
+        self.cert_file = cert_file
+        self._private_key = None
+        self._certificate_header = None
+        self._lock = threading.Lock()
+
+    def _load_key(self):
+        with self._lock:
+            if self._private_key is None:
+                with open(self.key_file, "rb") as key_file:
+                    self._private_key = load_pem_private_key(key_file.read(), password=None)
+        return self._private_key
+
+    def sign(self, signing_string):
+        """Returns the base64-encoded RSA-SHA256 signature of the signing string."""
+        private_key = self._private_key or self._load_key()
+        signature_bytes = private_key.sign(signing_string.encode('utf-8'), padding.PKCS1v15(), hashes.SHA256())
+        return base64.b64encode(signature_bytes).decode('utf-8')
+
+    @property
+    def certificate_header(self):
+        """The signing certificate without PEM armour or newlines, for the TPP-Signature-Certificate header."""
+        with self._lock:
+            if self._certificate_header is None:
+                with open(self.cert_file, 'r') as f_cert:
+                    self._certificate_header = f_cert.read().replace('-----BEGIN CERTIFICATE-----', '').replace(
+                        '-----END CERTIFICATE-----', '').replace('\n', '')
+        return self._certificate_header
+
+
+_signer = None
+_signer_lock = threading.Lock()
+
+
+def get_signer():
+    """The shared signer for the configured signing key and certificate, created on first use."""
+    global _signer
+    with _signer_lock:
+        if _signer is None:
+            _signer = RequestSigner(ING_SIGNING_KEY_FILE, ING_SIGNING_CERT_FILE)
+        return _signer
+
+
 def create_ing_signature_header(method, endpoint, key_id, headers_to_sign, body_bytes=b''):
     """
     Flexible function to create the complex Signature and other required headers for ING API requests.
@@ -60,12 +124,7 @@ def create_ing_signature_header(method, endpoint, key_id, headers_to_sign, body_
             signing_string_parts.append(f"x-request-id: {request_id}")
 
     signing_string = "\n".join(signing_string_parts)
-
-    with open(ING_SIGNING_KEY_FILE, "rb") as key_file:
-        private_key = load_pem_private_key(key_file.read(), password=None)
-
-    signature_bytes = private_key.sign(signing_string.encode('utf-8'), padding.PKCS1v15(), hashes.SHA256())
-    base64_signature = base64.b64encode(signature_bytes).decode('utf-8')
+    base64_signature = get_signer().sign(signing_string)
 
     signature_header_parts = {
         'keyId': f'"{key_id}"',
@@ -85,18 +144,13 @@ def create_ing_signature_header(method, endpoint, key_id, headers_to_sign, body_
     return final_headers
 
 
-def get_application_token():
+def application_token_request():
     """
-    Connects to the ING API to acquire an Application Access Token.
-    This token is used for subsequent API calls that are not customer-specific.
+    Builds the signed client-credentials request for an Application Access Token.
 
     Returns:
-        str: The application access token.
-
-    Raises:
-        requests.exceptions.HTTPError: If the API request fails.
+        tuple: The endpoint, the headers and the form-encoded body.
     """
-    print("--- Getting a new Application Access Token (once for all refreshes) ---")
     endpoint = "/oauth2/token"
     payload = "grant_type=client_credentials&client_id=" + CLIENT_ID
     digest_header = "SHA-256=" + base64.b64encode(hashlib.sha256(payload.encode('utf-8')).digest()).decode('utf-8')
@@ -105,12 +159,8 @@ def get_application_token():
     signing_string = (f"(request-target): post {endpoint}\n"
                       f"date: {date_header}\n"
                       f"digest: {digest_header}")
-
-    with open(ING_SIGNING_KEY_FILE, "rb") as key_file:
-        private_key = load_pem_private_key(key_file.read(), password=None)
-
-    signature_bytes = private_key.sign(signing_string.encode('utf-8'), padding.PKCS1v15(), hashes.SHA256())
-    base64_signature = base64.b64encode(signature_bytes).decode('utf-8')
+    signer = get_signer()
+    base64_signature = signer.sign(signing_string)
 
     signed_headers = "(request-target) date digest"
     signature_header_parts = {
@@ -121,9 +171,7 @@ def get_application_token():
     }
     auth_header = "Signature " + ",".join([f"{k}={v}" for k, v in signature_header_parts.items()])
 
-    with open(ING_SIGNING_CERT_FILE, 'r') as f_cert:
-        tpp_cert_header = f_cert.read().replace('-----BEGIN CERTIFICATE-----', '').replace('-----END CERTIFICATE-----',
-                                                                                           '').replace('\n', '')
+    tpp_cert_header = signer.certificate_header
 
     headers = {
         'Accept': 'application/json',
@@ -133,12 +181,53 @@ def get_application_token():
         'TPP-Signature-Certificate': tpp_cert_header,
         'Authorization': auth_header
     }
+    return endpoint, headers, payload
+
+
+def refresh_token_request(app_token, refresh_token):
+    """
+    Builds the signed request that exchanges a customer's Refresh Token for a new Customer Access Token.
+
+    Returns:
+        tuple: The endpoint, the headers and the form-encoded body as bytes.
+    """
+    endpoint = "/oauth2/token"
+    body_params = {"grant_type": "refresh_token", "refresh_token": refresh_token}
+    encoded_body_bytes = "&".join([f"{k}={v}" for k, v in body_params.items()]).encode('utf-8')
+
+    headers_to_sign = ['(request-target)', 'date', 'digest']
+    headers = create_ing_signature_header("post", endpoint, CLIENT_ID, headers_to_sign, body_bytes=encoded_body_bytes)
+    headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    headers['Authorization'] = f'Bearer {app_token}'
+    return endpoint, headers, encoded_body_bytes
+
 
-    response = requests.post(f"{SANDBOX_HOST}{endpoint}", headers=headers, data=payload,
-                             cert=(ING_TLS_CERT, ING_TLS_KEY))
+def customer_request_headers(endpoint, customer_token):
+    """Signed headers for a customer GET request (accounts, balances, transactions)."""
+    headers = create_ing_signature_header("get", endpoint, CLIENT_ID,
+                                          ['(request-target)', 'date', 'digest', 'x-request-id'])
+    headers['Authorization'] = f'Bearer {customer_token}'
+    headers['Accept'] = 'application/json'
+    return headers
+
+
+def request_application_token():
+    """
+    Connects to the ING API to acquire an Application Access Token.
+    This token is used for subsequent API calls that are not customer-specific.
+
+    Returns:
+        dict: The token response, with the access_token and its expires_in.
+
+    Raises:
+        requests.exceptions.HTTPError: If the API request fails.
+    """
+    print("--- Getting a new Application Access Token (once for all refreshes) ---")
+    endpoint, headers, payload = application_token_request()
+    response = ing_session().post(f"{SANDBOX_HOST}{endpoint}", headers=headers, data=payload)
     response.raise_for_status()
     print("    -> Success!")
-    return response.json()['access_token']
+    return response.json()
 
 
 def refresh_customer_token(app_token, refresh_token):
@@ -156,146 +245,152 @@ def refresh_customer_token(app_token, refresh_token):
         requests.exceptions.HTTPError: If the API request fails.
     """
     print(f"\n--- Refreshing token: ...{refresh_token[-6:]} ---")
-    endpoint = "/oauth2/token"
-    body_params = {"grant_type": "refresh_token", "refresh_token": refresh_token}
-    encoded_body_bytes = "&".join([f"{k}={v}" for k, v in body_params.items()]).encode('utf-8')
-
-    headers_to_sign = ['(request-target)', 'date', 'digest']
-    headers = create_ing_signature_header("post", endpoint, CLIENT_ID, headers_to_sign, body_bytes=encoded_body_bytes)
-    headers['Content-Type'] = 'application/x-www-form-urlencoded'
-    headers['Authorization'] = f'Bearer {app_token}'
-
-    response = requests.post(f"{SANDBOX_HOST}{endpoint}", headers=headers, data=encoded_body_bytes,
-                             cert=(ING_TLS_CERT, ING_TLS_KEY))
+    endpoint, headers, encoded_body_bytes = refresh_token_request(app_token, refresh_token)
+    response = ing_session().post(f"{SANDBOX_HOST}{endpoint}", headers=headers, data=encoded_body_bytes)
     response.raise_for_status()
     print("    -> Success! New customer access token received.")
     return response.json()
 
 
-def fetch_data_with_token(customer_token):
+def transactions_href(account, date_from=None):
     """
-    Fetches account, balance, and transaction data using a customer access token.
+    The account's transactions link, asking only for bookings from `date_from` (YYYY-MM-DD) on when given.
+    Returns None if the account has no transactions link.
+    """
+    link = account.get('_links', {}).get('transactions')
+    if not link:
+        return None
+    return add_query(link['href'], {'dateFrom': date_from})
 
-    Args:
-        customer_token (str): The customer's valid access token.
 
-    Returns:
-        dict: A dictionary containing the fetched accounts, balances, and transactions.
+def split_transactions_page(page):
+    """
+    Splits one transactions response into the page without its links, and the href of the next page
+    (None on the last page). ING puts the next link in the transactions / cardTransactions object.
+    """
+    page = dict(page)
+    links = page.pop('_links', None) or {}
+    for key in ('transactions', 'cardTransactions'):
+        if isinstance(page.get(key), dict) and '_links' in page[key]:
+            page[key] = dict(page[key])
+            links = page[key].pop('_links') or links
+    return page, (links.get('next') or {}).get('href')
+
+
+def fetch_accounts(customer_token):
+    """
+    Fetches the accounts a customer token gives access to.
 
     Raises:
-        requests.exceptions.HTTPError: If an API request fails.
+        requests.exceptions.HTTPError: If the API request fails.
     """
-    print("--- Fetching account, balance, and transaction data with new token ---")
     accounts_endpoint = "/v3/accounts"
-
-    headers = create_ing_signature_header("get", accounts_endpoint, CLIENT_ID,
-                                          ['(request-target)', 'date', 'digest', 'x-request-id'])
-    headers['Authorization'] = f'Bearer {customer_token}'
-    headers['Accept'] = 'application/json'
-
-    acc_response = requests.get(f"{SANDBOX_HOST}{accounts_endpoint}", headers=headers, cert=(ING_TLS_CERT, ING_TLS_KEY))
+    headers = customer_request_headers(accounts_endpoint, customer_token)
+    acc_response = ing_session().get(f"{SANDBOX_HOST}{accounts_endpoint}", headers=headers)
     acc_response.raise_for_status()
     accounts = acc_response.json()['accounts']
     print(f"    -> Success! Found {len(accounts)} account(s).")
+    return accounts
 
-    all_transactions = []
-    all_balances = []
 
-    for account in accounts:
-        account_identifier = account.get('iban') or account.get('maskedPan')
+def fetch_account_pages(customer_token, iban, account, date_from=None):
+    """
+    Fetches one account's balances and then all of its transactions, following the next links page by page,
+    and yields every response as a list of streaming records as soon as it arrives. With `date_from` only
+    transactions booked on or after that date are fetched. A failed call is reported and skipped, as before.
+    Once the last transactions page has been fetched, a checkpoint record for the account is yielded.
+    """
+    account_identifier = account.get('iban') or account.get('maskedPan')
 
-        # --- Fetch Balances ---
-        print(f"    -> Fetching balances for {account_identifier}...")
-        try:
-            if 'balances' in account['_links'] and account['_links']['balances']:
-                balances_endpoint = account['_links']['balances']['href']
-                balance_headers = create_ing_signature_header("get", balances_endpoint, CLIENT_ID,
-                                                              ['(request-target)', 'date', 'digest', 'x-request-id'])
-                balance_headers['Authorization'] = f'Bearer {customer_token}'
-                balance_response = requests.get(f"{SANDBOX_HOST}{balances_endpoint}", headers=balance_headers,
-                                                cert=(ING_TLS_CERT, ING_TLS_KEY))
-                balance_response.raise_for_status()
-                all_balances.append(balance_response.json())
-                print(f"       -> Success!")
-            else:
-                print(f"       -> WARNING: No balances link found for account {account_identifier}.")
-        except requests.exceptions.HTTPError as e:
-            print(f"       -> WARNING: Could not fetch balances for {account_identifier}. Server returned error: {e}")
-            print(f"       -> Skipping balances for this account and continuing.")
-
-            # --- Fetch Transactions ---
-        print(f"    -> Fetching transactions for {account_identifier}...")
-        try:
-            if 'transactions' in account['_links'] and account['_links']['transactions']:
-                transactions_endpoint = account['_links']['transactions']['href']
-                trans_headers = create_ing_signature_header("get", transactions_endpoint, CLIENT_ID,
-                                                            ['(request-target)', 'date', 'digest', 'x-request-id'])
-                trans_headers['Authorization'] = f'Bearer {customer_token}'
-                trans_response = requests.get(f"{SANDBOX_HOST}{transactions_endpoint}", headers=trans_headers,
-                                              cert=(ING_TLS_CERT, ING_TLS_KEY))
-                trans_response.raise_for_status()
-                all_transactions.append(trans_response.json())
-                print(f"       -> Success!")
-            else:
-                print(f"       -> WARNING: No transactions link found for account {account_identifier}.")
-        except requests.exceptions.HTTPError as e:
-            print(
-                f"       -> WARNING: Could not fetch transactions for {account_identifier}. Server returned error: {e}")
-            print(f"       -> Skipping this account and continuing.")
+    # --- Fetch Balances ---
+    print(f"    -> Fetching balances for {account_identifier}...")
+    try:
+        if 'balances' in account['_links'] and account['_links']['balances']:
+            balances_endpoint = account['_links']['balances']['href']
+            balance_headers = customer_request_headers(balances_endpoint, customer_token)
+            balance_response = ing_session().get(f"{SANDBOX_HOST}{balances_endpoint}", headers=balance_headers)
+            balance_response.raise_for_status()
+            print(f"       -> Success! Balances for {account_identifier}.")
+            yield list(payload_to_records(iban, {"balances": [balance_response.json()]}))
+        else:
+            print(f"       -> WARNING: No balances link found for account {account_identifier}.")
+    except requests.exceptions.RequestException as e:
+        print(f"       -> WARNING: Could not fetch balances for {account_identifier}: {e}")
+        print(f"       -> Skipping balances for this account and continuing.")
+
+    # --- Fetch Transactions, page by page ---
+    transactions_endpoint = transactions_href(account, date_from)
+    if not transactions_endpoint:
+        print(f"       -> WARNING: No transactions link found for account {account_identifier}.")
+        return
+    since = f" booked since {date_from}" if date_from else ""
+    print(f"    -> Fetching transactions{since} for {account_identifier}...")
+    seen_pages = set()
+    try:
+        while transactions_endpoint and transactions_endpoint not in seen_pages:
+            seen_pages.add(transactions_endpoint)
+            trans_headers = customer_request_headers(transactions_endpoint, customer_token)
+            trans_response = ing_session().get(f"{SANDBOX_HOST}{transactions_endpoint}", headers=trans_headers)
+            trans_response.raise_for_status()
+            page, transactions_endpoint = split_transactions_page(trans_response.json())
+            yield list(payload_to_records(iban, {"transactions": [page]}))
+    except requests.exceptions.RequestException as e:
+        print(f"       -> WARNING: Could not fetch transactions for {account_identifier}: {e}")
+        print(f"       -> Skipping the rest of this account and continuing.")
+        return
+    print(f"       -> Success! {len(seen_pages)} page(s) of transactions for {account_identifier}.")
+    yield [checkpoint_record(iban, account.get('resourceId'))]
+
+
+def fetch_record_pages(customer_token, iban, since=None):
+    """
+    Fetches everything a customer token gives access to and yields it as lists of streaming records
+    (see INGtoDB.payload_to_records): the accounts first, then each account's balances and transaction pages,
+    each account closed by a checkpoint record once all of its pages are in. The accounts are fetched
+    concurrently, but their pages come out in the order of the accounts endpoint, each one as soon as
+    it is available. If the accounts cannot be fetched, the token is reported and skipped.
 
+    Args:
+        customer_token (str): The customer's valid access token.
+        iban (str): The IBAN the token is stored under; every record carries it.
+        since (dict, optional): resourceId -> date (YYYY-MM-DD) to fetch the account's transactions from.
+            Accounts without an entry are fetched in full.
+    """
+    print("--- Fetching account, balance, and transaction data with new token ---")
+    since = since or {}
+    try:
+        accounts = fetch_accounts(customer_token)
+    except requests.exceptions.RequestException as e:
+        print(f"    -> WARNING: Could not fetch the accounts for {iban}: {e}")
+        print(f"    -> Skipping this token and continuing.")
+        return
+    yield list(payload_to_records(iban, {"accounts": accounts}))
+
+    yield from stream_concurrently(
+        lambda account: fetch_account_pages(customer_token, iban, account, since.get(account.get('resourceId'))),
+        accounts, workers=ACCOUNT_WORKERS)
     print("    -> Finished fetching data for this token.")
-    return {"accounts": accounts, "balances": all_balances, "transactions": all_transactions}
 
 
-def get_all_tokens_from_csv(filename):
+def refresh_token_batch(app_token, refresh_tokens):
     """
-    Reads a CSV file and returns all token data as a list of dictionaries.
-
-    Args:
-        filename (str): The path to the CSV file.
+    Refreshes the given customer tokens concurrently.
 
     Returns:
-        list: A list of dictionaries, where each dictionary represents a row from the CSV.
+        list: Per refresh token, the token response or the exception the refresh failed with.
     """
-    print(f"--- Reading all tokens from '{filename}' ---")
-    if not os.path.exists(filename):
-        print(f"\n--- ERROR: Could not find the token file: '{filename}' ---")
-        print("Please ensure the file exists and contains your refresh tokens.")
-        return []
-
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            reader = list(csv.DictReader(f))
-        if not reader:
-            print(f"    -> No tokens found in '{filename}'.")
-            return []
-        print(f"    -> Found {len(reader)} token(s) to process.")
-        return reader
-    except Exception as e:
-        print(f"    -> ERROR: An error occurred while reading the CSV file: {e}")
-        return []
+    def refresh(refresh_token):
+        try:
+            return refresh_customer_token(app_token, refresh_token)
+        except requests.exceptions.RequestException as e:
+            return e
 
+    return list(fetch_concurrently(refresh, refresh_tokens, workers=TOKEN_WORKERS))
 
-def update_csv_file(filename, updated_rows):
-    """
-    Writes a list of dictionaries back to a CSV file, overwriting the existing file.
 
-    Args:
-        filename (str): The path to the CSV file.
-        updated_rows (list): A list of dictionaries to write to the file.
-    """
-    print(f"--- Saving all updated tokens back to '{filename}' ---")
-    try:
-        if not updated_rows:
-            return
-        headers = updated_rows[0].keys()
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=headers)
-            writer.writeheader()
-            writer.writerows(updated_rows)
-        print("    -> Success! File has been updated.")
-    except Exception as e:
-        print(f"    -> ERROR: An error occurred while updating the CSV file: {e}")
+def refresh_expiring_tokens(store):
+    """Refreshes the tokens in the store that are about to expire, reusing the cached application token."""
+    return refresh_due_tokens(store, CLIENT_ID, request_application_token, refresh_token_batch)
 
 
 if __name__ == "__main__":
@@ -305,49 +400,40 @@ if __name__ == "__main__":
         print(f"--- WARNING: Certificate directory '{CERT_PATH}' not found. ---")
         print("--- This script will fail without valid certificate files. ---")
 
-    token_rows = get_all_tokens_from_csv(TOKEN_CSV_FILE)
-
-    if token_rows:
-        all_retrieved_data = {}
-        try:
-            application_token = get_application_token()
-
-            for i, row in enumerate(token_rows):
-                old_refresh_token = row['refresh_token']
-                iban = row['iban']
-                print("\n" + "=" * 60)
-                print(f"Processing Token for account: {iban} ({i + 1} of {len(token_rows)})")
-                print("=" * 60)
-
-                new_token_data = refresh_customer_token(application_token, old_refresh_token)
-                new_customer_token = new_token_data['access_token']
-
-                # Update the row with the latest customer token and timestamp
-                row['customer_access_token'] = new_customer_token
-                row['timestamp'] = datetime.now(timezone.utc).isoformat()
-
-                # Fetch all data (accounts, balances, transactions)
-                retrieved_data = fetch_data_with_token(new_customer_token)
-                all_retrieved_data[iban] = retrieved_data
-
-                # After the loop, update the CSV and save the data
-            update_csv_file(TOKEN_CSV_FILE, token_rows)
-
-            print(f"\n--- Saving all retrieved data to '{DATA_OUTPUT_FILE}' ---")
-            with open(DATA_OUTPUT_FILE, 'w', encoding='utf-8') as f:
-                json.dump(all_retrieved_data, f, indent=2)
-            print("    -> Success!")
-
-        except FileNotFoundError:
-            print("\n--- A FileNotFoundError occurred. ---")
-            print(f"Please make sure the certificate files exist at the specified paths:")
-            print(f"  - Signing Cert: {ING_SIGNING_CERT_FILE}")
-            print(f"  - Signing Key:  {ING_SIGNING_KEY_FILE}")
-            print(f"  - TLS Cert:     {ING_TLS_CERT}")
-            print(f"  - TLS Key:      {ING_TLS_KEY}")
-        except requests.exceptions.HTTPError as e:
-            print(f"\n--- An HTTP Error Occurred ---")
-            print(f"Error: {e}")
-            print(f"Response Body: {e.response.text}")
-        except Exception as e:
-            print(f"\nAn unexpected error occurred: {e}")
+    store = TokenStore()
+    try:
+        # Only the customer tokens that are about to expire are refreshed, before any data is fetched
+        refresh_expiring_tokens(store)
+        token_rows = store.valid_tokens()
+        print(f"--- {len(token_rows)} account(s) with a valid token ---")
+
+        with open(DATA_OUTPUT_FILE, 'w', encoding='utf-8') as output_file:
+            print(f"--- Writing retrieved data to '{DATA_OUTPUT_FILE}' ---")
+
+            # Tokens are fetched concurrently; every page of records is written as soon as it is its turn,
+            # in the order of the token store
+            record_pages = stream_concurrently(
+                lambda row: fetch_record_pages(row['customer_access_token'], row['iban']), token_rows,
+                workers=TOKEN_WORKERS)
+            record_count = 0
+            for page in record_pages:
+                record_count += write_ndjson(output_file, page)
+                output_file.flush()
+            print(f"    -> Wrote {record_count} record(s) to '{DATA_OUTPUT_FILE}'.")
+        print("    -> Success!")
+
+    except FileNotFoundError:
+        print("\n--- A FileNotFoundError occurred. ---")
+        print(f"Please make sure the certificate files exist at the specified paths:")
+        print(f"  - Signing Cert: {ING_SIGNING_CERT_FILE}")
+        print(f"  - Signing Key:  {ING_SIGNING_KEY_FILE}")
+        print(f"  - TLS Cert:     {ING_TLS_CERT}")
+        print(f"  - TLS Key:      {ING_TLS_KEY}")
+    except requests.exceptions.HTTPError as e:
+        print(f"\n--- An HTTP Error Occurred ---")
+        print(f"Error: {e}")
+        print(f"Response Body: {e.response.text}")
+    except Exception as e:
+        print(f"\nAn unexpected error occurred: {e}")
+    finally:
+        store.close()
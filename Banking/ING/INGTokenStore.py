@@ -0,0 +1,223 @@
+import csv
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+# --- Configuration ---
+# The SQLite token store, replacing ing_tokens.csv (which is imported into it once, on first use).
+# Both live in this folder, so every script shares the same store whatever directory it is run from.
+ING_DIR = os.path.dirname(os.path.abspath(__file__))
+TOKEN_DB_FILE = os.path.join(ING_DIR, 'ing_tokens.db')
+LEGACY_CSV_FILE = os.path.join(ING_DIR, 'ing_tokens.csv')
+
+# Customer tokens that expire within this many seconds are refreshed; others are left alone
+REFRESH_MARGIN_SECONDS = 120
+# Customer tokens refreshed in parallel per batch
+REFRESH_BATCH_SIZE = 50
+# A token claimed for refreshing is left to that run for this long. A failed refresh keeps its claim,
+# so the token is retried by a later run rather than over and over by the same one.
+CLAIM_SECONDS = 60
+# Seconds a writer waits for another process's lock on the store before giving up
+BUSY_TIMEOUT = 30
+
+
+def _expires_at(token_data, key='expires_in'):
+    """Unix time at which a token from a token response expires; None if the response does not say."""
+    expires_in = token_data.get(key)
+    return int(time.time()) + int(expires_in) if expires_in is not None else None
+
+
+class TokenStore:
+    """
+    The ING customer tokens, one row per account (IBAN), with the expiry of each access token, plus the
+    cached application token. Backed by SQLite, so updating one token writes one row instead of rewriting
+    a CSV file, and several processes can share the store: writes are serialised by SQLite's file lock,
+    and a token is claimed before it is refreshed so two runs never refresh the same one.
+    Expiry times are Unix timestamps.
+    """
+
+    def __init__(self, db_file=None, legacy_csv_file=None):
+        # The module settings are read here rather than bound as defaults, so they can be changed at runtime
+        db_file, legacy_csv_file = db_file or TOKEN_DB_FILE, legacy_csv_file or LEGACY_CSV_FILE
+        self.db_file = db_file
+        # Autocommit; multi-statement writes open their own BEGIN IMMEDIATE transaction
+        self.conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self._create_tables()
+        if legacy_csv_file and os.path.exists(legacy_csv_file) and not self.count():
+            self.import_csv(legacy_csv_file)
+
+    def _create_tables(self):
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS customer_tokens (
+            iban TEXT PRIMARY KEY,
+            account_name TEXT,
+            customer_access_token TEXT,
+            refresh_token TEXT NOT NULL,
+            access_expires_at INTEGER,
+            refresh_expires_at INTEGER,
+            claimed_until INTEGER,
+            last_error TEXT,
+            timestamp TEXT
+        )''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_customer_tokens_expiry "
+                          "ON customer_tokens (access_expires_at)")
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS application_tokens (
+            client_id TEXT PRIMARY KEY,
+            access_token TEXT NOT NULL,
+            expires_at INTEGER
+        )''')
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM customer_tokens").fetchone()[0]
+
+    def import_csv(self, filename):
+        """
+        Imports the tokens of an ing_tokens.csv file. The CSV has no expiry times, so the imported
+        access tokens count as expired and are refreshed on the next run.
+        """
+        with open(filename, 'r', encoding='utf-8') as f:
+            rows = [row for row in csv.DictReader(f) if row.get('refresh_token')]
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany('''
+            INSERT OR IGNORE INTO customer_tokens (iban, account_name, customer_access_token, refresh_token, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+            ''', [(row.get('iban'), row.get('account_name'), row.get('customer_access_token'), row['refresh_token'],
+                   row.get('timestamp')) for row in rows])
+        print(f"--- Imported {len(rows)} token(s) from '{filename}' into '{self.db_file}' ---")
+
+    def add(self, iban, account_name, token_data):
+        """Stores the tokens of a newly authorised account (or replaces those of a re-authorised one)."""
+        self.conn.execute('''
+        INSERT OR REPLACE INTO customer_tokens
+        (iban, account_name, customer_access_token, refresh_token, access_expires_at, refresh_expires_at, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (iban, account_name, token_data['access_token'], token_data['refresh_token'], _expires_at(token_data),
+              _expires_at(token_data, 'refresh_token_expires_in'), datetime.now(timezone.utc).isoformat()))
+
+    def tokens(self):
+        """All stored accounts and their tokens, as dicts."""
+        return [dict(row) for row in self.conn.execute("SELECT * FROM customer_tokens ORDER BY rowid")]
+
+    def valid_tokens(self, margin=0):
+        """The accounts whose access token is valid for at least `margin` more seconds."""
+        return [dict(row) for row in self.conn.execute(
+            "SELECT * FROM customer_tokens WHERE access_expires_at > ? ORDER BY rowid", (int(time.time()) + margin,))]
+
+    def claim_due(self, margin=REFRESH_MARGIN_SECONDS, limit=REFRESH_BATCH_SIZE):
+        """
+        Claims up to `limit` tokens that expire within `margin` seconds (or whose expiry is unknown) and
+        are not claimed by another run, and returns them. Selecting and claiming happen in one write
+        transaction, so concurrent runs never get the same token.
+        """
+        now = int(time.time())
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            rows = [dict(row) for row in self.conn.execute('''
+            SELECT * FROM customer_tokens
+            WHERE (access_expires_at IS NULL OR access_expires_at <= ?)
+              AND (claimed_until IS NULL OR claimed_until <= ?)
+            ORDER BY access_expires_at IS NOT NULL, access_expires_at
+            LIMIT ?
+            ''', (now + margin, now, limit))]
+            self.conn.executemany("UPDATE customer_tokens SET claimed_until = ? WHERE iban = ?",
+                                  [(now + CLAIM_SECONDS, row['iban']) for row in rows])
+        return rows
+
+    def save_refreshed(self, iban, token_data):
+        """Stores a refreshed access token (and the new refresh token, if ING issued one) and releases the claim."""
+        self.conn.execute('''
+        UPDATE customer_tokens SET
+            customer_access_token = ?, access_expires_at = ?,
+            refresh_token = COALESCE(?, refresh_token), refresh_expires_at = COALESCE(?, refresh_expires_at),
+            claimed_until = NULL, last_error = NULL, timestamp = ?
+        WHERE iban = ?
+        ''', (token_data['access_token'], _expires_at(token_data), token_data.get('refresh_token'),
+              _expires_at(token_data, 'refresh_token_expires_in'), datetime.now(timezone.utc).isoformat(), iban))
+
+    def save_failed(self, iban, error):
+        """Records why a refresh failed. The claim is kept until it expires, which delays the retry."""
+        self.conn.execute("UPDATE customer_tokens SET last_error = ? WHERE iban = ?", (str(error), iban))
+
+    def application_token(self, client_id, request_token, margin=REFRESH_MARGIN_SECONDS):
+        """
+        Returns the cached application access token if it is valid for at least `margin` more seconds,
+        otherwise calls `request_token()` for a new token response and caches that token until it expires.
+        The cache lives in the store, so the token is reused across runs.
+        """
+        row = self.conn.execute("SELECT access_token FROM application_tokens WHERE client_id = ? AND expires_at > ?",
+                                (client_id, int(time.time()) + margin)).fetchone()
+        if row:
+            print("--- Reusing the cached Application Access Token ---")
+            return row['access_token']
+        token_data = request_token()
+        self.conn.execute("INSERT OR REPLACE INTO application_tokens (client_id, access_token, expires_at) "
+                          "VALUES (?, ?, ?)", (client_id, token_data['access_token'], _expires_at(token_data)))
+        return token_data['access_token']
+
+    def close(self):
+        self.conn.close()
+
+
+def refresh_due_tokens(store, client_id, request_application_token, refresh_batch,
+                       margin=REFRESH_MARGIN_SECONDS, batch_size=REFRESH_BATCH_SIZE):
+    """
+    Refreshes the customer tokens that expire within `margin` seconds, `batch_size` at a time.
+    Tokens that are still valid are not touched, and no application token is requested when nothing is due.
+    If no application token can be had, the claimed tokens are recorded as failed and the rest are left for
+    the next run; the caller carries on with the tokens that are still valid.
+
+    Args:
+        store (TokenStore): The token store.
+        client_id (str): The client ID the application token is cached under.
+        request_application_token (callable): Requests a new application token; returns the token response.
+        refresh_batch (callable): Called as refresh_batch(app_token, refresh_tokens); refreshes one batch in
+            parallel and returns, per refresh token, the token response or the exception it failed with.
+
+    Returns:
+        tuple: The number of tokens refreshed and the number that failed.
+    """
+    app_token = None
+    refreshed, failed = 0, 0
+    while True:
+        rows = store.claim_due(margin, batch_size)
+        if not rows:
+            break
+        try:
+            app_token = app_token or store.application_token(client_id, request_application_token)
+        except Exception as e:
+            print(f"    -> WARNING: Could not get an application token, so no tokens are refreshed this run: {e}")
+            for row in rows:
+                store.save_failed(row['iban'], e)
+            failed += len(rows)
+            break
+        print(f"--- Refreshing {len(rows)} customer token(s) that expire soon ---")
+        results = refresh_batch(app_token, [row['refresh_token'] for row in rows])
+        for row, result in zip(rows, results):
+            if isinstance(result, Exception):
+                print(f"    -> WARNING: Could not refresh the token for {row['iban']}: {result}")
+                store.save_failed(row['iban'], result)
+                failed += 1
+            else:
+                store.save_refreshed(row['iban'], result)
+                refreshed += 1
+    print(f"    -> {refreshed} token(s) refreshed, {failed} failed, the others are still valid.")
+    return refreshed, failed
+
+
+if __name__ == "__main__":
+    # Usage: python INGTokenStore.py   (lists the stored accounts and when their tokens expire)
+    store = TokenStore()
+    try:
+        now = int(time.time())
+        for row in store.tokens():
+            expires = row['access_expires_at']
+            status = f"expires in {expires - now}s" if expires and expires > now else "expired"
+            error = f"  (last refresh failed: {row['last_error']})" if row['last_error'] else ""
+            print(f"{row['iban']:<24} {row['account_name'] or '':<24} {status}{error}")
+    finally:
+        store.close()
@@ -1,9 +1,17 @@
 import json
 import sqlite3
 import os
+import sys
 from datetime import datetime, timezone
 
+# The shared row-pipeline helpers live one directory up, next to DBMerger.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from RowPipeline import write_rows, DynamicTableWriter, apply_bulk_write_pragmas
+from JsonStream import is_ndjson, iter_ndjson, iter_top_level_items
+
 # --- Configuration ---
+# The newline-delimited JSON written by INGDataFetcher.py; the older single-object JSON is used if it is missing
+NDJSON_INPUT_FILE = 'ing_data_output.ndjson'
 # The JSON file generated by your original script
 JSON_INPUT_FILE = 'ing_data_output.json'
 # The SQLite database file to create/update
@@ -65,6 +73,7 @@ def setup_database(db_file, balance_columns, transaction_columns):
     """Initializes the database and creates tables with a dynamically generated schema."""
     print(f"--- Setting up database at '{db_file}' ---")
     conn = sqlite3.connect(db_file)
+    apply_bulk_write_pragmas(conn)
     cursor = conn.cursor()
 
     # --- Accounts table (static schema is fine) ---
@@ -81,23 +90,26 @@ def setup_database(db_file, balance_columns, transaction_columns):
 
     # --- Dynamically create Balances table ---
     # Use 'TEXT' for all discovered columns for simplicity; SQLite handles type affinity.
-    balance_cols_sql = ", ".join([f'"{col}" TEXT' for col in balance_columns])
+    balance_cols_sql = "".join([f'"{col}" TEXT, ' for col in balance_columns])
     cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS balances (
         balance_id INTEGER PRIMARY KEY AUTOINCREMENT,
         account_resourceId TEXT NOT NULL,
-        {balance_cols_sql},
+        {balance_cols_sql}
         FOREIGN KEY (account_resourceId) REFERENCES accounts (resourceId)
     )''')
 
     # --- Dynamically create Transactions table ---
-    transaction_cols_sql = ", ".join([f'"{col}" TEXT' for col in transaction_columns])
+    # transactionId must always exist, the UNIQUE constraint below needs it
+    if 'transactionId' not in transaction_columns:
+        transaction_columns = ['transactionId'] + transaction_columns
+    transaction_cols_sql = "".join([f'"{col}" TEXT, ' for col in transaction_columns])
     cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS transactions (
         transaction_pk INTEGER PRIMARY KEY AUTOINCREMENT,
         account_resourceId TEXT NOT NULL,
         status TEXT,
-        {transaction_cols_sql},
+        {transaction_cols_sql}
         FOREIGN KEY (account_resourceId) REFERENCES accounts (resourceId),
         UNIQUE(transactionId)
     )''')
@@ -123,8 +135,31 @@ def load_json_data(json_file):
         return None
 
 
+def flatten_balance(balance):
+    """Flattens one balance, lifting the nested balanceAmount fields to the top level."""
+    flat_balance = {k: v for k, v in balance.items() if k != 'balanceAmount'}
+    flat_balance.update(balance.get('balanceAmount', {}))
+    return flat_balance
+
+
+def flatten_transaction(tx):
+    """Flattens one (card) transaction: amount fields, prefixed creditor/debtor account fields, one id column."""
+    flat_tx = {k: v for k, v in tx.items() if
+               k not in ['transactionAmount', 'creditorAccount', 'debtorAccount']}
+    flat_tx.update(tx.get('transactionAmount', {}))
+    flat_tx.update({f"creditorAccount_{k}": v for k, v in tx.get('creditorAccount', {}).items()})
+    flat_tx.update({f"debtorAccount_{k}": v for k, v in tx.get('debtorAccount', {}).items()})
+
+    if 'cardTransactionId' in flat_tx:
+        flat_tx['transactionId'] = flat_tx.pop('cardTransactionId')
+    return flat_tx
+
+
 def save_data_to_db(conn, cursor, all_data, balance_columns, transaction_columns):
-    """Iterates through the data and saves it, matching records to the dynamic schema."""
+    """
+    Iterates through the data and saves it, matching records to the dynamic schema.
+    Balances and transactions are inserted in executemany() batches, all in one transaction.
+    """
     print(f"--- Saving all collected data to the database ---")
     fetch_time = datetime.now(timezone.utc).isoformat()
 
@@ -146,74 +181,159 @@ def save_data_to_db(conn, cursor, all_data, balance_columns, transaction_columns
                 resource_id, account.get('iban'), account.get('maskedPan'), account.get('name'),
                 account.get('currency'), account.get('product'), fetch_time
             ))
-    conn.commit()
 
     # --- 2. Process and save Balances ---
     balance_placeholders = ', '.join(['?'] * (len(balance_columns) + 1))  # +1 for account_resourceId
     balance_insert_sql = f"INSERT OR IGNORE INTO balances (account_resourceId, {', '.join(balance_columns)}) VALUES ({balance_placeholders})"
 
-    for data in all_data.values():
-        for balance_container in data.get('balances', []):
-            account_details = balance_container.get('account', {})
-            account_id = iban_to_resourceId.get(account_details.get('iban')) or pan_to_resourceId.get(
-                account_details.get('maskedPan'))
-            if not account_id: continue
+    def balance_rows():
+        for data in all_data.values():
+            for balance_container in data.get('balances', []):
+                account_details = balance_container.get('account', {})
+                account_id = iban_to_resourceId.get(account_details.get('iban')) or pan_to_resourceId.get(
+                    account_details.get('maskedPan'))
+                if not account_id: continue
 
-            for balance in balance_container.get('balances', []):
-                flat_balance = {k: v for k, v in balance.items() if k != 'balanceAmount'}
-                flat_balance.update(balance.get('balanceAmount', {}))
+                for balance in balance_container.get('balances', []):
+                    flat_balance = flatten_balance(balance)
+                    yield [account_id] + [flat_balance.get(col) for col in balance_columns]
 
-                values = [account_id] + [flat_balance.get(col) for col in balance_columns]
-                cursor.execute(balance_insert_sql, values)
+    write_rows(cursor, balance_insert_sql, balance_rows())
 
     # --- 3. Process and save all Transactions ---
     transaction_placeholders = ', '.join(['?'] * (len(transaction_columns) + 2))  # +2 for account_resourceId, status
     transaction_insert_sql = f"INSERT OR IGNORE INTO transactions (account_resourceId, status, {', '.join(transaction_columns)}) VALUES ({transaction_placeholders})"
 
-    for data in all_data.values():
-        for tx_container in data.get('transactions', []):
-            is_card_tx = 'cardTransactions' in tx_container
-            account_details = tx_container.get('cardAccount') if is_card_tx else tx_container.get('account')
-            transactions_data = tx_container.get('cardTransactions') if is_card_tx else tx_container.get('transactions')
+    def transaction_rows():
+        for data in all_data.values():
+            for tx_container in data.get('transactions', []):
+                is_card_tx = 'cardTransactions' in tx_container
+                account_details = tx_container.get('cardAccount') if is_card_tx else tx_container.get('account')
+                transactions_data = tx_container.get('cardTransactions') if is_card_tx else tx_container.get('transactions')
 
-            if not account_details: continue
-            account_id = pan_to_resourceId.get(
-                account_details.get('maskedPan')) if is_card_tx else iban_to_resourceId.get(account_details.get('iban'))
-            if not account_id: continue
+                if not account_details: continue
+                account_id = pan_to_resourceId.get(
+                    account_details.get('maskedPan')) if is_card_tx else iban_to_resourceId.get(account_details.get('iban'))
+                if not account_id: continue
 
-            for status, tx_list in transactions_data.items():
-                for tx in tx_list:
-                    flat_tx = {k: v for k, v in tx.items() if
-                               k not in ['transactionAmount', 'creditorAccount', 'debtorAccount']}
-                    flat_tx.update(tx.get('transactionAmount', {}))
-                    flat_tx.update({f"creditorAccount_{k}": v for k, v in tx.get('creditorAccount', {}).items()})
-                    flat_tx.update({f"debtorAccount_{k}": v for k, v in tx.get('debtorAccount', {}).items()})
+                for status, tx_list in transactions_data.items():
+                    for tx in tx_list:
+                        flat_tx = flatten_transaction(tx)
+                        yield [account_id, status] + [flat_tx.get(col) for col in transaction_columns]
 
-                    if 'cardTransactionId' in flat_tx:
-                        flat_tx['transactionId'] = flat_tx.pop('cardTransactionId')
-
-                    values = [account_id, status] + [flat_tx.get(col) for col in transaction_columns]
-                    cursor.execute(transaction_insert_sql, values)
+    # Rows are built lazily and inserted in executemany() batches
+    write_rows(cursor, transaction_insert_sql, transaction_rows())
 
     conn.commit()
     print("    -> All data saved to database successfully.")
 
 
+# --- Streaming ingest ---
+# Newline-delimited records, one per line, all carrying the token's 'iban' key:
+#   {"type": "account", "data": {...}}
+#   {"type": "balance", "account": {"iban"|"maskedPan": ...}, "data": {...}}
+#   {"type": "transaction", "account": {...}, "card": false, "status": "booked", "data": {...}}
+#   {"type": "checkpoint", "account": resourceId}   (all of that account's pages are above it)
+# Each account record comes before the balances and transactions that refer to it.
+
+def payload_to_records(iban, data):
+    """Splits one token's fetched data ({accounts, balances, transactions}) into streaming records."""
+    for account in data.get('accounts', []):
+        yield {"iban": iban, "type": "account", "data": account}
+    for balance_container in data.get('balances', []):
+        for balance in balance_container.get('balances', []):
+            yield {"iban": iban, "type": "balance", "account": balance_container.get('account', {}), "data": balance}
+    for tx_container in data.get('transactions', []):
+        is_card_tx = 'cardTransactions' in tx_container
+        account_details = tx_container.get('cardAccount') if is_card_tx else tx_container.get('account')
+        transactions_data = tx_container.get('cardTransactions') if is_card_tx else tx_container.get('transactions')
+        for status, tx_list in (transactions_data or {}).items():
+            for tx in tx_list:
+                yield {"iban": iban, "type": "transaction", "account": account_details, "card": is_card_tx,
+                       "status": status, "data": tx}
+
+
+def iter_records(input_file):
+    """Streams records from an NDJSON export, or converts a single-object JSON export account by account."""
+    if is_ndjson(input_file):
+        yield from iter_ndjson(input_file)
+    else:
+        for iban, data in iter_top_level_items(input_file):
+            yield from payload_to_records(iban, data)
+
+
+def stream_data_to_db(conn, cursor, records, on_checkpoint=None):
+    """
+    Discovers columns and saves rows in a single pass over the records, holding only one batch in memory.
+    Fields not seen before are added to the balances / transactions tables with ALTER TABLE ADD COLUMN.
+    At every checkpoint record the rows so far are committed, after `on_checkpoint(record)` has run in the
+    same transaction.
+    """
+    print(f"--- Streaming records into the database ---")
+    fetch_time = datetime.now(timezone.utc).isoformat()
+    iban_to_resourceId = {}
+    pan_to_resourceId = {}
+    balance_writer = DynamicTableWriter(cursor, 'balances')
+    transaction_writer = DynamicTableWriter(cursor, 'transactions')
+
+    for record in records:
+        record_type = record.get('type')
+        data = record.get('data') or {}
+        if record_type == 'account':
+            resource_id = data.get('resourceId')
+            if data.get('iban'):
+                iban_to_resourceId[data.get('iban')] = resource_id
+            if data.get('maskedPan'):
+                pan_to_resourceId[data.get('maskedPan')] = resource_id
+            cursor.execute('''
+            INSERT OR REPLACE INTO accounts (resourceId, iban, maskedPan, name, currency, product, fetch_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                resource_id, data.get('iban'), data.get('maskedPan'), data.get('name'),
+                data.get('currency'), data.get('product'), fetch_time
+            ))
+        elif record_type == 'balance':
+            account_details = record.get('account') or {}
+            account_id = iban_to_resourceId.get(account_details.get('iban')) or pan_to_resourceId.get(
+                account_details.get('maskedPan'))
+            if not account_id: continue
+            balance_writer.write({'account_resourceId': account_id, **flatten_balance(data)})
+        elif record_type == 'transaction':
+            account_details = record.get('account') or {}
+            account_id = pan_to_resourceId.get(account_details.get('maskedPan')) if record.get('card') \
+                else iban_to_resourceId.get(account_details.get('iban'))
+            if not account_id: continue
+            transaction_writer.write({'account_resourceId': account_id, 'status': record.get('status'),
+                                      **flatten_transaction(data)})
+        elif record_type == 'checkpoint':
+            balance_writer.flush()
+            transaction_writer.flush()
+            if on_checkpoint: on_checkpoint(record)
+            conn.commit()
+
+    balance_writer.flush()
+    transaction_writer.flush()
+    conn.commit()
+    for writer in (balance_writer, transaction_writer):
+        if writer.added_columns:
+            print(f"    -> Added {len(writer.added_columns)} new column(s) to '{writer.table}'.")
+    print(f"    -> Saved {balance_writer.written} balance(s) and {transaction_writer.written} transaction(s).")
+
+
 if __name__ == "__main__":
-    # Step 1: Load the data from the JSON file
-    retrieved_data = load_json_data(JSON_INPUT_FILE)
+    # Usage: python INGtoDB.py [input file (.ndjson or .json)]
+    input_file = sys.argv[1] if len(sys.argv) > 1 else (
+        NDJSON_INPUT_FILE if os.path.exists(NDJSON_INPUT_FILE) else JSON_INPUT_FILE)
 
-    if retrieved_data:
+    if not os.path.exists(input_file):
+        print(f"!!! ERROR: Input file not found at '{input_file}'. Please run the main script first. !!!")
+    else:
         db_conn = None
         try:
-            # Step 2: Discover the complete schema from the loaded data
-            balance_cols, transaction_cols = discover_schema(retrieved_data)
-
-            # Step 3: Set up the database with the discovered schema
-            db_conn, db_cursor = setup_database(DB_FILE, balance_cols, transaction_cols)
-
-            # Step 4: Save the data to the newly created tables
-            save_data_to_db(db_conn, db_cursor, retrieved_data, balance_cols, transaction_cols)
+            # Tables start with their fixed columns; fields are added as they appear in the stream
+            print(f"--- Reading data from '{input_file}' ---")
+            db_conn, db_cursor = setup_database(DB_FILE, [], [])
+            stream_data_to_db(db_conn, db_cursor, iter_records(input_file))
 
             print("\nImport process finished successfully.")
         except Exception as e:
@@ -1,14 +1,14 @@
 import requests
+import os
 import json
 import uuid
 import base64
 import hashlib
-import csv
-import os
 from datetime import datetime, timezone
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from INGTokenStore import TokenStore, TOKEN_DB_FILE
 
 # --- ING Sandbox Configuration ---
 CLIENT_ID = "YOUR_CLIENT_ID"
@@ -17,7 +17,9 @@ REDIRECT_URI = "https://www.example.com/"
 SANDBOX_HOST = "https://api.sandbox.ing.com"
 
 # --- Certificate Paths ---
-CERT_PATH = "certs/"
+# Resolved from this folder, so the scripts find them whatever directory they are run from
+ING_DIR = os.path.dirname(os.path.abspath(__file__))
+CERT_PATH = os.path.join(ING_DIR, "certs") + os.sep
 ING_SIGNING_CERT_FILE = CERT_PATH + 'example_client_signing.cer'
 ING_SIGNING_KEY_FILE = CERT_PATH + 'example_client_signing.key'
 ING_TLS_CERT = CERT_PATH + 'example_client_tls.cer'
@@ -138,29 +140,16 @@ def main():
         account_iban = consented_account.get('iban') or consented_account.get('maskedPan')
         account_name = consented_account.get('name')
 
-        # === Step 5: Save Tokens to CSV ===
-        print("\n--- Step 5: Saving tokens to CSV file ---")
-        csv_file_name = 'ing_tokens.csv'
-        # REVISION: Add 'refresh_token' to the CSV headers
-        csv_headers = ['timestamp', 'iban', 'account_name', 'customer_access_token', 'refresh_token']
-
-        file_exists = os.path.exists(csv_file_name)
-
-        with open(csv_file_name, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=csv_headers)
-            if not file_exists:
-                writer.writeheader()
-
-            # REVISION: Write the refresh_token to the CSV file
-            writer.writerow({
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-                'iban': account_iban,
-                'account_name': account_name,
-                'customer_access_token': customer_access_token,
-                'refresh_token': customer_refresh_token
-            })
-
-        print(f"   -> Success! Tokens for account '{account_iban}' saved to '{csv_file_name}'.")
+        # === Step 5: Save Tokens to the token store ===
+        print("\n--- Step 5: Saving tokens to the token store ---")
+        store = TokenStore()
+        try:
+            # The access token's expiry is stored too, so it is only refreshed when it is about to run out
+            store.add(account_iban, account_name, token_data)
+        finally:
+            store.close()
+
+        print(f"   -> Success! Tokens for account '{account_iban}' saved to '{TOKEN_DB_FILE}'.")
 
     except requests.exceptions.HTTPError as e:
         print(f"\n--- An HTTP Error Occurred ---")
@@ -0,0 +1,47 @@
+import json
+
+# ijson is optional: with it, the legacy single-object JSON exports are parsed incrementally too
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Extensions treated as newline-delimited JSON (one record per line)
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+
+def is_ndjson(path):
+    return path.lower().endswith(NDJSON_EXTENSIONS)
+
+
+def iter_ndjson(path):
+    """Yields one parsed record per non-empty line, reading the file line by line."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON on line {line_number} of '{path}': {e}")
+
+
+def iter_top_level_items(path):
+    """
+    Yields the (key, value) pairs of a file holding one JSON object, e.g. {iban: data, ...}.
+    With ijson installed only one value is in memory at a time; otherwise the file is loaded whole.
+    """
+    with open(path, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.kvitems(f, '', use_float=True)
+        else:
+            yield from json.load(f).items()
+
+
+def write_ndjson(f, records):
+    """Writes records to an open text file, one compact JSON document per line. Returns the record count."""
+    count = 0
+    for record in records:
+        f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        count += 1
+    return count
@@ -0,0 +1,401 @@
+import json
+import os
+import random
+import re
+import ssl
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ipaddress import IPv4Address
+from urllib.parse import urlsplit, parse_qsl
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from SyntheticDataGenerator import generate_ing_payload, generate_abn_payload
+
+# --- Configuration ---
+MOCK_HOST = 'localhost'
+ING_PORT = 8441
+ABN_PORT = 8442
+# Throwaway server and client certificates are written here on start
+WORK_DIR = 'mock_bank'
+
+# Synthetic data served per bank (see SyntheticDataGenerator): transactions in total, spread over the accounts.
+# Every ING customer token sees all ING accounts; every ABN AMRO token is consented to one of the ABN accounts.
+MOCK_TRANSACTIONS = 10000
+MOCK_ACCOUNTS = 2
+# Transactions per page; the next page is linked with ING's _links.next / ABN AMRO's nextPageKey
+ING_PAGE_SIZE = 100
+ABN_PAGE_SIZE = 100
+
+# Seconds added to every response, plus up to MOCK_LATENCY_JITTER at random (the sandboxes take 50-300 ms)
+MOCK_LATENCY = 0.05
+MOCK_LATENCY_JITTER = 0.02
+# Share of requests that fail with a 503, and share turned away with a 429 and a Retry-After of
+# MOCK_RETRY_AFTER seconds
+MOCK_ERROR_RATE = 0.0
+MOCK_RATE_LIMIT_RATE = 0.0
+MOCK_RETRY_AFTER = 1
+# Lifetime of the access and refresh tokens handed out by the token endpoints
+ACCESS_TOKEN_SECONDS = 900
+REFRESH_TOKEN_SECONDS = 90 * 86400
+
+
+def write_test_certificates(work_dir):
+    """
+    Writes a self-signed server certificate for localhost and a self-signed client certificate, with their keys.
+    The server trusts the client certificate for mutual TLS; the client certificate doubles as the ING signing
+    certificate. Returns {'server_cert', 'server_key', 'client_cert', 'client_key'}: file paths.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    files = {}
+    for role in ('server', 'client'):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, f'mock-bank-{role}')])
+        builder = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+                   .serial_number(x509.random_serial_number()).not_valid_before(now - timedelta(minutes=5))
+                   .not_valid_after(now + timedelta(days=30))
+                   .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True))
+        if role == 'server':
+            builder = builder.add_extension(x509.SubjectAlternativeName(
+                [x509.DNSName('localhost'), x509.IPAddress(IPv4Address('127.0.0.1'))]), critical=False)
+        cert = builder.sign(key, hashes.SHA256())
+        files[f'{role}_cert'] = os.path.join(work_dir, f'{role}.crt')
+        files[f'{role}_key'] = os.path.join(work_dir, f'{role}.key')
+        with open(files[f'{role}_key'], 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption()))
+        with open(files[f'{role}_cert'], 'wb') as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+    return files
+
+
+def _page(items, offset, page_size):
+    """One page of `items` from `offset`, and the offset of the next page (None on the last page)."""
+    end = offset + page_size
+    return items[offset:end], (end if end < len(items) else None)
+
+
+class MockBankData:
+    """
+    The synthetic accounts and transactions the mock banks serve, generated once. Transactions are kept
+    newest first, as the banks return them, so a date window is a prefix of each list.
+    """
+
+    def __init__(self, transactions=MOCK_TRANSACTIONS, accounts=MOCK_ACCOUNTS):
+        self.ing_accounts, self.ing_balances, self.ing_transactions = [], {}, {}
+        for data in generate_ing_payload(transactions, accounts).values():
+            account = data['accounts'][0]
+            self.ing_accounts.append(account)
+            self.ing_balances[account['resourceId']] = data['balances'][0]
+            booked = data['transactions'][0]['transactions']['booked']
+            self.ing_transactions[account['resourceId']] = sorted(booked, key=lambda t: t['bookingDate'],
+                                                                  reverse=True)
+        self.abn_accounts, self.abn_transactions = {}, {}
+        for iban, data in generate_abn_payload(transactions, accounts).items():
+            self.abn_accounts[iban] = data['account']
+            self.abn_transactions[iban] = sorted(data['transactions'], key=lambda t: t['transactionTimestamp'],
+                                                 reverse=True)
+        self.abn_ibans = list(self.abn_accounts)
+
+    def abn_iban_for(self, access_token):
+        """The account an ABN AMRO access token is consented to; the same token always gets the same account."""
+        return self.abn_ibans[zlib.crc32(access_token.encode('utf-8')) % len(self.abn_ibans)]
+
+
+class MockBankHandler(BaseHTTPRequestHandler):
+    """
+    Shared request handling of the mock banks: keep-alive HTTP/1.1, JSON responses, the configured latency
+    and injected failures, and request statistics. Subclasses map paths to handlers in ROUTES.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Buffer the response so headers and body leave in one write instead of one packet per header line
+    wbufsize = 65536
+    ROUTES = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        form = dict(parse_qsl(self.rfile.read(length).decode('utf-8'))) if length else {}
+
+        if url.path == '/mock/stats':
+            return self.reply(200, server.stats_snapshot())
+        server.count('requests')
+        if server.latency or server.latency_jitter:
+            time.sleep(server.latency + random.uniform(0, server.latency_jitter))
+
+        roll = server.random()
+        if roll < server.rate_limit_rate:
+            server.count('rate_limited')
+            return self.reply(429, {'message': 'Too many requests'}, {'Retry-After': str(server.retry_after)})
+        if roll < server.rate_limit_rate + server.error_rate:
+            server.count('errors')
+            return self.reply(503, {'message': 'Service temporarily unavailable'})
+
+        for route_method, pattern, handler_name in self.ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                server.count(handler_name)
+                query = dict(parse_qsl(url.query))
+                return getattr(self, handler_name)(*match.groups(), query=query, form=form)
+        server.count('not_found')
+        self.reply(404, {'message': f'No mock for {method} {url.path}'})
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def bearer_token(self):
+        """The request's bearer token; answers 401 and returns None without one."""
+        authorization = self.headers.get('Authorization') or ''
+        if not authorization.startswith('Bearer '):
+            self.reply(401, {'message': 'Missing bearer token'})
+            return None
+        return authorization[len('Bearer '):]
+
+    def token_response(self, form):
+        grant_type = form.get('grant_type')
+        if grant_type == 'client_credentials':
+            return {'access_token': f"app-{os.urandom(8).hex()}", 'token_type': 'Bearer',
+                    'expires_in': ACCESS_TOKEN_SECONDS, 'client_id': form.get('client_id', 'mock-client')}
+        if grant_type in ('refresh_token', 'authorization_code'):
+            refresh_token = form.get('refresh_token') or f"refresh-{os.urandom(8).hex()}"
+            return {'access_token': f"customer-{os.urandom(8).hex()}", 'token_type': 'Bearer',
+                    'expires_in': ACCESS_TOKEN_SECONDS, 'refresh_token': refresh_token,
+                    'refresh_token_expires_in': REFRESH_TOKEN_SECONDS}
+        return None
+
+
+class MockINGHandler(MockBankHandler):
+    """The ING endpoints the fetchers use: oauth2/token, accounts, balances and paged transactions."""
+    ROUTES = [
+        ('POST', r'/oauth2/token', 'token'),
+        ('GET', r'/v3/accounts', 'accounts'),
+        ('GET', r'/v3/accounts/([^/]+)/balances', 'balances'),
+        ('GET', r'/v2/accounts/([^/]+)/transactions', 'transactions'),
+    ]
+
+    def token(self, query, form):
+        if 'Signature' not in (self.headers.get('Authorization') or '') + (self.headers.get('Signature') or ''):
+            return self.reply(401, {'message': 'Missing request signature'})
+        token_data = self.token_response(form)
+        if token_data is None:
+            return self.reply(400, {'error': 'unsupported_grant_type'})
+        self.reply(200, token_data)
+
+    def accounts(self, query, form):
+        if self.bearer_token() is not None:
+            self.reply(200, {'accounts': self.server.data.ing_accounts})
+
+    def balances(self, resource_id, query, form):
+        if self.bearer_token() is None:
+            return
+        if resource_id not in self.server.data.ing_balances:
+            return self.reply(404, {'message': 'Unknown account'})
+        self.reply(200, self.server.data.ing_balances[resource_id])
+
+    def transactions(self, resource_id, query, form):
+        if self.bearer_token() is None:
+            return
+        booked = self.server.data.ing_transactions.get(resource_id)
+        if booked is None:
+            return self.reply(404, {'message': 'Unknown account'})
+        date_from = query.get('dateFrom')
+        if date_from:
+            booked = [transaction for transaction in booked if transaction['bookingDate'] >= date_from]
+        page, next_offset = _page(booked, int(query.get('offset', 0)), self.server.page_size)
+        transactions = {'booked': page, 'pending': []}
+        if next_offset is not None:
+            params = f"dateFrom={date_from}&offset={next_offset}" if date_from else f"offset={next_offset}"
+            transactions['_links'] = {'next': {'href': f"/v2/accounts/{resource_id}/transactions?{params}"}}
+        account = next(a for a in self.server.data.ing_accounts if a['resourceId'] == resource_id)
+        self.reply(200, {'account': {'iban': account['iban']}, 'transactions': transactions})
+
+
+class MockABNHandler(MockBankHandler):
+    """The ABN AMRO endpoints: the token endpoint, consent info, and the accounts' details, balances and transactions."""
+    ROUTES = [
+        ('POST', r'/as/token\.oauth2', 'token'),
+        ('GET', r'/v1/consentinfo', 'consent_info'),
+        ('GET', r'/v1/accounts/([^/]+)/details', 'details'),
+        ('GET', r'/v1/accounts/([^/]+)/balances', 'balances'),
+        ('GET', r'/v1/accounts/([^/]+)/transactions', 'transactions'),
+    ]
+
+    def token(self, query, form):
+        token_data = self.token_response(form)
+        if token_data is None:
+            return self.reply(400, {'error': 'unsupported_grant_type'})
+        self.reply(200, token_data)
+
+    def consented_iban(self, iban=None):
+        """The IBAN the request's token is consented to; answers 401/403 and returns None otherwise."""
+        access_token = self.bearer_token()
+        if access_token is None:
+            return None
+        consented = self.server.data.abn_iban_for(access_token)
+        if iban is not None and iban != consented:
+            self.reply(403, {'message': 'No consent for this account'})
+            return None
+        return consented
+
+    def consent_info(self, query, form):
+        iban = self.consented_iban()
+        if iban:
+            self.reply(200, {'iban': iban, 'scopes': 'psd2:account:balance:read psd2:account:transaction:read',
+                             'valid': ACCESS_TOKEN_SECONDS, 'transactionId': os.urandom(8).hex()})
+
+    def details(self, iban, query, form):
+        if self.consented_iban(iban):
+            account = self.server.data.abn_accounts[iban]
+            self.reply(200, {'accountNumber': iban, 'currency': account['currency'], 'accountHolderName': 'J. Doe'})
+
+    def balances(self, iban, query, form):
+        if self.consented_iban(iban):
+            account = self.server.data.abn_accounts[iban]
+            self.reply(200, {'accountNumber': iban, 'amount': account['balance'], 'currency': account['currency'],
+                             'balanceType': 'booked'})
+
+    def transactions(self, iban, query, form):
+        if not self.consented_iban(iban):
+            return
+        transactions = self.server.data.abn_transactions[iban]
+        date_from = query.get('bookDateFrom')
+        if date_from:
+            transactions = [transaction for transaction in transactions if transaction['bookDate'] >= date_from]
+        page, next_offset = _page(transactions, int(query.get('nextPageKey', 0)), self.server.page_size)
+        response = {'accountNumber': iban, 'transactions': page}
+        if next_offset is not None:
+            response['nextPageKey'] = str(next_offset)
+        self.reply(200, response)
+
+
+class MockBankServer(ThreadingHTTPServer):
+    """One mock bank over mutual TLS, serving each connection on its own thread."""
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, handler_class, port, data, certificates, page_size, latency=MOCK_LATENCY,
+                 latency_jitter=MOCK_LATENCY_JITTER, error_rate=MOCK_ERROR_RATE,
+                 rate_limit_rate=MOCK_RATE_LIMIT_RATE, retry_after=MOCK_RETRY_AFTER, seed=None):
+        super().__init__((MOCK_HOST, port), handler_class)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certificates['server_cert'], certificates['server_key'])
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.load_verify_locations(certificates['client_cert'])
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.data = data
+        self.page_size = page_size
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._stats = Counter()
+        self._lock = threading.Lock()
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats_snapshot(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class MockBanks:
+    """
+    Runs the mock ING and ABN AMRO servers on background threads, e.g. for a benchmark in the same process:
+
+        with MockBanks(transactions=100000, error_rate=0.02) as banks:
+            ...   # point the fetchers at banks.ing_url / banks.abn_url with banks.certificates
+    """
+
+    def __init__(self, work_dir=WORK_DIR, transactions=MOCK_TRANSACTIONS, accounts=MOCK_ACCOUNTS, ing_port=ING_PORT,
+                 abn_port=ABN_PORT, seed=None, **options):
+        self.certificates = write_test_certificates(work_dir)
+        self.data = MockBankData(transactions, accounts)
+        self.servers = {
+            'ING': MockBankServer(MockINGHandler, ing_port, self.data, self.certificates, ING_PAGE_SIZE,
+                                  seed=seed, **options),
+            'ABN_AMRO': MockBankServer(MockABNHandler, abn_port, self.data, self.certificates, ABN_PAGE_SIZE,
+                                       seed=seed, **options),
+        }
+        self.ing_url = f"https://{MOCK_HOST}:{ing_port}"
+        self.abn_url = f"https://{MOCK_HOST}:{abn_port}"
+        self.threads = []
+
+    def start(self):
+        for server in self.servers.values():
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stats(self):
+        return {bank: server.stats_snapshot() for bank, server in self.servers.items()}
+
+    def close(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    # Usage: python MockBankServer.py [--transactions=N] [--accounts=N] [--latency=SECONDS] [--error-rate=0.05]
+    #                                 [--rate-limit-rate=0.05] [--seed=N] [--work-dir=DIR]
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    latency = float(options.get('latency', MOCK_LATENCY))
+    banks = MockBanks(work_dir=options.get('work-dir', WORK_DIR),
+                      transactions=int(options.get('transactions', MOCK_TRANSACTIONS)),
+                      accounts=int(options.get('accounts', MOCK_ACCOUNTS)),
+                      seed=int(options['seed']) if 'seed' in options else None,
+                      latency=latency, latency_jitter=MOCK_LATENCY_JITTER if latency else 0.0,
+                      error_rate=float(options.get('error-rate', MOCK_ERROR_RATE)),
+                      rate_limit_rate=float(options.get('rate-limit-rate', MOCK_RATE_LIMIT_RATE)))
+    banks.start()
+    print(f"--- Mock ING at {banks.ing_url}, mock ABN AMRO at {banks.abn_url} ---")
+    print(f"    -> Server certificate (trust it with SSL_CERT_FILE / REQUESTS_CA_BUNDLE): "
+          f"{banks.certificates['server_cert']}")
+    print(f"    -> Client and ING signing certificate: {banks.certificates['client_cert']}, "
+          f"key: {banks.certificates['client_key']}")
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n--- Requests served: {banks.stats()} ---")
+        banks.close()
@@ -0,0 +1,247 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from itertools import groupby
+from RowPipeline import batched
+
+# zstandard is optional: it compresses better and faster than gzip; gzip is used without it
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# --- Configuration ---
+ARCHIVE_DIR = 'archive'
+INDEX_FILE = 'index.db'
+
+# Records per archived page; pages are the unit of deduplication and of random access
+ARCHIVE_PAGE_RECORDS = 1000
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+# Record fields that carry the record's date, in order of preference
+RECORD_DATE_FIELDS = ('bookingDate', 'bookDate', 'valueDate', 'transactionTimestamp',
+                      'referenceDate', 'lastChangeDateTime')
+
+CODECS = {'gzip': '.ndjson.gz', 'zstd': '.ndjson.zst'}
+
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def _compress(codec, data):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _decompress(codec, data):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("This archive segment is zstd-compressed; install 'zstandard' to read it.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def record_date(record):
+    """The record's date (YYYY-MM-DD), or None for records without one, such as accounts."""
+    data = record.get('data') or {}
+    for field in RECORD_DATE_FIELDS:
+        if data.get(field):
+            return str(data[field])[:10]
+    return None
+
+
+def encode_page(records):
+    """Canonical NDJSON for a page: keys sorted, so the same content always has the same hash."""
+    return ''.join(json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n'
+                   for record in records).encode('utf-8')
+
+
+class PayloadArchive:
+    """
+    Append-only store for raw bank records.
+
+    Records are archived in pages. Each page is compressed on its own (gzip, or zstd when installed)
+    and appended to a segment file; concatenated gzip members and zstd frames are still valid files,
+    so a segment can also be read with zcat/zstdcat. A page whose SHA-256 is already archived is not
+    stored again. An SQLite index keeps, per page, the bank, account, date range and the byte range
+    in its segment, so a replay reads and decompresses only the pages of the requested window.
+    """
+
+    def __init__(self, archive_dir=ARCHIVE_DIR, codec=None):
+        self.archive_dir = archive_dir
+        self.codec = codec or default_codec()
+        if self.codec not in CODECS:
+            raise ValueError(f"Unknown codec '{self.codec}'. Available: {', '.join(CODECS)}")
+        os.makedirs(archive_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(archive_dir, INDEX_FILE))
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS segments (
+            segment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL UNIQUE,
+            codec TEXT NOT NULL,
+            created_at DATETIME
+        )''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS pages (
+            page_pk INTEGER PRIMARY KEY AUTOINCREMENT,
+            page_hash TEXT NOT NULL UNIQUE,
+            bank TEXT NOT NULL,
+            account TEXT,
+            date_from TEXT,
+            date_to TEXT,
+            record_count INTEGER NOT NULL,
+            segment_id INTEGER NOT NULL,
+            byte_offset INTEGER NOT NULL,
+            byte_length INTEGER NOT NULL,
+            raw_length INTEGER NOT NULL,
+            archived_at DATETIME,
+            FOREIGN KEY (segment_id) REFERENCES segments (segment_id)
+        )''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_window ON pages (bank, account, date_from, date_to)")
+        self.conn.commit()
+        self._segments = {}
+
+    def _segment_for(self, bank):
+        """One segment file per bank per archive session, created on the first new page."""
+        if bank not in self._segments:
+            stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+            relative_path = os.path.join(bank.lower(), f"{stamp}{CODECS[self.codec]}")
+            os.makedirs(os.path.join(self.archive_dir, bank.lower()), exist_ok=True)
+            cursor = self.conn.execute("INSERT INTO segments (path, codec, created_at) VALUES (?, ?, ?)",
+                                       (relative_path, self.codec, datetime.now(timezone.utc).isoformat()))
+            self._segments[bank] = (cursor.lastrowid, open(os.path.join(self.archive_dir, relative_path), 'ab'))
+        return self._segments[bank]
+
+    def add_page(self, bank, account, records):
+        """Archives one page of records. Returns False if an identical page is already archived."""
+        raw = encode_page(records)
+        page_hash = hashlib.sha256(raw).hexdigest()
+        if self.conn.execute("SELECT 1 FROM pages WHERE page_hash = ?", (page_hash,)).fetchone():
+            return False
+
+        segment_id, segment_file = self._segment_for(bank)
+        compressed = _compress(self.codec, raw)
+        offset = segment_file.tell()
+        segment_file.write(compressed)
+        # The bytes are on disk before the index points at them
+        segment_file.flush()
+
+        dates = [date for date in map(record_date, records) if date]
+        self.conn.execute('''
+        INSERT INTO pages (page_hash, bank, account, date_from, date_to, record_count,
+                           segment_id, byte_offset, byte_length, raw_length, archived_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (page_hash, bank, account, min(dates, default=None), max(dates, default=None), len(records),
+              segment_id, offset, len(compressed), len(raw), datetime.now(timezone.utc).isoformat()))
+        self.conn.commit()
+        return True
+
+    def archive_records(self, bank, records, page_records=ARCHIVE_PAGE_RECORDS):
+        """
+        Stage that passes records through unchanged while archiving them, in pages of up to
+        `page_records` consecutive records of the same account. Checkpoint records only mark where the
+        loaders commit: they end the current page and are passed on without being archived.
+        """
+        stats = {'pages': 0, 'new_pages': 0}
+        for (account, checkpoint), account_records in groupby(
+                records, key=lambda record: (record.get('iban'), record.get('type') == 'checkpoint')):
+            if checkpoint:
+                yield from account_records
+                continue
+            for page in batched(account_records, page_records):
+                stats['pages'] += 1
+                stats['new_pages'] += self.add_page(bank, account, page)
+                yield from page
+        print(f"    -> Archived {stats['new_pages']} new page(s) of {stats['pages']} "
+              f"({stats['pages'] - stats['new_pages']} already in the archive).")
+
+    def iter_records(self, bank, account=None, date_from=None, date_to=None):
+        """
+        Replays archived records of one bank in the order they were archived. Only pages whose date range
+        overlaps [date_from, date_to] are read; within them, dated records outside the window are skipped.
+        Records without a date (accounts) are always replayed, so the loaders can recreate their rows.
+        """
+        conditions, params = ["p.bank = ?"], [bank]
+        if account:
+            conditions.append("p.account = ?")
+            params.append(account)
+        if date_from:
+            conditions.append("(p.date_to IS NULL OR p.date_to >= ?)")
+            params.append(date_from[:10])
+        if date_to:
+            conditions.append("(p.date_from IS NULL OR p.date_from <= ?)")
+            params.append(date_to[:10])
+        pages = self.conn.execute(f'''
+        SELECT s.path, s.codec, p.byte_offset, p.byte_length
+        FROM pages p JOIN segments s ON s.segment_id = p.segment_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY p.page_pk''', params).fetchall()
+
+        open_files = {}
+        try:
+            for path, codec, offset, length in pages:
+                if path not in open_files:
+                    open_files[path] = open(os.path.join(self.archive_dir, path), 'rb')
+                segment_file = open_files[path]
+                segment_file.seek(offset)
+                for line in _decompress(codec, segment_file.read(length)).splitlines():
+                    record = json.loads(line)
+                    date = record_date(record)
+                    if date and ((date_from and date < date_from[:10]) or (date_to and date > date_to[:10])):
+                        continue
+                    yield record
+        finally:
+            for segment_file in open_files.values():
+                segment_file.close()
+
+    def summary(self):
+        """Per bank and account: pages, records, date range, and raw vs compressed bytes."""
+        return self.conn.execute('''
+        SELECT bank, account, COUNT(*), SUM(record_count), MIN(date_from), MAX(date_to),
+               SUM(raw_length), SUM(byte_length)
+        FROM pages GROUP BY bank, account ORDER BY bank, account''').fetchall()
+
+    def close(self):
+        for _, segment_file in self._segments.values():
+            segment_file.close()
+        self._segments = {}
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    # Usage: python PayloadArchive.py list
+    #        python PayloadArchive.py add <ING|ABN_AMRO> <export file (.ndjson or .json)>
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    archive = PayloadArchive()
+    try:
+        if command == 'add' and len(sys.argv) == 4:
+            # The loaders own the record format; they live in the bank folders
+            sys.path[:0] = ['ING', 'ABN']
+            import ABNtoDB
+            import INGtoDB
+            loaders = {'ING': INGtoDB, 'ABN_AMRO': ABNtoDB}
+            bank, export_file = sys.argv[2].upper(), sys.argv[3]
+            if bank not in loaders:
+                print(f"!!! ERROR: Unknown bank '{bank}'. Available: {', '.join(loaders)} !!!")
+                sys.exit(1)
+            print(f"--- Archiving '{export_file}' ({bank}) ---")
+            for _ in archive.archive_records(bank, loaders[bank].iter_records(export_file)):
+                pass
+        elif command == 'list':
+            print(f"--- Archive '{archive.archive_dir}' ---")
+            for bank, account, pages, records, date_from, date_to, raw_bytes, stored_bytes in archive.summary():
+                print(f"    {bank:<9} {account or '-':<24} {pages:>6} page(s) {records:>9} record(s)  "
+                      f"{date_from or '?'} .. {date_to or '?'}  {raw_bytes / max(stored_bytes, 1):.1f}x compressed")
+        else:
+            print("Usage: python PayloadArchive.py list | add <ING|ABN_AMRO> <export file>")
+            sys.exit(1)
+    finally:
+        archive.close()
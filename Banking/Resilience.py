@@ -0,0 +1,231 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qs, urlsplit
+import requests
+
+# httpx is optional, as in AsyncBankClient; its transport errors are classified like those of requests
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# --- Configuration ---
+# Attempts after the first one, for a failure that is worth retrying
+MAX_RETRIES = 4
+# Exponential backoff: attempt n waits a random time up to min(BACKOFF_MAX, BACKOFF_BASE * 2**n) seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# Responses worth retrying: rate limited, or a temporary server-side failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Only these methods are retried after the request may have reached the server; other methods (the token
+# POSTs) are retried only when the server turned them away with 429 or the connection was never made
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+# Token POSTs with these grant types are retried like a GET: repeating one only issues another application
+# token. Refresh token grants are not, since the bank may already have used up the refresh token.
+IDEMPOTENT_GRANT_TYPES = {'client_credentials'}
+# Seconds one request may take in total, all attempts and waits included
+REQUEST_DEADLINE = 90
+
+# Per host: after this many failures in a row the circuit opens and requests fail at once, without being sent,
+# for BREAKER_RESET_SECONDS; then a single trial request decides whether it closes again
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to a host whose circuit breaker is open."""
+
+
+def retry_after_seconds(headers):
+    """
+    The wait the server asked for in a Retry-After header, in seconds (which it may give as a number
+    or as an HTTP date); None without a usable header.
+    """
+    value = (headers or {}).get('Retry-After') or (headers or {}).get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number `attempt` (0 for the first retry): "full jitter", a random time up to
+    the exponential backoff, so clients that failed together do not retry together. A Retry-After from the
+    server is honoured as the minimum wait.
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after) if retry_after is not None else delay
+
+
+def _request_not_sent(error):
+    """Whether the request failed before it could reach the server (so retrying cannot repeat it)."""
+    if isinstance(error, (requests.exceptions.ConnectTimeout, ConnectionRefusedError)):
+        return True
+    return httpx is not None and isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+
+
+def _transport_failed(error):
+    """Whether the request failed in transport (connection dropped, timed out) rather than with a response."""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError,
+                          TimeoutError)):
+        return True
+    return httpx is not None and isinstance(error, httpx.TransportError)
+
+
+def is_idempotent(method, body=None):
+    """Whether a request may be repeated after it reached the server: by its method, or the grant type it posts."""
+    if method.upper() in IDEMPOTENT_METHODS:
+        return True
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    if not isinstance(body, str):
+        return False
+    return any(grant in IDEMPOTENT_GRANT_TYPES for grant in parse_qs(body).get('grant_type', []))
+
+
+def is_retryable(method, status_code=None, error=None, body=None):
+    """Whether a failed attempt is worth retrying: by the response status, or by the exception it raised."""
+    idempotent = is_idempotent(method, body)
+    if status_code is not None:
+        return status_code in RETRY_STATUSES and (idempotent or status_code == 429)
+    if isinstance(error, CircuitOpenError):
+        return False
+    return _request_not_sent(error) or (idempotent and _transport_failed(error))
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker. Closed: requests go through. After `threshold` failures in a row it opens:
+    requests fail at once with CircuitOpenError, sparing a host that is down (and the run) from every request
+    waiting for its own timeouts and retries. After `reset_seconds` one trial request is let through
+    (half-open); its success closes the circuit, its failure opens it again. Safe to share between threads
+    and to use from an event loop: it never blocks.
+    """
+
+    def __init__(self, host, threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.host = host
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raises CircuitOpenError unless the request may be sent; returns True if it is the half-open trial."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at >= self.reset_seconds and not self._trial_running:
+                self._trial_running = True
+                return True
+        raise CircuitOpenError(f"Circuit open for {self.host} after {self._failures} failures in a row")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    print(f"    -> WARNING: {self.host} failed {self._failures} times in a row; "
+                          f"pausing requests to it for {self.reset_seconds}s.")
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+    def release_trial(self):
+        """
+        Lets the next request be the trial, after the trial ended without a result (it was cancelled, or
+        raised an unexpected error). Otherwise the circuit would stay open for the rest of the process.
+        """
+        with self._lock:
+            self._trial_running = False
+
+
+def get_breaker(url):
+    """The shared circuit breaker of the URL's host."""
+    host = urlsplit(url).netloc
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+class RetryState:
+    """
+    Tracks the attempts of one request against its deadline and decides, after each failure,
+    whether and how long to wait before the next attempt.
+    """
+
+    def __init__(self, method, url, deadline=REQUEST_DEADLINE, max_retries=MAX_RETRIES, body=None):
+        self.method = method
+        self.body = body
+        self.breaker = get_breaker(url)
+        self.deadline_at = time.monotonic() + deadline
+        self.max_retries = max_retries
+        self.retries = 0
+        # Whether the attempt in progress is the breaker's half-open trial and has not reported yet
+        self._trial = False
+
+    def remaining(self):
+        """Seconds left until the deadline."""
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    def attempt_timeout(self, timeout):
+        """The (connect, read) timeout of the next attempt, cut short so the attempt ends by the deadline."""
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        remaining = max(self.remaining(), 0.001)
+        return (min(connect_timeout or remaining, remaining), min(read_timeout or remaining, remaining))
+
+    def before_attempt(self):
+        """Raises CircuitOpenError unless the host's circuit lets the next attempt through."""
+        self._trial = self.breaker.before_request()
+
+    def end_attempt(self):
+        """
+        Called when an attempt ends, however it ends. An attempt that has not reported success or failure
+        by then (cancelled, or an unexpected error) gives up its trial, if it was the breaker's trial.
+        """
+        if self._trial:
+            self._trial = False
+            self.breaker.release_trial()
+
+    def succeeded(self):
+        self._trial = False
+        self.breaker.record_success()
+
+    def next_delay(self, status_code=None, headers=None, error=None):
+        """
+        Records a failed attempt and returns the seconds to wait before retrying it, or None if it should not
+        be retried: not retryable, out of retries, or the wait would run past the deadline.
+        """
+        self._trial = False
+        # A 429 means the host is up but wants fewer requests; it does not count against the circuit
+        if status_code == 429:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        if self.retries >= self.max_retries or not is_retryable(self.method, status_code, error, self.body):
+            return None
+        delay = backoff_delay(self.retries, retry_after_seconds(headers))
+        if delay >= self.remaining():
+            return None
+        self.retries += 1
+        return delay
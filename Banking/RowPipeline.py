@@ -0,0 +1,139 @@
+import sqlite3
+from itertools import islice
+
+# --- Configuration ---
+# Rows pulled from a source cursor per fetchmany() call
+FETCH_CHUNK_ROWS = 5000
+# Rows handed to one executemany() call
+WRITE_BATCH_ROWS = 5000
+
+
+def apply_bulk_write_pragmas(conn):
+    """
+    Tunes a connection for loading many rows into a database that is kept afterwards.
+    Unlike DBMerger.apply_bulk_load_pragmas, journaling and sync are left alone: these files
+    accumulate history across imports and must survive a crash. A load commits only at the end
+    and at account checkpoints (see checkpoint_record), so there are few syncs to pay for anyway.
+    """
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -100000")  # ~100 MB page cache, keeps the UNIQUE index pages in memory
+
+
+def checkpoint_record(iban, account_id):
+    """
+    The streaming record a fetcher emits once all pages of an account have been fetched. The loaders commit
+    everything before it, so a sync that fails later keeps the accounts it completed and can resume from them.
+    """
+    return {"iban": iban, "type": "checkpoint", "account": account_id}
+
+
+def iter_rows(cursor, sql, params=(), chunk_rows=FETCH_CHUNK_ROWS):
+    """
+    Runs a query and yields its rows one at a time, fetching `chunk_rows` at a time,
+    so at most one chunk of the result is held in memory.
+    """
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield from rows
+
+
+def iter_table(conn, table, chunk_rows=FETCH_CHUNK_ROWS, as_dicts=True):
+    """Streams every row of a table, as plain dicts by default (what the mappers expect)."""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    rows = iter_rows(cursor, f"SELECT * FROM {table}", chunk_rows=chunk_rows)
+    return (dict(row) for row in rows) if as_dicts else rows
+
+
+def transform(rows, *stages):
+    """
+    Chains generator stages over a row stream. Each stage is a function that takes
+    an iterable of rows and returns (or yields) a new one; nothing runs until the result is consumed.
+    """
+    for stage in stages:
+        rows = stage(rows)
+    return rows
+
+
+def map_stage(func):
+    """Stage that applies `func` to every row."""
+    return lambda rows: (func(row) for row in rows)
+
+
+def filter_stage(predicate):
+    """Stage that keeps only the rows for which `predicate` is true."""
+    return lambda rows: (row for row in rows if predicate(row))
+
+
+def batched(rows, batch_rows=WRITE_BATCH_ROWS):
+    """Yields lists of up to `batch_rows` rows."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_rows))
+        if not batch:
+            return
+        yield batch
+
+
+def write_rows(cursor, sql, rows, batch_rows=WRITE_BATCH_ROWS):
+    """
+    Sink: inserts a row stream with one executemany() per batch and returns the number of rows written.
+    The same statement text is reused for every batch, so SQLite compiles it only once.
+    """
+    written = 0
+    for batch in batched(rows, batch_rows):
+        cursor.executemany(sql, batch)
+        written += len(batch)
+    return written
+
+
+class DynamicTableWriter:
+    """
+    Sink for dict rows whose keys are not known up front. A key that is not yet a column of the
+    table is added with ALTER TABLE ADD COLUMN (as TEXT) the first time it is seen; rows are
+    buffered and inserted with executemany() using one statement per column set.
+    """
+
+    def __init__(self, cursor, table, verb='INSERT OR IGNORE INTO', batch_rows=WRITE_BATCH_ROWS):
+        self.cursor = cursor
+        self.table = table
+        self.verb = verb
+        self.batch_rows = batch_rows
+        cursor.execute(f'PRAGMA table_info("{table}")')
+        self.columns = [column[1] for column in cursor.fetchall()]
+        self._known = set(self.columns)
+        self._insert_columns = []
+        self._insert_set = set()
+        self._buffer = []
+        self.written = 0
+        self.added_columns = []
+
+    def write(self, row):
+        new_keys = [key for key in row if key not in self._known]
+        if new_keys:
+            self.flush()
+            for key in new_keys:
+                self.cursor.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{key}" TEXT')
+                self._known.add(key)
+                self.columns.append(key)
+                self.added_columns.append(key)
+        if not self._insert_set.issuperset(row):
+            # Insert with every column seen so far, so most rows share one statement
+            self.flush()
+            self._insert_set.update(row)
+            self._insert_columns = [column for column in self.columns if column in self._insert_set]
+        self._buffer.append([row.get(column) for column in self._insert_columns])
+        if len(self._buffer) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        column_sql = ', '.join(f'"{column}"' for column in self._insert_columns)
+        placeholders = ', '.join(['?'] * len(self._insert_columns))
+        self.cursor.executemany(f'{self.verb} "{self.table}" ({column_sql}) VALUES ({placeholders})', self._buffer)
+        self.written += len(self._buffer)
+        self._buffer = []
@@ -0,0 +1,146 @@
+import random
+import sys
+from datetime import datetime, timedelta
+
+# --- Configuration ---
+# Output files, in the same newline-delimited format the fetchers write
+ING_OUTPUT_FILE = 'ING/ing_data_output.ndjson'
+ABN_OUTPUT_FILE = 'ABN/abn_amro_data_output.ndjson'
+DEFAULT_TRANSACTIONS = 10000
+DEFAULT_ACCOUNTS = 2
+HISTORY_START = datetime(2023, 1, 1)
+HISTORY_DAYS = 730
+
+MERCHANTS = [
+    ('Albert Heijn 1234', 'NL12ABNA0000001234'), ('Jumbo Utrecht', 'NL45INGB0000004567'),
+    ('Netflix.com', 'NL77RABO0000007777'), ('NS Groep', 'NL33INGB0000003333'),
+    ('Restaurant De Kas', 'NL21ABNA0000002121'), ('Coolblue BV', 'NL88RABO0000008888'),
+    ('Kruidvat 22', 'NL54INGB0000005454'), ('Vattenfall', 'NL66ABNA0000006666'),
+    ('Spotify AB', 'NL99RABO0000009999'), ('J. Jansen', 'NL10INGB0000001010'),
+]
+SALARY = ('Werkgever BV Salaris', 'NL01ABNA0000000001')
+
+
+def _random_moment(rnd):
+    return HISTORY_START + timedelta(seconds=rnd.randint(0, HISTORY_DAYS * 86400))
+
+
+def generate_mixed_format_dates(count, seed=42):
+    """
+    Returns date strings in the mix of shapes the bank feeds produce: ING dates and ISO timestamps
+    (with 'Z', offsets and fractions), ABN AMRO 'YYYY-MM-DD-HH:MM:SS:ms', and the odd empty value.
+    """
+    rnd = random.Random(seed)
+    values = []
+    for _ in range(count):
+        moment = _random_moment(rnd)
+        shape = rnd.random()
+        if shape < 0.45:
+            values.append(moment.strftime('%Y-%m-%d'))
+        elif shape < 0.65:
+            values.append(moment.strftime('%Y-%m-%d-%H:%M:%S:') + f"{rnd.randint(0, 999):03d}")
+        elif shape < 0.80:
+            values.append(moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{rnd.randint(0, 999):03d}Z")
+        elif shape < 0.90:
+            values.append(moment.strftime('%Y-%m-%dT%H:%M:%S+01:00'))
+        elif shape < 0.98:
+            values.append(moment.strftime('%Y-%m-%d %H:%M:%S'))
+        else:
+            values.append(rnd.choice(['', None]))
+    return values
+
+
+def _counterparty(rnd):
+    return SALARY if rnd.random() < 0.03 else rnd.choice(MERCHANTS)
+
+
+def generate_ing_payload(transaction_count, account_count=DEFAULT_ACCOUNTS, seed=1):
+    """Builds data shaped like ing_data_output.json: {iban: {accounts, balances, transactions}}."""
+    rnd = random.Random(seed)
+    payload = {}
+    per_account = transaction_count // account_count
+    for a in range(account_count):
+        iban = f"NL{10 + a:02d}INGB{a:010d}"
+        resource_id = f"ing-res-{a:04d}"
+        booked = []
+        for i in range(per_account):
+            moment = _random_moment(rnd)
+            name, counter_iban = _counterparty(rnd)
+            amount = rnd.uniform(1500, 3500) if name == SALARY[0] else -rnd.uniform(1, 250)
+            booked.append({
+                "transactionId": f"ING-{a}-{i}",
+                "bookingDate": moment.strftime('%Y-%m-%d'),
+                "valueDate": moment.strftime('%Y-%m-%d'),
+                "executionDateTime": moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{rnd.randint(0, 999):03d}Z",
+                "transactionAmount": {"amount": f"{amount:.2f}", "currency": "EUR"},
+                "creditorName": name,
+                "creditorAccount": {"iban": counter_iban},
+                "remittanceInformationUnstructured": name,
+                "transactionType": "SEPA Credit Transfer" if amount > 0 else "Payment",
+            })
+        account = {"resourceId": resource_id, "iban": iban, "name": "John Doe", "currency": "EUR",
+                   "product": "Current Account",
+                   "_links": {"balances": {"href": f"/v3/accounts/{resource_id}/balances"},
+                              "transactions": {"href": f"/v2/accounts/{resource_id}/transactions"}}}
+        balance = {"balanceType": "expected", "balanceAmount": {"amount": f"{rnd.uniform(0, 5000):.2f}",
+                                                                "currency": "EUR"},
+                   "lastChangeDateTime": datetime.now().strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                   "referenceDate": datetime.now().strftime('%Y-%m-%d')}
+        payload[iban] = {
+            "accounts": [account],
+            "balances": [{"account": {"iban": iban}, "balances": [balance]}],
+            "transactions": [{"account": {"iban": iban}, "transactions": {"booked": booked, "pending": []}}],
+        }
+    return payload
+
+
+def generate_abn_payload(transaction_count, account_count=DEFAULT_ACCOUNTS, seed=2):
+    """Builds data shaped like abn_amro_data_output.json: {iban: {account, transactions, nextPageKey}}."""
+    rnd = random.Random(seed)
+    payload = {}
+    per_account = transaction_count // account_count
+    for a in range(account_count):
+        iban = f"NL{20 + a:02d}ABNA{a:010d}"
+        transactions = []
+        balance = rnd.uniform(0, 5000)
+        for i in range(per_account):
+            moment = _random_moment(rnd)
+            name, counter_iban = _counterparty(rnd)
+            amount = round(rnd.uniform(1500, 3500) if name == SALARY[0] else -rnd.uniform(1, 250), 2)
+            balance += amount
+            transactions.append({
+                "transactionId": f"ABN-{a}-{i}",
+                "mutationCode": "BEA" if amount < 0 else "SEPA",
+                "descriptionLines": [name, f"Pas {rnd.randint(100, 999)}"],
+                "bookDate": moment.strftime('%Y-%m-%d'),
+                "transactionTimestamp": moment.strftime('%Y-%m-%d-%H:%M:%S:') + f"{rnd.randint(0, 999):03d}",
+                "amount": amount,
+                "currency": "EUR",
+                "counterPartyName": name,
+                "counterPartyAccountNumber": counter_iban,
+                "balanceAfterMutation": round(balance, 2),
+                "accountNumber": iban,
+            })
+        payload[iban] = {"account": {"accountNumber": iban, "balance": round(balance, 2), "currency": "EUR"},
+                         "transactions": transactions}
+    return payload
+
+
+if __name__ == "__main__":
+    # Usage: python SyntheticDataGenerator.py [transactions per bank] [accounts per bank]
+    transaction_total = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_TRANSACTIONS
+    accounts_total = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ACCOUNTS
+
+    # The loaders own the record format; they live in the bank folders
+    sys.path[:0] = ['ING', 'ABN']
+    import ABNtoDB
+    import INGtoDB
+    from JsonStream import write_ndjson
+
+    print(f"--- Generating {transaction_total} synthetic transactions per bank ---")
+    for output_file, loader, payload in (
+            (ING_OUTPUT_FILE, INGtoDB, generate_ing_payload(transaction_total, accounts_total)),
+            (ABN_OUTPUT_FILE, ABNtoDB, generate_abn_payload(transaction_total, accounts_total))):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            write_ndjson(f, (record for iban, data in payload.items() for record in loader.payload_to_records(iban, data)))
+        print(f"    -> Wrote '{output_file}'")
@@ -0,0 +1,142 @@
+import re
+import sqlite3
+import hashlib
+
+# --- Configuration ---
+MERGED_DB = 'merged_data1.db'
+
+# Category -> merchant names / keywords, matched case-insensitively on whole words in the
+# description and counterparty name. When several keywords occur, the one that appears first wins.
+CATEGORY_RULES = {
+    'Groceries': ['albert heijn', 'ah to go', 'jumbo', 'lidl', 'aldi', 'dirk', 'dekamarkt', 'spar', 'ekoplaza',
+                  'picnic'],
+    'Subscriptions': ['netflix', 'spotify', 'disney plus', 'videoland', 'youtube premium', 'apple.com/bill',
+                      'amazon prime', 'hbo max'],
+    'Dining Out': ['restaurant', 'eetcafe', 'cafe', 'thuisbezorgd', 'uber eats', 'deliveroo', 'mcdonalds',
+                   'burger king', 'starbucks'],
+    'Transport': ['ns groep', 'ov-chipkaart', 'ovpay', 'gvb', 'ret', 'htm', 'shell', 'esso', 'bp', 'tinq',
+                  'uber', 'parkeren'],
+    'Housing': ['huur', 'rent', 'hypotheek', 'mortgage', 'vve'],
+    'Utilities': ['vattenfall', 'eneco', 'essent', 'greenchoice', 'waternet', 'vitens', 'ziggo', 'kpn',
+                  'odido', 'vodafone'],
+    'Insurance': ['zilveren kruis', 'menzis', 'vgz', 'centraal beheer', 'interpolis', 'verzekering'],
+    'Shopping': ['bol.com', 'coolblue', 'amazon', 'zalando', 'hema', 'action', 'ikea', 'mediamarkt'],
+    'Income': ['salary', 'salaris', 'loon', 'belastingdienst toeslag', 'duo'],
+}
+
+
+def compile_rules(rules):
+    """
+    Compiles all category rules into a single regular expression with one named group per category,
+    so every transaction is classified in one pass over its text instead of one LIKE per keyword.
+    """
+    alternatives = []
+    for index, keywords in enumerate(rules.values()):
+        # Longest keywords first, so 'uber eats' wins over 'uber'
+        escaped = sorted((re.escape(k.lower()) for k in keywords), key=len, reverse=True)
+        alternatives.append(f"(?P<c{index}>{'|'.join(escaped)})")
+    pattern = r"(?<![\w])(?:" + "|".join(alternatives) + r")(?![\w])"
+    return re.compile(pattern, re.IGNORECASE), list(rules.keys())
+
+
+_default_matcher = compile_rules(CATEGORY_RULES)
+
+
+def categorize(description, counterparty_name=None, matcher=None):
+    """Returns the category for a transaction's text, or None if no rule matches."""
+    pattern, categories = matcher or _default_matcher
+    text = f"{counterparty_name or ''} {description or ''}"
+    match = pattern.search(text)
+    return categories[int(match.lastgroup[1:])] if match else None
+
+
+def rule_hashes(rules):
+    """Returns a stable hash of each category's keyword list, used to detect rule changes."""
+    return {category: hashlib.sha256('\n'.join(sorted(k.lower() for k in keywords)).encode('utf-8')).hexdigest()
+            for category, keywords in rules.items()}
+
+
+def ensure_category_column(cursor):
+    """
+    Adds the category column and its index to a unified_transactions table created before they existed.
+    Such a database has no rule versions stored yet, so the next recategorize() fills in the existing rows.
+    """
+    cursor.execute("PRAGMA table_info(unified_transactions)")
+    if 'category' not in {column[1] for column in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE unified_transactions ADD COLUMN category TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category ON unified_transactions (category)")
+
+
+def create_category_state_table(cursor):
+    """Creates the table that remembers which version of each rule was last applied."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS category_rules_state (
+        category TEXT PRIMARY KEY,
+        rules_hash TEXT NOT NULL
+    )''')
+
+
+def store_rule_versions(cursor, rules=CATEGORY_RULES):
+    """Records the rule versions that the stored categories were computed with."""
+    create_category_state_table(cursor)
+    cursor.execute("DELETE FROM category_rules_state")
+    cursor.executemany("INSERT INTO category_rules_state (category, rules_hash) VALUES (?, ?)",
+                       rule_hashes(rules).items())
+
+
+def recategorize(conn, rules=CATEGORY_RULES):
+    """
+    Re-applies the category rules after a rule change, touching only the affected rows:
+    rows currently in a changed category, and rows whose text matches a changed category's keywords.
+    Rows whose category does not actually change are not written.
+    """
+    print("\n--- Re-applying transaction category rules ---")
+    cursor = conn.cursor()
+    create_category_state_table(cursor)
+    cursor.execute("SELECT category, rules_hash FROM category_rules_state")
+    old_hashes = dict(cursor.fetchall())
+    new_hashes = rule_hashes(rules)
+
+    changed = {c for c in set(old_hashes) | set(new_hashes) if old_hashes.get(c) != new_hashes.get(c)}
+    if not changed:
+        print("    -> Category rules unchanged. Nothing to do.")
+        return 0
+    print(f"    -> Changed categories: {', '.join(sorted(changed))}")
+
+    full_matcher = compile_rules(rules)
+    changed_rules = {c: k for c, k in rules.items() if c in changed}
+    changed_pattern = compile_rules(changed_rules)[0] if changed_rules else None
+
+    conn.create_function('categorize', 2, lambda d, n: categorize(d, n, full_matcher), deterministic=True)
+    conn.create_function('matches_changed_rules', 2,
+                         lambda d, n: bool(changed_pattern and changed_pattern.search(f"{n or ''} {d or ''}")),
+                         deterministic=True)
+
+    placeholders = ', '.join(['?'] * len(changed))
+    cursor.execute(f'''
+    UPDATE unified_transactions SET category = recomputed.new_category
+    FROM (
+        SELECT transaction_pk, categorize(description, counterparty_name) AS new_category
+        FROM unified_transactions
+        WHERE category IN ({placeholders}) OR matches_changed_rules(description, counterparty_name)
+    ) AS recomputed
+    WHERE unified_transactions.transaction_pk = recomputed.transaction_pk
+      AND unified_transactions.category IS NOT recomputed.new_category
+    ''', sorted(changed))
+    updated = cursor.rowcount
+
+    store_rule_versions(cursor, rules)
+    conn.commit()
+    print(f"    -> {updated} transaction(s) re-categorized.")
+    return updated
+
+
+if __name__ == "__main__":
+    merged_conn = None
+    try:
+        merged_conn = sqlite3.connect(MERGED_DB)
+        recategorize(merged_conn)
+    except sqlite3.Error as e:
+        print(f"\n!!! A database error occurred: {e} !!!")
+    finally:
+        if merged_conn: merged_conn.close()
@@ -0,0 +1,102 @@
+import sqlite3
+from datetime import date
+from RowPipeline import iter_rows, write_rows
+
+# --- Configuration ---
+MERGED_DB = 'merged_data1.db'
+
+# The two legs of a transfer may be booked a few days apart (weekends, batch processing)
+TRANSFER_DATE_TOLERANCE_DAYS = 3
+
+
+def _normalize_iban(iban):
+    return iban.replace(' ', '').upper() if iban else None
+
+
+def _day_number(booking_date):
+    return date.fromisoformat(booking_date[:10]).toordinal()
+
+
+def ensure_transfer_columns(cursor):
+    """Adds the transfer columns and their index to a unified_transactions table created before they existed."""
+    cursor.execute("PRAGMA table_info(unified_transactions)")
+    existing = {column[1] for column in cursor.fetchall()}
+    if 'is_internal_transfer' not in existing:
+        cursor.execute("ALTER TABLE unified_transactions ADD COLUMN is_internal_transfer INTEGER NOT NULL DEFAULT 0")
+    if 'transfer_match_pk' not in existing:
+        cursor.execute("ALTER TABLE unified_transactions ADD COLUMN transfer_match_pk INTEGER")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_internal_transfer ON unified_transactions (is_internal_transfer)")
+
+
+def match_internal_transfers(merged_cursor, tolerance_days=TRANSFER_DATE_TOLERANCE_DAYS):
+    """
+    Flags transfers between the user's own accounts, so totals can leave them out.
+
+    A pair is an outgoing and an incoming transaction of the same absolute amount, each booked on one
+    own account with the other own account's IBAN as counterparty, at most `tolerance_days` apart.
+    Unmatched incoming legs are put in a hash index keyed on (amount, account, counterparty account);
+    every outgoing leg then looks up its partner in one step instead of scanning all candidates.
+    Both legs get is_internal_transfer = 1 and each other's transaction_pk in transfer_match_pk.
+    Already matched rows are skipped, so the matcher can run after every (incremental) merge.
+    """
+    print("\n--- Matching internal transfers between own accounts ---")
+    ensure_transfer_columns(merged_cursor)
+
+    merged_cursor.execute("SELECT account_id, iban FROM unified_accounts WHERE iban IS NOT NULL")
+    own_accounts = {_normalize_iban(iban): account_id for account_id, iban in merged_cursor.fetchall()}
+    if len(own_accounts) < 2:
+        print("    -> Fewer than two own accounts with an IBAN. Nothing to match.")
+        return 0
+
+    placeholders = ', '.join(['?'] * len(own_accounts))
+    rows = iter_rows(merged_cursor, f'''
+        SELECT transaction_pk, account_id_fk, amount, booking_date, UPPER(REPLACE(counterparty_iban, ' ', ''))
+        FROM unified_transactions
+        WHERE transfer_match_pk IS NULL AND amount IS NOT NULL AND amount != 0 AND booking_date IS NOT NULL
+          AND UPPER(REPLACE(counterparty_iban, ' ', '')) IN ({placeholders})
+        ORDER BY booking_date, transaction_pk
+    ''', list(own_accounts))
+
+    incoming, outgoing = {}, []
+    for pk, account_id, amount, booking_date, counterparty_iban in rows:
+        counterparty_account = own_accounts[counterparty_iban]
+        if counterparty_account == account_id:
+            continue
+        cents = round(abs(amount) * 100)
+        leg = (pk, account_id, cents, _day_number(booking_date), counterparty_account)
+        if amount > 0:
+            incoming.setdefault((cents, account_id, counterparty_account), []).append(leg)
+        else:
+            outgoing.append(leg)
+
+    pairs = []
+    for pk, account_id, cents, day, counterparty_account in outgoing:
+        # The incoming leg was booked on the counterparty account, with this account as its counterparty
+        candidates = incoming.get((cents, counterparty_account, account_id))
+        if not candidates:
+            continue
+        best = min(candidates, key=lambda leg: abs(leg[3] - day))
+        if abs(best[3] - day) > tolerance_days:
+            continue
+        candidates.remove(best)
+        pairs.append((pk, best[0]))
+
+    flagged = write_rows(merged_cursor, '''
+        UPDATE unified_transactions SET is_internal_transfer = 1, transfer_match_pk = ?
+        WHERE transaction_pk = ?
+    ''', ((partner, pk) for pair in pairs for pk, partner in (pair, pair[::-1])))
+    print(f"    -> Flagged {len(pairs)} internal transfer pair(s) ({flagged} transactions).")
+    return len(pairs)
+
+
+if __name__ == "__main__":
+    merged_conn = None
+    try:
+        merged_conn = sqlite3.connect(MERGED_DB)
+        match_internal_transfers(merged_conn.cursor())
+        merged_conn.commit()
+    except sqlite3.Error as e:
+        print(f"\n!!! A database error occurred: {e} !!!")
+    finally:
+        if merged_conn: merged_conn.close()
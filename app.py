@@ -4,6 +4,10 @@ import openai
 import sqlite3
 import os
 import json
+from sql_validator import get_schema_map, prepare_query
+from transaction_analytics import describe_aggregations, run_aggregation
+from Banking.TransactionCategorizer import CATEGORY_RULES
+from Banking.BalanceCompactor import GRANULARITIES, balance_over_time, total_balance_per_period
 
 # --- Setup ---
 app = Flask(__name__)
@@ -20,12 +24,16 @@ def get_db_schema(db_path: str) -> str:
     try:
         with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+            cursor.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view');")
             tables = cursor.fetchall()
+            # FTS5 keeps its index in internal shadow tables (<name>_data, <name>_idx, ...); hide them
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND sql LIKE 'CREATE VIRTUAL TABLE%fts5%';")
+            fts_tables = [row[0] for row in cursor.fetchall()]
             schema_str = ""
-            for table_name in tables:
-                table_name = table_name[0]
-                schema_str += f"Table '{table_name}':\n"
+            for table_name, object_type in tables:
+                if any(table_name.startswith(f"{fts_table}_") for fts_table in fts_tables):
+                    continue
+                schema_str += f"{object_type.capitalize()} '{table_name}':\n"
                 cursor.execute(f"PRAGMA table_info({table_name});")
                 columns = cursor.fetchall()
                 for column in columns:
@@ -36,6 +44,16 @@ def get_db_schema(db_path: str) -> str:
         return f"Error reading database schema: {e}"
 
 
+def summarize_results(user_question, db_results_str):
+    """Asks the AI to turn raw query or analytics results into a friendly answer."""
+    summarization_messages = [
+        {"role": "system", "content": "You are FinWise, a helpful financial coach. Formulate a friendly, natural language response based on the provided data. All financial amounts MUST be presented in Euros (€)."},
+        {"role": "user", "content": f"My question was: '{user_question}'. The result from the database is: {db_results_str}"}
+    ]
+    final_response = openai.chat.completions.create(model="gpt-3.5-turbo", messages=summarization_messages)
+    return final_response.choices[0].message.content
+
+
 def initialize_db():
     """Creates the dashboard_items table if it doesn't exist."""
     with sqlite3.connect(DB_FILE) as conn:
@@ -101,13 +119,26 @@ def ask_agent():
 
     system_prompt = f"""
 You are FinWise, a friendly and supportive financial coach. Your goal is to help users understand their finances.
-Based on the user's question, decide on the best action. You have four types of responses:
+Based on the user's question, decide on the best action. You have five types of responses:
 
 1.  If the user **explicitly asks to 'track', 'show on dashboard', 'add to dashboard', or 'put in slot'** a metric, you must respond with a JSON object to call the `update_dashboard` action. This JSON must contain the `action`, the `slot_id` (1, 2, or 3), a `metric_name` for the label, and the `sql_query` needed to calculate the value. Example: {{"action": "update_dashboard", "slot_id": 1, "metric_name": "Total Balance", "sql_query": "SELECT SUM(t1.amount) FROM ... "}}
 2.  If the user asks to **'clear', 'remove', or 'free up'** a slot, change the slot description to Slot Available.
-2.  If the user asks for a **chart** (e.g., 'show me a pie chart'), your ONLY output must be a JSON object with a single key "chart_sql". The value should be the SQLite query needed to get the data for that chart.
+2.  If the user asks for a **chart** (e.g., 'show me a pie chart'), your ONLY output must be a JSON object with a single key "chart_sql". The value should be the SQLite query needed to get the data for that chart. A chart of the balance over time uses the key "balance_chart" instead (see below).
 3.  For **all other data questions** (e.g. "what is...", "how much..."), your default action is to generate a standard SQL query. Respond with a JSON object with the key "sql".
 4.  For greetings or general advice, respond with a JSON object with the key "answer".
+5.  For **rolling averages, percentiles, month-over-month changes or per-counterparty distributions**, call a built-in analytics function instead of writing SQL. Respond with a JSON object with the key "analytics" (the function name) and an optional "params" object. Dates are 'YYYY-MM-DD'. Example: {{"analytics": "rolling_average", "params": {{"window_days": 7}}}}
+Available analytics functions:
+{describe_aggregations()}
+
+For monthly or per-counterparty totals, prefer the pre-aggregated tables `unified_monthly_totals` and `unified_monthly_counterparty_totals` (`month` is 'YYYY-MM', `total_spent` is negative) over summing `unified_transactions`.
+
+For the current balance per account, use the view `unified_current_balances` instead of a MAX(timestamp) subquery. For a **chart of the balance over time**, do not write SQL: respond with a JSON object with the key "balance_chart", whose value holds the optional parameters `account_id`, `date_from`, `date_to` ('YYYY-MM-DD') and `granularity` (one of {', '.join(GRANULARITIES)}; default 'day'). Without `account_id` the chart shows the total over all accounts. Example: {{"balance_chart": {{"granularity": "month", "date_from": "2024-01-01"}}}}. For other questions about past balances, use the view `unified_daily_balances` (`period` is 'YYYY-MM-DD', one closing `amount` per account per day). Older balance history is kept at daily, and beyond a year monthly, resolution.
+
+Money moved between the user's own accounts has `is_internal_transfer` = 1 (indexed) on both legs. Add `is_internal_transfer = 0` to spending, income and total questions so these transfers are not counted twice. The monthly rollup tables include internal transfers; when a question is about spending or income across accounts, sum `unified_transactions` with that filter instead.
+
+Every transaction has a `category` (indexed) that is one of: {', '.join(CATEGORY_RULES)}, or NULL when uncategorized. Filter on it for questions about spending categories instead of matching merchant names.
+
+To search transactions by merchant, description, counterparty name or IBAN, use the full-text index instead of LIKE: `transaction_pk IN (SELECT rowid FROM unified_transactions_fts WHERE unified_transactions_fts MATCH '"albert heijn"')`. Quote phrases with double quotes, use `OR` for alternatives and `*` for prefixes (e.g. 'restaurant OR eetcafe*').
 
 Here is the database schema:
 {db_schema}
@@ -130,19 +161,32 @@ Here is the database schema:
             slot_id = response_json['slot_id']
             name = response_json['metric_name']
             query = response_json['sql_query']
-            with sqlite3.connect(DB_FILE) as conn:
-                cursor = conn.cursor()
-                cursor.execute("UPDATE dashboard_items SET metric_name = ?, metric_query = ? WHERE slot_id = ?",
-                               (name, query, slot_id))
-                conn.commit()
+            try:
+                with sqlite3.connect(DB_FILE) as conn:
+                    # Store the locally repaired query so the dashboard does not fail on every refresh
+                    query = prepare_query(conn, query, get_schema_map(DB_FILE))
+                    cursor = conn.cursor()
+                    cursor.execute("UPDATE dashboard_items SET metric_name = ?, metric_query = ? WHERE slot_id = ?",
+                                   (name, query, slot_id))
+                    conn.commit()
+            except sqlite3.Error as e:
+                print(f"Dashboard query could not be validated: {e}")
+                return jsonify({"answer": f"I'm sorry, I could not validate the query for '{name}', "
+                                          f"so slot {slot_id} was not updated. Could you rephrase the request?"})
             return jsonify({"answer": f"Okay, I've updated the dashboard. Slot {slot_id} is now tracking: {name}."})
 
         elif "chart_sql" in response_json:
             sql_query = response_json["chart_sql"]
-            with sqlite3.connect(DB_FILE) as conn:
-                cursor = conn.cursor()
-                cursor.execute(sql_query)
-                results = cursor.fetchall()
+            try:
+                with sqlite3.connect(DB_FILE) as conn:
+                    sql_query = prepare_query(conn, sql_query, get_schema_map(DB_FILE))
+                    cursor = conn.cursor()
+                    cursor.execute(sql_query)
+                    results = cursor.fetchall()
+            except sqlite3.Error as e:
+                print(f"Chart query could not be validated: {e}")
+                return jsonify({"answer": "I'm sorry, I could not validate the query for that chart. "
+                                          "Could you rephrase the request?"})
             chart_type_prompt = f"Based on the user's question: '{user_question}', should the chart be a 'pie' chart or a 'bar' chart? Respond with only the word 'pie' or 'bar'."
             chart_type_response = openai.chat.completions.create(model="gpt-3.5-turbo", messages=[
                 {"role": "user", "content": chart_type_prompt}])
@@ -151,6 +195,17 @@ Here is the database schema:
             return jsonify({"type": "chart", "chart_type": chart_type, "chart_data": chart_data,
                             "answer": "Here is the chart you requested:"})
 
+        elif "balance_chart" in response_json:
+            try:
+                with sqlite3.connect(DB_FILE) as conn:
+                    balances = balance_over_time(conn, **(response_json["balance_chart"] or {}))
+            except (TypeError, ValueError, sqlite3.Error) as e:
+                return jsonify({"answer": f"I'm sorry, I could not chart that balance. {e}"})
+            periods, totals = total_balance_per_period(balances)
+            chart_data = {"labels": periods, "data": totals, "label": "Balance (€)"}
+            return jsonify({"type": "chart", "chart_type": "line", "chart_data": chart_data,
+                            "answer": "Here is your balance over time:"})
+
         elif "sql" in response_json:
             sql_query = response_json["sql"]
             final_answer = "I'm sorry, I was unable to generate a working query for your request after multiple attempts."
@@ -161,6 +216,9 @@ Here is the database schema:
                     break
                 try:
                     with sqlite3.connect(DB_FILE) as conn:
+                        # Prepare (and if possible repair) the query locally before running it,
+                        # so only errors we cannot fix ourselves cost another model call.
+                        sql_query = prepare_query(conn, sql_query, get_schema_map(DB_FILE))
                         cursor = conn.cursor()
                         cursor.execute(sql_query)
                         results = cursor.fetchall()
@@ -182,14 +240,16 @@ Here is the database schema:
                         sql_query = json.loads(correction_response.choices[0].message.content).get("sql")
 
             if query_succeeded:
-                summarization_messages = [
-                    {"role": "system", "content": "You are FinWise, a helpful financial coach. Formulate a friendly, natural language response based on the provided data. All financial amounts MUST be presented in Euros (€)."},
-                    {"role": "user", "content": f"My question was: '{user_question}'. The result from the database is: {db_results_str}"}
-                ]
-                final_response = openai.chat.completions.create(model="gpt-3.5-turbo", messages=summarization_messages)
-                final_answer = final_response.choices[0].message.content
+                final_answer = summarize_results(user_question, db_results_str)
             return jsonify({"answer": final_answer})
 
+        elif "analytics" in response_json:
+            try:
+                results = run_aggregation(response_json["analytics"], response_json.get("params"), DB_FILE)
+            except ValueError as e:
+                return jsonify({"answer": f"I'm sorry, I could not run that analysis. {e}"})
+            return jsonify({"answer": summarize_results(user_question, json.dumps(results))})
+
         elif "answer" in response_json:
             return jsonify({"answer": response_json['answer']})
 
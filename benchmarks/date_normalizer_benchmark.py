@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+
+# The Banking scripts are standalone modules; make them importable from here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Banking'))
+
+from DateNormalizer import DateNormalizer, parse_with_formats
+from SyntheticDataGenerator import generate_mixed_format_dates
+
+# --- Configuration ---
+SAMPLE_SIZE = 200000
+
+
+def legacy_to_datetime_iso(date_string):
+    """The original DBMerger.to_datetime_iso: every value goes through the full strptime format list."""
+    return parse_with_formats(date_string)[0]
+
+
+def time_it(label, func, baseline=None):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    speedup = f" ({baseline / elapsed:.1f}x)" if baseline else ""
+    print(f"    -> {label:<38} {elapsed:7.3f}s  {SAMPLE_SIZE / elapsed:>12,.0f} values/sec{speedup}")
+    return result, elapsed
+
+
+if __name__ == "__main__":
+    print(f"--- Date normalization benchmark on {SAMPLE_SIZE:,} mixed-format values ---")
+    values = generate_mixed_format_dates(SAMPLE_SIZE)
+
+    expected, legacy_time = time_it("legacy to_datetime_iso", lambda: [legacy_to_datetime_iso(v) for v in values])
+
+    normalizer = DateNormalizer()
+    per_value, _ = time_it("DateNormalizer.normalize (per value)",
+                           lambda: [normalizer.normalize(v, 'bench') for v in values], legacy_time)
+
+    column_normalizer = DateNormalizer()
+    bulk, _ = time_it("DateNormalizer.normalize_column (bulk)",
+                      lambda: column_normalizer.normalize_column(values, 'bench'), legacy_time)
+
+    if per_value != expected or bulk != expected:
+        mismatches = sum(1 for a, b in zip(per_value, expected) if a != b)
+        print(f"!!! ERROR: {mismatches} value(s) differ from the legacy output !!!")
+        sys.exit(1)
+    print("    -> Output identical to the legacy function.")
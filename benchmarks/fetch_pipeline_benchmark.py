@@ -0,0 +1,131 @@
+import contextlib
+import io
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+
+# The Banking scripts are standalone modules; make them importable from here
+BANKING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Banking')
+sys.path[:0] = [BANKING_DIR, os.path.join(BANKING_DIR, 'ING'), os.path.join(BANKING_DIR, 'ABN')]
+
+import INGDataFetcher
+import ABNDataFetcher
+import HttpClient
+import BankSync
+import INGTokenStore
+from INGTokenStore import TokenStore
+from MockBankServer import ING_PORT, ABN_PORT, MockBankData
+
+# --- Configuration ---
+DEFAULT_TRANSACTIONS = 10000
+DEFAULT_ACCOUNTS = 2
+# Customer tokens per bank. ING tokens all see every ING account; each ABN AMRO token sees one account.
+DEFAULT_TOKENS = 4
+BACKENDS = ['threads', 'async']
+# The banks' RATE_LIMITS would make the run measure the limiter; they are lifted to this unless --bank-limits
+BENCHMARK_RATE_LIMIT = (10000, 1000, HttpClient.POOL_MAXSIZE)
+
+
+def start_mock_banks(work_dir, options):
+    """Starts MockBankServer.py in its own process, so it does not compete with the fetchers for the GIL."""
+    args = [f"--{key}={value}" for key, value in options.items()]
+    process = subprocess.Popen([sys.executable, 'MockBankServer.py', f"--work-dir={work_dir}", *args],
+                               cwd=BANKING_DIR, stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.startswith('--- Mock ING at'):
+            return process
+    raise RuntimeError("The mock bank server did not start")
+
+
+def point_fetchers_at_mock(work_dir, abn_tokens):
+    """Sends every bank call to the mock servers, with the mock's certificates."""
+    server_cert = os.path.join(work_dir, 'server.crt')
+    client_cert, client_key = os.path.join(work_dir, 'client.crt'), os.path.join(work_dir, 'client.key')
+    os.environ['SSL_CERT_FILE'] = os.environ['REQUESTS_CA_BUNDLE'] = server_cert
+    INGDataFetcher.SANDBOX_HOST = f"https://localhost:{ING_PORT}"
+    INGDataFetcher.ING_TLS_CERT = INGDataFetcher.ING_SIGNING_CERT_FILE = client_cert
+    INGDataFetcher.ING_TLS_KEY = INGDataFetcher.ING_SIGNING_KEY_FILE = client_key
+    ABNDataFetcher.API_BASE_URL = f"https://localhost:{ABN_PORT}"
+    ABNDataFetcher.ABN_CERT_FILE, ABNDataFetcher.ABN_KEY_FILE = client_cert, client_key
+    ABNDataFetcher.ABN_ACCOUNT_ACCESS_TOKENS = abn_tokens
+    return client_cert, client_key
+
+
+def mock_requests(client_cert, client_key):
+    """Requests served by both mock banks so far, including injected failures."""
+    total = 0
+    for port in (ING_PORT, ABN_PORT):
+        stats = requests.get(f"https://localhost:{port}/mock/stats", cert=(client_cert, client_key)).json()
+        total += stats.get('requests', 0)
+    return total
+
+
+def run_sync(run_dir, backend, ing_tokens):
+    """One full sync into fresh raw databases; returns the seconds it took and the transactions loaded."""
+    os.makedirs(run_dir)
+    os.chdir(run_dir)
+    # A token store of its own, instead of the real one in Banking/ING
+    INGTokenStore.TOKEN_DB_FILE = os.path.join(run_dir, 'ing_tokens.db')
+    INGTokenStore.LEGACY_CSV_FILE = os.path.join(run_dir, 'ing_tokens.csv')
+    store = TokenStore()
+    for i in range(ing_tokens):
+        # Expired on purpose, so the run refreshes every token too
+        store.add(f"NL{i:02d}MOCK{i:010d}", f"Mock {i}", {'access_token': 'expired', 'refresh_token': f"refresh-{i}",
+                                                        'expires_in': 0})
+    store.close()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        BankSync.sync(backend=backend, incremental=False, merge=False)
+    elapsed = time.perf_counter() - start
+    counts = {}
+    for bank, db_file in BankSync.SOURCE_DB_FILES.items():
+        conn = sqlite3.connect(db_file)
+        counts[bank] = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        conn.close()
+    return elapsed, counts
+
+
+if __name__ == "__main__":
+    # Usage: python fetch_pipeline_benchmark.py [transactions per bank] [--accounts=N] [--tokens=N] [--latency=S]
+    #                                           [--error-rate=F] [--rate-limit-rate=F] [--bank-limits]
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    positional = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    transactions = int(positional[0]) if positional else DEFAULT_TRANSACTIONS
+    accounts = int(options.get('accounts', DEFAULT_ACCOUNTS))
+    tokens = int(options.get('tokens', DEFAULT_TOKENS))
+    mock_options = {'transactions': transactions, 'accounts': accounts, 'seed': 1,
+                    **{key: options[key] for key in ('latency', 'error-rate', 'rate-limit-rate') if key in options}}
+    if 'bank-limits' not in options:
+        HttpClient.RATE_LIMITS.update({bank: BENCHMARK_RATE_LIMIT for bank in HttpClient.RATE_LIMITS})
+
+    abn_tokens = [f"mock-abn-token-{i}" for i in range(tokens)]
+    # What a complete sync must load: the raw databases keep each transaction once
+    per_account = transactions // accounts
+    abn_accounts = {MockBankData(0, accounts).abn_iban_for(token) for token in abn_tokens}
+    expected = {'ING': accounts * per_account, 'ABN_AMRO': len(abn_accounts) * per_account}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        mock = start_mock_banks(os.path.join(work_dir, 'mock'), mock_options)
+        try:
+            client_cert, client_key = point_fetchers_at_mock(os.path.join(work_dir, 'mock'), abn_tokens)
+            print(f"--- Fetch pipeline against the mock banks: {transactions} transactions per bank, "
+                  f"{accounts} account(s), {tokens} token(s) per bank ---")
+            failed = False
+            for backend in BACKENDS:
+                served_before = mock_requests(client_cert, client_key)
+                elapsed, counts = run_sync(os.path.join(work_dir, backend), backend, tokens)
+                served = mock_requests(client_cert, client_key) - served_before
+                loaded = sum(counts.values())
+                status = "ok" if counts == expected else f"INCOMPLETE, expected {expected}"
+                failed = failed or counts != expected
+                print(f"    -> {backend:<8} {elapsed:>7.2f}s  {served / elapsed:>8,.0f} requests/sec  "
+                      f"{loaded / elapsed:>10,.0f} transactions/sec  {counts}  {status}")
+        finally:
+            os.chdir(os.path.dirname(os.path.abspath(__file__)))
+            mock.terminate()
+            mock.wait()
+    sys.exit(1 if failed else 0)
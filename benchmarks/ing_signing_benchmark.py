@@ -0,0 +1,81 @@
+import base64
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+# The Banking scripts are standalone modules; make them importable from here
+BANKING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Banking')
+sys.path[:0] = [BANKING_DIR, os.path.join(BANKING_DIR, 'ING')]
+
+import INGDataFetcher
+
+# --- Configuration ---
+DEFAULT_SIGNATURES = 500
+THREADS = 4
+SIGNED_HEADERS = ['(request-target)', 'date', 'digest', 'x-request-id']
+
+
+def write_test_credentials(work_dir):
+    """A throwaway 2048-bit signing key and self-signed certificate, like the ING example files."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'benchmark')])
+    now = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now).not_valid_after(now + timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    key_file, cert_file = os.path.join(work_dir, 'signing.key'), os.path.join(work_dir, 'signing.cer')
+    with open(key_file, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    with open(cert_file, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    return key_file, cert_file
+
+
+def legacy_signed_call(_):
+    """What every signed call used to do: read and parse the key and certificate, then sign."""
+    with open(INGDataFetcher.ING_SIGNING_KEY_FILE, "rb") as key_file:
+        private_key = serialization.load_pem_private_key(key_file.read(), password=None)
+    with open(INGDataFetcher.ING_SIGNING_CERT_FILE, 'r') as f_cert:
+        f_cert.read().replace('-----BEGIN CERTIFICATE-----', '').replace('-----END CERTIFICATE-----', '')
+    signature_bytes = private_key.sign(b"(request-target): get /v3/accounts", padding.PKCS1v15(), hashes.SHA256())
+    return base64.b64encode(signature_bytes)
+
+
+def cached_signed_call(_):
+    """A signed call through the shared signer, as the fetcher makes it now."""
+    return INGDataFetcher.create_ing_signature_header("get", "/v3/accounts", INGDataFetcher.CLIENT_ID, SIGNED_HEADERS)
+
+
+def run(call, signatures, threads):
+    start = time.perf_counter()
+    if threads == 1:
+        for i in range(signatures):
+            call(i)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(call, range(signatures)))
+    return signatures / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    # Usage: python ing_signing_benchmark.py [signatures]
+    signatures = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIGNATURES
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        INGDataFetcher.ING_SIGNING_KEY_FILE, INGDataFetcher.ING_SIGNING_CERT_FILE = write_test_credentials(work_dir)
+        print(f"--- ING request signing: {signatures} signatures per variant ---")
+        baseline = None
+        for label, call, threads in (("load + parse per call (legacy)", legacy_signed_call, 1),
+                                     ("shared signer", cached_signed_call, 1),
+                                     (f"shared signer, {THREADS} threads", cached_signed_call, THREADS)):
+            rate = run(call, signatures, threads)
+            baseline = baseline or rate
+            print(f"    -> {label:<32} {rate:>10,.0f} signatures/sec  ({rate / baseline:.2f}x)")
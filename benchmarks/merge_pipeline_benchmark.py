@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+# The Banking scripts are standalone modules; make them importable from here
+BANKING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Banking')
+sys.path[:0] = [BANKING_DIR, os.path.join(BANKING_DIR, 'ING'), os.path.join(BANKING_DIR, 'ABN')]
+
+import ABNtoDB
+import DBMerger
+import INGtoDB
+from JsonStream import write_ndjson
+from SyntheticDataGenerator import generate_abn_payload, generate_ing_payload
+
+# --- Configuration ---
+# Transactions per bank for each benchmark run
+SIZES = [10000, 100000, 1000000]
+# Stored results to compare against; created on the first run, replaced with --save-baseline
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'merge_pipeline_baseline.json')
+# A stage fails when its time or peak RSS exceeds the baseline by more than this fraction
+REGRESSION_THRESHOLD = 0.25
+# ...and by at least this many seconds, so millisecond-scale stages do not fail on timer noise
+MIN_REGRESSION_SECONDS = 0.1
+# How often the peak RSS sampler looks at the process (seconds)
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def current_rss_bytes():
+    """Resident set size of this process. Uses /proc on Linux, falls back to the lifetime maximum elsewhere."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class PeakRssSampler:
+    """Samples the RSS in a background thread while a stage runs and keeps the highest value seen."""
+
+    def __init__(self):
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+def run_stage(results, stage, rows, func):
+    """Runs one stage, records seconds, rows/sec and peak RSS, and returns the stage's result."""
+    with PeakRssSampler() as sampler:
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+    results[stage] = {"seconds": round(elapsed, 3),
+                      "rows_per_sec": round(rows / elapsed) if elapsed else None,
+                      "peak_rss_mib": round(sampler.peak / 2 ** 20, 1)}
+    print(f"    -> {stage:<18} {elapsed:8.2f}s  {results[stage]['rows_per_sec'] or 0:>12,} rows/sec  "
+          f"peak RSS {results[stage]['peak_rss_mib']:8.1f} MiB")
+    return value
+
+
+def benchmark_size(transaction_total, work_dir):
+    """Runs every pipeline stage on synthetic payloads of `transaction_total` transactions per bank."""
+    print(f"\n--- {transaction_total:,} transactions per bank ---")
+    paths = {name: os.path.join(work_dir, name) for name in
+             ('ing.json', 'abn.json', 'ing.ndjson', 'abn.ndjson', 'ing.db', 'abn.db',
+              'ing_stream.db', 'abn_stream.db', 'merged.db')}
+    for name in ('ing.db', 'abn.db', 'ing_stream.db', 'abn_stream.db', 'merged.db'):
+        if os.path.exists(paths[name]):
+            os.remove(paths[name])
+    with open(paths['ing.json'], 'w', encoding='utf-8') as f:
+        json.dump(generate_ing_payload(transaction_total), f)
+    with open(paths['abn.json'], 'w', encoding='utf-8') as f:
+        json.dump(generate_abn_payload(transaction_total), f)
+
+    rows = transaction_total * 2
+    results = {}
+    ing_data, abn_data = run_stage(results, "json_load", rows, lambda: (
+        INGtoDB.load_json_data(paths['ing.json']), ABNtoDB.load_json_data(paths['abn.json'])))
+    ing_columns, abn_columns = run_stage(results, "schema_discovery", rows, lambda: (
+        INGtoDB.discover_schema(ing_data), ABNtoDB.discover_schema(abn_data)))
+
+    def raw_insert():
+        for module, db_file, data, columns in ((INGtoDB, paths['ing.db'], ing_data, ing_columns),
+                                               (ABNtoDB, paths['abn.db'], abn_data, abn_columns)):
+            conn, cursor = module.setup_database(db_file, *columns)
+            module.save_data_to_db(conn, cursor, data, *columns)
+            conn.close()
+    run_stage(results, "raw_insert", rows, raw_insert)
+
+    for module, name, data in ((INGtoDB, 'ing', ing_data), (ABNtoDB, 'abn', abn_data)):
+        with open(paths[f'{name}.ndjson'], 'w', encoding='utf-8') as f:
+            write_ndjson(f, (record for iban, account_data in data.items()
+                             for record in module.payload_to_records(iban, account_data)))
+    del ing_data, abn_data
+
+    def stream_insert():
+        # Single-pass NDJSON ingest: parse, discover columns and insert together
+        for module, name in ((INGtoDB, 'ing'), (ABNtoDB, 'abn')):
+            conn, cursor = module.setup_database(paths[f'{name}_stream.db'], [], [])
+            module.stream_data_to_db(conn, cursor, module.iter_records(paths[f'{name}.ndjson']))
+            conn.close()
+    run_stage(results, "stream_insert", rows, stream_insert)
+
+    merged_conn, merged_cursor = DBMerger.create_unified_database(paths['merged.db'])
+
+    def merge():
+        with sqlite3.connect(paths['ing.db']) as ing_conn, sqlite3.connect(paths['abn.db']) as abn_conn:
+            DBMerger.merge_ing_data(ing_conn, merged_cursor)
+            DBMerger.merge_abn_data(abn_conn, merged_cursor)
+        merged_conn.commit()
+    run_stage(results, "merge", rows, merge)
+
+    def index_build():
+        DBMerger.update_spending_rollups(merged_cursor)
+        DBMerger.rebuild_search_index(merged_cursor)
+        merged_cursor.execute("ANALYZE")
+        merged_conn.commit()
+    run_stage(results, "index_build", rows, index_build)
+    merged_conn.close()
+    return results
+
+
+def find_regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns a description of every stage whose time or peak RSS grew more than `threshold` over the baseline."""
+    regressions = []
+    for size, stages in results.items():
+        for stage, measured in stages.items():
+            expected = baseline.get(size, {}).get(stage)
+            if not expected:
+                continue
+            for metric in ("seconds", "peak_rss_mib"):
+                if metric == "seconds" and measured[metric] - expected[metric] < MIN_REGRESSION_SECONDS:
+                    continue
+                if expected[metric] and measured[metric] > expected[metric] * (1 + threshold):
+                    regressions.append(f"{size} transactions, {stage}: {metric} {measured[metric]} "
+                                       f"vs baseline {expected[metric]} (+{threshold:.0%} allowed)")
+    return regressions
+
+
+if __name__ == "__main__":
+    # Usage: python merge_pipeline_benchmark.py [--save-baseline] [transactions per bank ...]
+    save_baseline = '--save-baseline' in sys.argv[1:]
+    sizes = [int(arg) for arg in sys.argv[1:] if arg != '--save-baseline'] or SIZES
+
+    all_results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            all_results[str(size)] = benchmark_size(size, work_dir)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    # Sizes without a baseline yet (or all of them, with --save-baseline) become the new baseline
+    new_baseline = {size: stages for size, stages in all_results.items() if save_baseline or size not in baseline}
+    if new_baseline:
+        baseline.update(new_baseline)
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\n--- Baseline for {', '.join(new_baseline)} saved to '{BASELINE_FILE}' ---")
+
+    regressions = find_regressions({size: stages for size, stages in all_results.items()
+                                    if size not in new_baseline}, baseline)
+    if regressions:
+        print("\n!!! Performance regression against the baseline !!!")
+        for regression in regressions:
+            print(f"    - {regression}")
+        sys.exit(1)
+    print("\n--- No stage regressed against the baseline. ---")
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+# The Banking scripts are standalone modules; make them importable from here
+BANKING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Banking')
+sys.path[:0] = [BANKING_DIR, os.path.join(BANKING_DIR, 'ING')]
+
+import INGtoDB
+from RowPipeline import apply_bulk_write_pragmas, write_rows
+from SyntheticDataGenerator import generate_ing_payload
+
+# --- Configuration ---
+DEFAULT_TRANSACTIONS = 200000
+
+
+def flattened_transactions(transaction_total):
+    """Builds the raw ING transaction rows once, so every variant inserts exactly the same values."""
+    payload = generate_ing_payload(transaction_total)
+    flat = [INGtoDB.flatten_transaction(tx) for data in payload.values()
+            for container in data['transactions'] for tx in container['transactions']['booked']]
+    columns = sorted({key for tx in flat for key in tx})
+    return columns, [[tx.get(column) for column in columns] for tx in flat]
+
+
+def create_table(db_file, columns, bulk_pragmas):
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    conn = sqlite3.connect(db_file)
+    if bulk_pragmas:
+        apply_bulk_write_pragmas(conn)
+    column_sql = ', '.join(f'"{column}" TEXT' for column in columns)
+    conn.execute(f"CREATE TABLE transactions (transaction_pk INTEGER PRIMARY KEY AUTOINCREMENT, {column_sql}, "
+                 f"UNIQUE(transactionId))")
+    return conn
+
+
+def row_by_row(conn, insert_sql, rows):
+    """The original loaders: one cursor.execute() per row."""
+    cursor = conn.cursor()
+    for row in rows:
+        cursor.execute(insert_sql, row)
+
+
+def batched(conn, insert_sql, rows):
+    write_rows(conn.cursor(), insert_sql, rows)
+
+
+if __name__ == "__main__":
+    # Usage: python raw_loader_benchmark.py [transactions]
+    transaction_total = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_TRANSACTIONS
+    columns, rows = flattened_transactions(transaction_total)
+    insert_sql = (f"INSERT OR IGNORE INTO transactions ({', '.join(columns)}) "
+                  f"VALUES ({', '.join(['?'] * len(columns))})")
+
+    print(f"--- Raw loader insert benchmark on {len(rows):,} ING transactions ---")
+    baseline = None
+    with tempfile.TemporaryDirectory() as work_dir:
+        for label, writer, bulk_pragmas in (("execute per row (legacy)", row_by_row, False),
+                                            ("executemany batches", batched, False),
+                                            ("executemany + bulk pragmas", batched, True)):
+            conn = create_table(os.path.join(work_dir, 'raw.db'), columns, bulk_pragmas)
+            start = time.perf_counter()
+            writer(conn, insert_sql, rows)
+            conn.commit()
+            elapsed = time.perf_counter() - start
+            conn.close()
+            rate = len(rows) / elapsed
+            baseline = baseline or rate
+            print(f"    -> {label:<30} {elapsed:7.2f}s  {rate:>12,.0f} rows/sec  ({rate / baseline:.2f}x)")
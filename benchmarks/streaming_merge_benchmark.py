@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# The Banking scripts are standalone modules; make them importable from here
+BANKING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Banking')
+sys.path[:0] = [BANKING_DIR, os.path.join(BANKING_DIR, 'ING'), os.path.join(BANKING_DIR, 'ABN')]
+
+import ABNtoDB
+import DBMerger
+import INGtoDB
+from SyntheticDataGenerator import generate_abn_payload, generate_ing_payload
+
+# --- Configuration ---
+DEFAULT_TRANSACTIONS = 100000
+
+
+def legacy_merge_source(source_conn, merged_cursor, bank):
+    """The original DBMerger loop: fetchall() the whole source table, then insert row by row."""
+    source_conn.row_factory = sqlite3.Row
+    source_cursor = source_conn.cursor()
+    for (step_bank, table), (mapper, insert_sql) in DBMerger.MERGE_STEPS.items():
+        if step_bank != bank:
+            continue
+        source_cursor.execute(f"SELECT * FROM {table}")
+        for row in source_cursor.fetchall():
+            merged_cursor.execute(insert_sql, mapper(dict(row)))
+
+
+def measure(label, func):
+    """Runs one stage and prints its wall time and the peak Python memory allocated while it ran."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"    -> {label:<28} {elapsed:7.2f}s  peak {peak / 2 ** 20:8.1f} MiB")
+
+
+def load(module, db_file, payload):
+    """Runs a bank loader's discover / setup / save steps against `db_file`."""
+    columns = module.discover_schema(payload)
+    conn, cursor = module.setup_database(db_file, *columns)
+    module.save_data_to_db(conn, cursor, payload, *columns)
+    conn.close()
+
+
+def merge(work_dir, merge_source):
+    """Merges both bank databases into a fresh unified database with the given per-bank merge function."""
+    merged_conn, merged_cursor = DBMerger.create_unified_database(os.path.join(work_dir, 'merged.db'))
+    for bank, db_file in (('ING', 'ing.db'), ('ABN_AMRO', 'abn.db')):
+        with sqlite3.connect(os.path.join(work_dir, db_file)) as source_conn:
+            merge_source(source_conn, merged_cursor, bank)
+    merged_conn.commit()
+    merged_conn.close()
+
+
+if __name__ == "__main__":
+    # Usage: python streaming_merge_benchmark.py [transactions per bank]
+    transaction_total = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_TRANSACTIONS
+    ing_payload = generate_ing_payload(transaction_total)
+    abn_payload = generate_abn_payload(transaction_total)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"--- Streaming pipeline benchmark on {transaction_total:,} transactions per bank ---")
+        measure("load ING", lambda: load(INGtoDB, os.path.join(work_dir, 'ing.db'), ing_payload))
+        measure("load ABN AMRO", lambda: load(ABNtoDB, os.path.join(work_dir, 'abn.db'), abn_payload))
+        measure("merge (fetchall, legacy)", lambda: merge(work_dir, legacy_merge_source))
+        measure("merge (streaming)", lambda: merge(work_dir, DBMerger._merge_source))
@@ -14,12 +14,16 @@ def get_db_schema(db_path: str) -> str:
     try:
         with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+            cursor.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view');")
             tables = cursor.fetchall()
+            # Hide FTS5 shadow tables, exactly like the schema shown by app.py
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND sql LIKE 'CREATE VIRTUAL TABLE%fts5%';")
+            fts_tables = [row[0] for row in cursor.fetchall()]
             schema_str = ""
-            for table_name in tables:
-                table_name = table_name[0]
-                schema_str += f"Table '{table_name}':\n"
+            for table_name, object_type in tables:
+                if any(table_name.startswith(f"{fts_table}_") for fts_table in fts_tables):
+                    continue
+                schema_str += f"{object_type.capitalize()} '{table_name}':\n"
                 cursor.execute(f"PRAGMA table_info({table_name});")
                 columns = cursor.fetchall()
                 for column in columns:
@@ -0,0 +1,157 @@
+import re
+import os
+import sqlite3
+import difflib
+
+# --- Configuration ---
+# How many local repairs are attempted before the error is handed back to the AI.
+MAX_LOCAL_REPAIRS = 5
+# Minimum similarity for a fuzzy identifier match (0.0 - 1.0).
+FUZZY_MATCH_CUTOFF = 0.75
+
+# Cache of {db_path: (mtime, {table_name: [column, ...]})}
+_schema_cache = {}
+
+# Splits a query into quoted literals and plain SQL so repairs never touch string values.
+_STRING_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+
+# MySQL / PostgreSQL date idioms the model sometimes produces, rewritten to SQLite equivalents.
+_DATE_REWRITES = [
+    (re.compile(r"\bNOW\(\s*\)", re.IGNORECASE), "datetime('now')"),
+    (re.compile(r"\b(?:CURDATE|CURRENT_DATE)\(\s*\)", re.IGNORECASE), "date('now')"),
+    (re.compile(r"\bDATE_SUB\(\s*(.+?)\s*,\s*INTERVAL\s+'?(\d+)'?\s+(DAY|MONTH|YEAR)S?\s*\)", re.IGNORECASE),
+     lambda m: f"date({m.group(1)}, '-{m.group(2)} {m.group(3).lower()}s')"),
+    (re.compile(r"\bDATE_ADD\(\s*(.+?)\s*,\s*INTERVAL\s+'?(\d+)'?\s+(DAY|MONTH|YEAR)S?\s*\)", re.IGNORECASE),
+     lambda m: f"date({m.group(1)}, '+{m.group(2)} {m.group(3).lower()}s')"),
+    (re.compile(r"\b(date|datetime)\(([^()]*)\)\s*([-+])\s*INTERVAL\s+'?(\d+)'?\s+(DAY|MONTH|YEAR)S?\b",
+                re.IGNORECASE),
+     lambda m: f"{m.group(1)}({m.group(2)}, '{m.group(3)}{m.group(4)} {m.group(5).lower()}s')"),
+    (re.compile(r"\bEXTRACT\(\s*YEAR\s+FROM\s+([\w.]+)\s*\)", re.IGNORECASE), r"strftime('%Y', \1)"),
+    (re.compile(r"\bEXTRACT\(\s*MONTH\s+FROM\s+([\w.]+)\s*\)", re.IGNORECASE), r"strftime('%m', \1)"),
+    (re.compile(r"\bYEAR\(\s*([\w.]+)\s*\)", re.IGNORECASE), r"strftime('%Y', \1)"),
+    (re.compile(r"\bMONTH\(\s*([\w.]+)\s*\)", re.IGNORECASE), r"strftime('%m', \1)"),
+]
+
+
+def get_schema_map(db_path):
+    """
+    Returns the database schema as {table_name: [column_name, ...]}.
+    The result is cached and only re-read when the database file changes on disk.
+    """
+    mtime = os.path.getmtime(db_path) if os.path.exists(db_path) else None
+    cached = _schema_cache.get(db_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    schema = {}
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view');")
+        for (table_name,) in cursor.fetchall():
+            cursor.execute(f"PRAGMA table_info('{table_name}');")
+            schema[table_name] = [column[1] for column in cursor.fetchall()]
+
+    _schema_cache[db_path] = (mtime, schema)
+    return schema
+
+
+def _map_outside_literals(sql_query, transform):
+    """
+    Applies `transform` to the query with every quoted string literal masked out,
+    so repairs can span literals (e.g. date('now') - INTERVAL ...) without ever editing them.
+    """
+    literals = []
+
+    def mask(match):
+        literals.append(match.group(1))
+        return f"\x00{len(literals) - 1}\x00"
+
+    masked = transform(_STRING_LITERAL_RE.sub(mask, sql_query))
+    return re.sub(r"\x00(\d+)\x00", lambda m: literals[int(m.group(1))], masked)
+
+
+def _replace_identifier(sql_query, old, new):
+    """Replaces a whole-word identifier, leaving string literals untouched."""
+    pattern = re.compile(rf"(?<![\w.]){re.escape(old)}\b", re.IGNORECASE)
+    return _map_outside_literals(sql_query, lambda part: pattern.sub(lambda _: new, part))
+
+
+def _closest_match(name, candidates):
+    """Finds the closest real identifier for a misspelled one, ignoring case."""
+    lowered = {candidate.lower(): candidate for candidate in candidates}
+    if name.lower() in lowered:
+        return lowered[name.lower()]
+    if f"unified_{name.lower()}" in lowered:
+        return lowered[f"unified_{name.lower()}"]
+    matches = difflib.get_close_matches(name.lower(), list(lowered), n=1, cutoff=FUZZY_MATCH_CUTOFF)
+    return lowered[matches[0]] if matches else None
+
+
+def repair_date_functions(sql_query):
+    """Rewrites common non-SQLite date functions (NOW(), DATE_SUB, YEAR(), ...) into SQLite syntax."""
+    def rewrite(part):
+        for pattern, replacement in _DATE_REWRITES:
+            part = pattern.sub(replacement, part)
+        return part
+
+    return _map_outside_literals(sql_query, rewrite)
+
+
+def repair_query(sql_query, error_message, schema):
+    """
+    Attempts a single local fix for the error SQLite reported while preparing the query.
+    Returns the repaired query, or None if no safe fix is known.
+    """
+    table_error = re.search(r"no such table: ([\w.]+)", error_message)
+    if table_error:
+        bad_table = table_error.group(1).split('.')[-1]
+        real_table = _closest_match(bad_table, schema.keys())
+        if real_table and real_table != bad_table:
+            return _replace_identifier(sql_query, bad_table, real_table)
+        return None
+
+    column_error = re.search(r"no such column: ([\w.]+)", error_message)
+    if column_error:
+        qualified = column_error.group(1)
+        bad_column = qualified.split('.')[-1]
+        # Prefer columns from the tables the query actually mentions
+        referenced = [t for t in schema if re.search(rf"\b{re.escape(t)}\b", sql_query, re.IGNORECASE)]
+        candidates = {col for t in (referenced or schema) for col in schema[t]}
+        real_column = _closest_match(bad_column, candidates)
+        if real_column and real_column != bad_column:
+            fixed = qualified[:-len(bad_column)] + real_column
+            return _replace_identifier(sql_query, qualified, fixed)
+        return None
+
+    if "no such function" in error_message or "syntax error" in error_message:
+        repaired = repair_date_functions(sql_query)
+        return repaired if repaired != sql_query else None
+
+    return None
+
+
+def prepare_query(conn, sql_query, schema):
+    """
+    Validates a query locally by preparing it with EXPLAIN, which compiles the statement
+    against the real schema without running it. Known mistakes (misspelled columns, a missing
+    'unified_' prefix, MySQL-style date functions) are repaired in place.
+
+    Returns:
+        str: The query that prepared successfully (possibly repaired).
+
+    Raises:
+        sqlite3.Error: The last preparation error, if the query could not be repaired locally.
+    """
+    for _ in range(MAX_LOCAL_REPAIRS + 1):
+        try:
+            conn.execute(f"EXPLAIN {sql_query}")
+            return sql_query
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            repaired = repair_query(sql_query, str(e), schema)
+            if not repaired or repaired == sql_query:
+                if isinstance(e, sqlite3.Error):
+                    raise
+                raise sqlite3.ProgrammingError(str(e)) from e
+            print(f"    -> Auto-repaired SQL after error '{e}'")
+            sql_query = repaired
+    raise sqlite3.OperationalError("Query could not be repaired within the local repair limit.")
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The Banking scripts are standalone modules; make them importable from the tests
+BANKING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Banking')
+sys.path[:0] = [BANKING_DIR, os.path.join(BANKING_DIR, 'ING'), os.path.join(BANKING_DIR, 'ABN')]
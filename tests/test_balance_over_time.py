@@ -0,0 +1,38 @@
+import pytest
+
+import DBMerger
+from BalanceCompactor import balance_over_time, total_balance_per_period
+
+
+def merged_balances(tmp_path, snapshots):
+    conn, cursor = DBMerger.create_unified_database(str(tmp_path / 'merged.db'))
+    cursor.executemany("INSERT INTO unified_balances (account_id_fk, source_bank, amount, timestamp) "
+                       "VALUES (?, 'TEST', ?, ?)", snapshots)
+    conn.commit()
+    return conn
+
+
+def test_closing_balance_per_month(tmp_path):
+    conn = merged_balances(tmp_path, [
+        ('A', 100.0, '2024-01-05 10:00:00'), ('A', 120.0, '2024-01-20 10:00:00'), ('A', 90.0, '2024-02-03 10:00:00'),
+        ('B', 50.0, '2024-01-10 10:00:00'),
+    ])
+    rows = balance_over_time(conn, granularity='month')
+    assert [(row['account_id'], row['period'], row['balance']) for row in rows] == [
+        ('A', '2024-01', 120.0), ('B', '2024-01', 50.0), ('A', '2024-02', 90.0)]
+    assert [row['period'] for row in balance_over_time(conn, account_id='A', date_from='2024-02-01')] == ['2024-02-03']
+    conn.close()
+
+
+def test_total_carries_forward_quiet_accounts():
+    rows = [{'account_id': 'A', 'period': '2024-01', 'balance': 120.0},
+            {'account_id': 'B', 'period': '2024-01', 'balance': 50.0},
+            {'account_id': 'A', 'period': '2024-02', 'balance': 90.0}]
+    assert total_balance_per_period(rows) == (['2024-01', '2024-02'], [170.0, 140.0])
+
+
+def test_unknown_granularity_is_rejected(tmp_path):
+    conn = merged_balances(tmp_path, [])
+    with pytest.raises(ValueError):
+        balance_over_time(conn, granularity='hour')
+    conn.close()
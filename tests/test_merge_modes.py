@@ -0,0 +1,130 @@
+import sqlite3
+import pytest
+
+import DBMerger
+import INGtoDB
+import ABNtoDB
+
+MERGE_MODES = ['row', 'bulk', 'parallel', 'incremental']
+
+ING_IBAN, ABN_IBAN = 'NL10INGB0001234567', 'NL20ABNA0007654321'
+
+
+def ing_booked(transaction_id, booking_date, amount, **fields):
+    return {"transactionId": transaction_id, "bookingDate": booking_date,
+            "executionDateTime": f"{booking_date}T09:00:00.000Z",
+            "transactionAmount": {"amount": amount, "currency": "EUR"}, **fields}
+
+
+def abn_transaction(transaction_id, book_date, amount, balance, **fields):
+    return {"transactionId": transaction_id, "bookDate": book_date, "amount": amount,
+            "transactionTimestamp": f"{book_date}-08:00:00:000", "currency": "EUR",
+            "balanceAfterMutation": balance, **fields}
+
+
+ING_PAYLOAD = {
+    "accounts": [{"resourceId": "test-ing", "iban": ING_IBAN, "name": "J. Doe", "currency": "EUR"}],
+    "transactions": [{"account": {"iban": ING_IBAN}, "transactions": {"pending": [], "booked": [
+        # One leg of a transfer to the user's own ABN AMRO account
+        ing_booked("ING-1", "2024-03-01", "-250.00", creditorName="J. Doe", creditorAccount={"iban": ABN_IBAN},
+                   remittanceInformationUnstructured="Savings"),
+        # The merchant is named only by the creditor
+        ing_booked("ING-2", "2024-03-02", "-42.10", creditorName="Albert Heijn 1234",
+                   creditorAccount={"iban": "NL30RABO0001111111"}, remittanceInformationUnstructured="Pas 017"),
+        ing_booked("ING-3", "2024-03-25", "2500.00", debtorName="Acme BV", debtorAccount={"iban": "NL40RABO0002222222"},
+                   remittanceInformationUnstructured="Salary March"),
+    ]}}],
+}
+
+ABN_PAYLOAD = {
+    "account": {"accountNumber": ABN_IBAN, "currency": "EUR"},
+    "transactions": [
+        # The other leg of the transfer, booked a few days later
+        abn_transaction("ABN-1", "2024-03-04", 250.0, 250.0, counterPartyName="J. Doe",
+                        counterPartyAccountNumber=ING_IBAN, descriptionLines=["Savings"]),
+        abn_transaction("ABN-2", "2024-03-05", -12.99, 237.01, counterPartyName="Netflix International",
+                        descriptionLines=["Subscription"]),
+    ],
+}
+
+
+def load(loader, db_file, iban, payload):
+    conn, cursor = loader.setup_database(str(db_file), [], [])
+    loader.stream_data_to_db(conn, cursor, loader.payload_to_records(iban, payload))
+    conn.close()
+
+
+@pytest.fixture
+def source_db_files(tmp_path):
+    files = {'ING': str(tmp_path / 'ing.db'), 'ABN_AMRO': str(tmp_path / 'abn.db')}
+    load(INGtoDB, files['ING'], ING_IBAN, ING_PAYLOAD)
+    load(ABNtoDB, files['ABN_AMRO'], ABN_IBAN, ABN_PAYLOAD)
+    return files
+
+
+def unified_transactions(merged_db):
+    """The merged transactions, with the matched leg named by its transaction_id, as pks depend on the mode."""
+    with sqlite3.connect(merged_db) as conn:
+        return conn.execute('''
+        SELECT t.transaction_id, t.account_id_fk, t.source_bank, t.amount, t.currency, t.booking_date,
+               t.execution_timestamp, t.description, t.counterparty_name, t.counterparty_iban, t.type_code,
+               t.category, t.is_internal_transfer, m.transaction_id
+        FROM unified_transactions t
+        LEFT JOIN unified_transactions m ON m.transaction_pk = t.transfer_match_pk
+        ORDER BY t.source_bank, t.transaction_id
+        ''').fetchall()
+
+
+def merge(tmp_path, source_db_files, merge_mode):
+    merged_db = str(tmp_path / f'merged_{merge_mode}.db')
+    DBMerger.merge_databases(merged_db, source_db_files, merge_mode)
+    return merged_db
+
+
+@pytest.mark.parametrize('merge_mode', MERGE_MODES)
+def test_cross_bank_transfer_is_paired(tmp_path, source_db_files, merge_mode):
+    merged_db = merge(tmp_path, source_db_files, merge_mode)
+    with sqlite3.connect(merged_db) as conn:
+        pairs = dict(conn.execute('''
+        SELECT t.transaction_id, m.transaction_id
+        FROM unified_transactions t
+        JOIN unified_transactions m ON m.transaction_pk = t.transfer_match_pk
+        WHERE t.is_internal_transfer = 1 AND m.is_internal_transfer = 1
+        ''').fetchall())
+        flagged = conn.execute("SELECT COUNT(*) FROM unified_transactions WHERE is_internal_transfer = 1").fetchone()[0]
+    assert pairs == {'ING-1': 'ABN-1', 'ABN-1': 'ING-1'}
+    assert flagged == 2
+
+
+@pytest.mark.parametrize('merge_mode', MERGE_MODES)
+def test_ing_counterparty_name_is_categorized(tmp_path, source_db_files, merge_mode):
+    rows = {row[0]: row for row in unified_transactions(merge(tmp_path, source_db_files, merge_mode))}
+    # counterparty_name, counterparty_iban and category
+    assert (rows['ING-2'][8], rows['ING-2'][9], rows['ING-2'][11]) == \
+        ('Albert Heijn 1234', 'NL30RABO0001111111', 'Groceries')
+    assert rows['ING-3'][11] == 'Income'
+    assert rows['ABN-2'][11] == 'Subscriptions'
+
+
+def test_merge_modes_give_identical_transactions(tmp_path, source_db_files):
+    results = {mode: unified_transactions(merge(tmp_path, source_db_files, mode)) for mode in MERGE_MODES}
+    assert len(results['row']) == 5
+    for mode in MERGE_MODES[1:]:
+        assert results[mode] == results['row'], mode
+
+
+def test_incremental_merge_picks_up_new_rows_only(tmp_path, source_db_files):
+    merged_db = str(tmp_path / 'merged_incremental.db')
+    DBMerger.merge_databases(merged_db, source_db_files, 'incremental')
+
+    # A later sync adds one transaction on each bank; the next incremental merge reads only those
+    load(INGtoDB, source_db_files['ING'], ING_IBAN, {"accounts": ING_PAYLOAD["accounts"], "transactions": [
+        {"account": {"iban": ING_IBAN}, "transactions": {"pending": [], "booked": [
+            ing_booked("ING-4", "2024-04-01", "-9.99", creditorName="Spotify", remittanceInformationUnstructured="")]}}]})
+    load(ABNtoDB, source_db_files['ABN_AMRO'], ABN_IBAN, {"account": ABN_PAYLOAD["account"], "transactions": [
+        abn_transaction("ABN-3", "2024-04-02", -30.0, 207.01, counterPartyName="Jumbo", descriptionLines=["Pin"])]})
+    DBMerger.merge_databases(merged_db, source_db_files, 'incremental')
+
+    incremental = unified_transactions(merged_db)
+    assert incremental == unified_transactions(merge(tmp_path, source_db_files, 'row'))
+    assert len(incremental) == 7
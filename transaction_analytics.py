@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import numpy as np
+
+# --- Configuration ---
+DB_FILE = "merged_data1.db"
+
+# Cache of {db_path: (data_version, TransactionColumns)}
+_column_cache = {}
+
+
+class TransactionColumns:
+    """
+    Column-oriented, in-memory copy of unified_transactions.
+
+    Amounts are stored as int64 cents so sums are exact, booking dates as datetime64[D],
+    and account / counterparty as integer category codes into the matching label arrays.
+    """
+
+    def __init__(self, rows):
+        amounts, dates, accounts, counterparties = zip(*rows) if rows else ((), (), (), ())
+        self.amount_cents = np.rint(np.array(amounts, dtype=np.float64) * 100).astype(np.int64)
+        self.booking_date = np.array([d[:10] for d in dates], dtype='datetime64[D]')
+        self.account_labels, self.account_codes = np.unique(np.array(accounts, dtype=object).astype(str),
+                                                            return_inverse=True)
+        self.counterparty_labels, self.counterparty_codes = np.unique(
+            np.array(counterparties, dtype=object).astype(str), return_inverse=True)
+
+    def __len__(self):
+        return len(self.amount_cents)
+
+    def mask(self, date_from=None, date_to=None, account_id=None, spending_only=False):
+        """Builds a boolean row filter from the common aggregation parameters."""
+        selected = np.ones(len(self), dtype=bool)
+        if date_from:
+            selected &= self.booking_date >= np.datetime64(date_from[:10], 'D')
+        if date_to:
+            selected &= self.booking_date <= np.datetime64(date_to[:10], 'D')
+        if account_id:
+            matches = np.flatnonzero(self.account_labels == account_id)
+            selected &= np.isin(self.account_codes, matches)
+        if spending_only:
+            selected &= self.amount_cents < 0
+        return selected
+
+
+def _data_version(conn, db_path):
+    """Identifies the current state of the transaction data, so the cache is rebuilt only after a merge."""
+    max_pk, row_count = conn.execute(
+        "SELECT MAX(transaction_pk), COUNT(*) FROM unified_transactions").fetchone()
+    return os.path.getmtime(db_path), max_pk, row_count
+
+
+def load_transaction_columns(db_path=DB_FILE):
+    """
+    Returns the TransactionColumns for the database, reusing the cached copy
+    while the underlying data has not changed.
+    """
+    with sqlite3.connect(db_path) as conn:
+        version = _data_version(conn, db_path)
+        cached = _column_cache.get(db_path)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        rows = conn.execute('''
+            SELECT amount, booking_date, account_id_fk, COALESCE(counterparty_name, type_code, 'Unknown')
+            FROM unified_transactions
+            WHERE amount IS NOT NULL AND booking_date IS NOT NULL AND is_internal_transfer = 0
+        ''').fetchall()
+
+    columns = TransactionColumns(rows)
+    _column_cache[db_path] = (version, columns)
+    return columns
+
+
+def _to_euros(cents):
+    """Converts cent values (scalar or array) back to rounded euro floats for JSON output."""
+    return np.round(np.asarray(cents, dtype=np.float64) / 100, 2).tolist()
+
+
+# --- Aggregations ---
+# Every aggregation takes the loaded columns plus keyword parameters from the AI,
+# and returns a JSON-serialisable list of rows.
+
+def monthly_totals(cols, date_from=None, date_to=None, account_id=None, spending_only=True):
+    """Total amount per calendar month. Parameters: date_from, date_to, account_id, spending_only (default true)."""
+    selected = cols.mask(date_from, date_to, account_id, spending_only)
+    months = cols.booking_date[selected].astype('datetime64[M]')
+    labels, codes = np.unique(months, return_inverse=True)
+    sums = np.bincount(codes, weights=cols.amount_cents[selected], minlength=len(labels))
+    counts = np.bincount(codes, minlength=len(labels))
+    return [{"month": str(m), "total": t, "transaction_count": int(c)}
+            for m, t, c in zip(labels, _to_euros(sums), counts)]
+
+
+def month_over_month_change(cols, date_from=None, date_to=None, account_id=None, spending_only=True):
+    """Monthly totals with the absolute and percentage change versus the previous month. Same parameters as monthly_totals."""
+    rows = monthly_totals(cols, date_from, date_to, account_id, spending_only)
+    totals = np.array([row["total"] for row in rows], dtype=np.float64)
+    deltas = np.diff(totals, prepend=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = deltas / np.abs(np.roll(totals, 1)) * 100
+    for i, row in enumerate(rows):
+        row["change"] = None if i == 0 else round(float(deltas[i]), 2)
+        row["change_percent"] = None if i == 0 or not np.isfinite(percent[i]) else round(float(percent[i]), 1)
+    return rows
+
+
+def rolling_average(cols, window_days=30, date_from=None, date_to=None, account_id=None, spending_only=True):
+    """Rolling average of daily totals over `window_days` (default 30). Also accepts date_from, date_to, account_id, spending_only."""
+    window_days = max(int(window_days), 1)
+    selected = cols.mask(date_from, date_to, account_id, spending_only)
+    dates = cols.booking_date[selected]
+    if not len(dates):
+        return []
+    first_day = dates.min()
+    day_index = (dates - first_day).astype(np.int64)
+    daily = np.bincount(day_index, weights=cols.amount_cents[selected])
+    running = np.cumsum(np.concatenate(([0.0], daily)))
+    window_sums = running[1:] - running[np.maximum(np.arange(1, len(running)) - window_days, 0)]
+    window_lengths = np.minimum(np.arange(1, len(daily) + 1), window_days)
+    averages = window_sums / window_lengths
+    days = first_day + np.arange(len(daily))
+    return [{"date": str(d), "daily_total": t, "rolling_average": a}
+            for d, t, a in zip(days, _to_euros(daily), _to_euros(averages))]
+
+
+def spending_percentiles(cols, percentiles=(50, 75, 90, 95, 99), date_from=None, date_to=None, account_id=None):
+    """Percentiles of individual expense sizes (positive euros). Parameters: percentiles (list), date_from, date_to, account_id."""
+    selected = cols.mask(date_from, date_to, account_id, spending_only=True)
+    expenses = -cols.amount_cents[selected]
+    if not len(expenses):
+        return []
+    values = np.percentile(expenses, list(percentiles))
+    return [{"percentile": p, "amount": v} for p, v in zip(percentiles, _to_euros(values))]
+
+
+def counterparty_distribution(cols, top_n=10, date_from=None, date_to=None, account_id=None, spending_only=True):
+    """Per-counterparty total, count, mean and median, largest totals first. Parameters: top_n (default 10), date_from, date_to, account_id, spending_only."""
+    selected = cols.mask(date_from, date_to, account_id, spending_only)
+    codes = cols.counterparty_codes[selected]
+    amounts = cols.amount_cents[selected]
+    if not len(codes):
+        return []
+    # Sort once by counterparty so each group is a contiguous slice
+    order = np.lexsort((amounts, codes))
+    codes, amounts = codes[order], amounts[order]
+    group_starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    sums = np.add.reduceat(amounts, group_starts)
+    counts = np.diff(np.append(group_starts, len(codes)))
+    medians = np.array([np.median(chunk) for chunk in np.split(amounts, group_starts[1:])])
+    ranked = np.argsort(-np.abs(sums))[:max(int(top_n), 1)]
+    return [{
+        "counterparty": str(cols.counterparty_labels[codes[group_starts[i]]]),
+        "total": _to_euros(sums[i]),
+        "transaction_count": int(counts[i]),
+        "average": _to_euros(sums[i] / counts[i]),
+        "median": _to_euros(medians[i]),
+    } for i in ranked]
+
+
+AGGREGATIONS = {
+    "monthly_totals": monthly_totals,
+    "month_over_month_change": month_over_month_change,
+    "rolling_average": rolling_average,
+    "spending_percentiles": spending_percentiles,
+    "counterparty_distribution": counterparty_distribution,
+}
+
+
+def describe_aggregations():
+    """Returns a one-line-per-aggregation description for the AI system prompt."""
+    return "\n".join(f"  - {name}: {func.__doc__}" for name, func in AGGREGATIONS.items())
+
+
+def run_aggregation(name, params=None, db_path=DB_FILE):
+    """
+    Runs a named aggregation over the cached transaction columns.
+
+    Raises:
+        ValueError: If the aggregation name or its parameters are not valid.
+    """
+    if name not in AGGREGATIONS:
+        raise ValueError(f"Unknown analytics function '{name}'. Available: {', '.join(AGGREGATIONS)}")
+    try:
+        return AGGREGATIONS[name](load_transaction_columns(db_path), **(params or {}))
+    except TypeError as e:
+        raise ValueError(f"Invalid parameters for '{name}': {e}")